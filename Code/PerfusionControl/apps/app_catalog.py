@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Application for updating and searching the catalog of all saved data files
+
+Usage: app_catalog.py [--date yyyy-mm-dd] [--sensor S] [--output-type T] [--kind K]
+                      [--from yyyy-mm-dd] [--to yyyy-mm-dd] [--min-hours H] [--no-update]
+
+e.g. all raw Hepatic Artery Flow files from April 2023 longer than 6 hours:
+    app_catalog.py --sensor "Hepatic Artery Flow" --output-type Raw --date "2023-04-%" --min-hours 6
+
+The catalog is updated first (only new or changed files are read) unless --no-update is used
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.utils as utils
+from pyPerfusion.Catalog import Catalog
+
+
+def format_entry(entry):
+    start = datetime.fromtimestamp(entry.start_ms / 1_000).strftime('%Y-%m-%d %H:%M:%S') \
+        if entry.start_ms is not None else '-'
+    return f'{entry.path}: {entry.sensor}, {entry.strategy} ({entry.kind}, {entry.data_type}) ' \
+           f'start {start}, {entry.duration_ms / 3_600_000:.2f} h, {entry.samples} samples, {entry.size_bytes} bytes'
+
+
+def get_epoch_ms(date_str):
+    return None if date_str is None else datetime.strptime(date_str, '%Y-%m-%d').timestamp() * 1_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update and search the catalog of all data files')
+    parser.add_argument('--date', help='date folder (yyyy-mm-dd, SQL LIKE pattern, e.g. "2023-04-%%")')
+    parser.add_argument('--sensor', help='sensor name (SQL LIKE pattern)')
+    parser.add_argument('--output-type', help='strategy name (SQL LIKE pattern)')
+    parser.add_argument('--kind', choices=['stream', 'compressed', 'points'])
+    parser.add_argument('--from', dest='from_date', help='only files with data on or after this date (yyyy-mm-dd)')
+    parser.add_argument('--to', dest='to_date', help='only files with data before this date (yyyy-mm-dd)')
+    parser.add_argument('--min-hours', type=float, help='only files covering at least this many hours')
+    parser.add_argument('--no-update', action='store_true', help='search without updating the catalog')
+    args = parser.parse_args()
+
+    with Catalog() as catalog:
+        if not args.no_update:
+            start = time.perf_counter()
+            updated = catalog.update()
+            print(f'updated {updated} files in {time.perf_counter() - start:.1f} s')
+        min_duration_ms = None if args.min_hours is None else args.min_hours * 3_600_000
+        entries = catalog.find(sensor=args.sensor, strategy=args.output_type, date_str=args.date, kind=args.kind,
+                               start_ms=get_epoch_ms(args.from_date), end_ms=get_epoch_ms(args.to_date),
+                               min_duration_ms=min_duration_ms)
+    for entry in entries:
+        print(format_entry(entry))
+    print(f'{len(entries)} files found')
+
+
+if __name__ == "__main__":
+    PerfusionConfig.set_test_config()
+    utils.setup_default_logging('app_catalog', logging.DEBUG)
+
+    main()
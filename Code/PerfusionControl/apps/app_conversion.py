@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 """ Application for reading all saved files from folder and
-    converting to CSV formats for analysis
+    converting to CSV or columnar (npz) formats for analysis
 
+Usage: app_conversion.py yyyy-mm-dd [--workers N] [--force] [--format csv|npz] [--sensor S] [--output-type T]
+
+Files are independent, so they are converted in parallel using a pool of processes.
+Files whose output is newer than the .dat/.txt files are skipped unless --force is used
+The files are selected from the catalog (see pyPerfusion.Catalog), which is updated for the folder first.
+Files the catalog cannot describe are converted from a scan of the folder, or listed if --sensor/--output-type is used
 
 @project: LiverPerfusion NIH
 @author: John Kakareka, NIH
@@ -9,29 +15,110 @@
 This work was created by an employee of the US Federal Gov
 and under the public domain.
 """
+import argparse
 import logging
 import os
 import pathlib
-import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import pyPerfusion.Strategy_ReadWrite as ReadWrite
 import pyPerfusion.PerfusionConfig as PerfusionConfig
 import pyPerfusion.utils as utils
+from pyPerfusion.Catalog import Catalog
+
+
+OUTPUT_SUFFIX = {'csv': '.csv', 'npz': '.npz'}
+
+
+def is_up_to_date(fqpn: pathlib.Path, output_format: str = 'csv'):
+    out_fqpn = fqpn.with_suffix(OUTPUT_SUFFIX[output_format])
+    if not out_fqpn.exists():
+        return False
+    out_stat = out_fqpn.stat()
+    dat_stat = fqpn.stat()
+    newest_mtime = dat_stat.st_mtime
+    if fqpn.with_suffix('.txt').exists():
+        newest_mtime = max(newest_mtime, fqpn.with_suffix('.txt').stat().st_mtime)
+    # an empty output from a non-empty file means a previous conversion failed part way
+    has_data = out_stat.st_size > 0 or dat_stat.st_size == 0
+    return out_stat.st_mtime >= newest_mtime and has_data
+
+
+def convert_file(fqpn: pathlib.Path, output_format: str = 'csv'):
+    start = time.perf_counter()
+    if output_format == 'npz':
+        ReadWrite.save_to_columnar(fqpn)
+    else:
+        ReadWrite.save_to_csv(fqpn)
+    return time.perf_counter() - start
+
+
+def convert_folder(base_folder: pathlib.Path, workers: int = None, force: bool = False, output_format: str = 'csv',
+                   sensor: str = None, output_type: str = None):
+    with Catalog() as catalog:
+        catalog.update(base_folder.name)
+        all_files = [catalog.get_fqpn(entry) for entry in
+                     catalog.find(sensor=sensor, strategy=output_type, date_str=base_folder.name)]
+        described = {catalog.get_fqpn(entry) for entry in catalog.find(date_str=base_folder.name)
+                     if entry.sensor is not None}
+
+    # files the catalog could not describe (e.g. a missing or unreadable header) are found by
+    # scanning the folder, as they cannot be matched to a sensor or output type
+    undescribed = sorted(pathlib.Path(file.path) for file in os.scandir(base_folder)
+                         if os.path.splitext(file.name)[-1].lower() == '.dat' and
+                         pathlib.Path(file.path) not in described)
+    if undescribed and sensor is None and output_type is None:
+        print(f'{len(undescribed)} files are not described by the catalog, converting them from the folder')
+        all_files += [fqpn for fqpn in undescribed if fqpn not in all_files]
+    elif undescribed:
+        print(f'skipping {len(undescribed)} files which are not described by the catalog: '
+              f'{", ".join(fqpn.name for fqpn in undescribed)}')
+    files = [fqpn for fqpn in all_files if force or not is_up_to_date(fqpn, output_format)]
+    skipped = len(all_files) - len(files)
+    if skipped > 0:
+        print(f'skipping {skipped} files which are already converted')
+
+    total = len(files)
+    if workers == 1:
+        for idx, fqpn in enumerate(files):
+            elapsed = convert_file(fqpn, output_format)
+            print(f'[{idx + 1}/{total}] converted {fqpn.name} in {elapsed:.1f} s')
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_file, fqpn, output_format): fqpn for fqpn in files}
+        for idx, future in enumerate(as_completed(futures)):
+            fqpn = futures[future]
+            try:
+                elapsed = future.result()
+                print(f'[{idx + 1}/{total}] converted {fqpn.name} in {elapsed:.1f} s')
+            except Exception as e:
+                print(f'[{idx + 1}/{total}] failed to convert {fqpn.name}: {e}')
 
 
 def main():
-    date_str = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Convert all data files in a date folder to CSV or npz')
+    parser.add_argument('date_str', help='date folder to convert (yyyy-mm-dd)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of files to convert in parallel')
+    parser.add_argument('--force', action='store_true', help='convert files even if the output is up-to-date')
+    parser.add_argument('--format', choices=list(OUTPUT_SUFFIX.keys()), default='csv',
+                        help='csv or columnar npz with per-chunk statistics')
+    parser.add_argument('--sensor', help='only convert files from this sensor (SQL LIKE pattern, e.g. "HA%%")')
+    parser.add_argument('--output-type', help='only convert files from this strategy (SQL LIKE pattern)')
+    args = parser.parse_args()
+
     base_folder = PerfusionConfig.ACTIVE_CONFIG.basepath / \
-                  PerfusionConfig.ACTIVE_CONFIG.get_data_folder(date_str)
+                  PerfusionConfig.ACTIVE_CONFIG.get_data_folder(args.date_str)
 
     if not os.path.isdir(base_folder):
         print(f'Could not find folder {base_folder}')
     else:
-        for file in os.scandir(base_folder):
-            ext = os.path.splitext(file.name)[-1].lower()
-            if ext == '.dat':
-                print(f'converting {file.name}')
-                ReadWrite.save_to_csv(pathlib.Path(file.path))
+        start = time.perf_counter()
+        convert_folder(base_folder, workers=args.workers, force=args.force, output_format=args.format,
+                       sensor=args.sensor, output_type=args.output_type)
+        print(f'finished in {time.perf_counter() - start:.1f} s')
 
 
 if __name__ == "__main__":
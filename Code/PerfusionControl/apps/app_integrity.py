@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+""" Application for checking the integrity of all saved files in a date folder
+    and optionally repairing them in place
+
+Usage: app_integrity.py yyyy-mm-dd [--workers N] [--repair] [--gap-factor 1.5]
+
+Each .dat file is checked for
+    - a missing .txt header or a header with a 1970-01-01 start of acquisition
+    - a partial trailing sample/chunk (and compressed chunks missing from the chunk table)
+    - index entries which point past the end of the data or are not in increasing order
+    - timestamps which go backwards
+    - runs of NaN
+    - gaps in time (dropped samples/chunks)
+
+With --repair, partial trailing data is truncated, index and chunk table entries past the
+end of the data are removed, and missing or 1970 headers are (re)written. Start times which
+cannot be read from the data are estimated from the modification time of the file.
+Files are independent, so they are checked in parallel using a pool of processes.
+A summary is written to integrity_report.txt in the folder
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import argparse
+import logging
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+import numpy as np
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.utils as utils
+
+
+REPORT_FILENAME = 'integrity_report.txt'
+# number of samples/chunks checked at a time, keeps memory bounded for very large files
+BLOCK_LEN = 1_000_000
+
+
+@dataclass
+class FileReport:
+    name: str
+    kind: str = 'stream'
+    records: int = 0
+    issues: List[str] = field(default_factory=list)
+    repairs: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return len(self.issues) == 0
+
+    def __str__(self):
+        lines = [f'{self.name} ({self.kind}, {self.records} records): {"OK" if self.ok else "ISSUES"}']
+        lines.extend(f'    issue: {issue}' for issue in self.issues)
+        lines.extend(f'    repaired: {repair}' for repair in self.repairs)
+        return '\n'.join(lines)
+
+
+def read_header(fqpn: pathlib.Path):
+    settings = {}
+    with open(fqpn.with_suffix('.txt')) as reader:
+        for line in reader:
+            key, sep, value = line.strip().partition(': ')
+            if sep:
+                settings[key] = value
+    return settings
+
+
+def write_header(fqpn: pathlib.Path, settings: dict, acq_start_ms: float):
+    # same layout as WriterStream._print_stream_info, including the UTC start of acquisition
+    timestamp = datetime.utcfromtimestamp(acq_start_ms / 1_000)
+    with open(fqpn.with_suffix('.txt'), 'wt') as fid:
+        fid.write(''.join(f'{k}: {v}\n' for k, v in settings.items() if k != 'Start of Acquisition'))
+        fid.write(f'Start of Acquisition: {timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")}')
+
+
+def infer_output_type(fqpn: pathlib.Path):
+    # files are named {sensor}_{strategy}, but sensor and strategy names can both contain '_'
+    # so prefer the longest strategy configured in strategies.ini that matches the end of the name
+    stem = fqpn.stem
+    matches = [name for name in PerfusionConfig.get_section_names('strategies') if stem.endswith(f'_{name}')]
+    if matches:
+        output_type = max(matches, key=len)
+        return stem[:-len(output_type) - 1], output_type
+    sensor_name, _, output_type = stem.rpartition('_')
+    return sensor_name, output_type
+
+
+def get_kind(fqpn: pathlib.Path):
+    # same rules as ReadWrite.read_file
+    if 'points' in str(fqpn).lower():
+        return 'points'
+    elif ReadWrite.is_compressed(fqpn):
+        return 'compressed'
+    return 'stream'
+
+
+def truncate(fqpn: pathlib.Path, size: int):
+    with open(fqpn, 'r+b') as fid:
+        fid.truncate(size)
+
+
+def iter_column_blocks(column):
+    for start in range(0, len(column), BLOCK_LEN):
+        yield column[start:start + BLOCK_LEN]
+
+
+def count_nan_runs(blocks):
+    # blocks of booleans (True for NaN), runs are carried across block boundaries
+    total = 0
+    longest = 0
+    current = 0
+    for is_nan in blocks:
+        if len(is_nan) == 0:
+            continue
+        nans = int(np.count_nonzero(is_nan))
+        total += nans
+        if nans == 0:
+            current = 0
+            continue
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], is_nan.astype(np.int8), [0]))))
+        starts, ends = edges[::2], edges[1::2]
+        lengths = ends - starts
+        if starts[0] == 0:
+            lengths[0] += current
+        longest = max(longest, int(lengths.max()))
+        current = int(lengths[-1]) if ends[-1] == len(is_nan) else 0
+    return total, longest
+
+
+def check_nans(report: FileReport, blocks):
+    total, longest = count_nan_runs(blocks)
+    if total > 0:
+        report.issues.append(f'{total} NaN samples, longest run is {longest}')
+
+
+def check_times(report: FileReport, times, label: str):
+    # times are checked a block at a time, keeping the last time of the previous block
+    backwards = 0
+    prev = None
+    for block in iter_column_blocks(times):
+        block = block.astype(np.int64)
+        if prev is not None:
+            block = np.concatenate(([prev], block))
+        backwards += int(np.count_nonzero(np.diff(block) < 0))
+        prev = block[-1]
+    if backwards > 0:
+        report.issues.append(f'{backwards} {label} go backwards in time')
+
+
+def check_index(report: FileReport, fqpn: pathlib.Path, data_bytes: int, period_ms: float, itemsize: int,
+                gap_factor: float, repair: bool):
+    # returns the valid index entries
+    index_fqpn = fqpn.with_suffix('.idx')
+    if not index_fqpn.exists():
+        return None
+    size = os.path.getsize(index_fqpn)
+    entry_size = ReadWrite.INDEX_DTYPE.itemsize
+    if size % entry_size:
+        report.issues.append(f'index has a partial trailing entry ({size % entry_size} bytes)')
+    index = np.fromfile(index_fqpn, dtype=ReadWrite.INDEX_DTYPE, count=size // entry_size)
+
+    # entries are written after their data, so an entry past the end of the data has no samples
+    offsets = index['offset'].astype(np.int64)
+    past_end = offsets >= data_bytes
+    valid = int(np.argmax(past_end)) if np.any(past_end) else len(index)
+    if np.any(np.diff(offsets) < 0):
+        report.issues.append('index offsets are not in increasing order')
+    if valid < len(index):
+        report.issues.append(f'{len(index) - valid} index entries are past the end of the data')
+    check_times(report, index['time'], 'index entries')
+
+    if repair and (valid < len(index) or size % entry_size):
+        truncate(index_fqpn, valid * entry_size)
+        report.repairs.append(f'truncated index to {valid} entries')
+    index = index[:valid]
+
+    # the writer indexes both sides of a gap, so a gap is an entry further from the
+    # previous entry in time than the samples between them account for
+    if period_ms and len(index) > 1:
+        dt = np.diff(index['time'].astype(np.int64))
+        ds = np.diff(index['offset'].astype(np.int64)) // itemsize
+        expected = np.maximum(ds, 1) * period_ms
+        gaps = dt > gap_factor * expected
+        if np.any(gaps):
+            missing_s = float(np.sum(dt[gaps] - ds[gaps] * period_ms)) / 1_000
+            report.issues.append(f'{int(np.count_nonzero(gaps))} time gaps, {missing_s:.1f} s of missing samples')
+    return index
+
+
+def infer_points_layout(fqpn: pathlib.Path, data_dtype: np.dtype, bytes_per_timestamp: int = 8, max_samples: int = 64):
+    # without a header, the samples per timestamp is the smallest layout where the
+    # timestamps are plausible epoch ms and increase from chunk to chunk
+    size = os.path.getsize(fqpn)
+    now_ms = utils.get_epoch_ms()
+    for samples in range(1, max_samples + 1):
+        chunk_size = bytes_per_timestamp + samples * data_dtype.itemsize
+        if size < 2 * chunk_size:
+            break
+        dtype = np.dtype([('time', f'>u{bytes_per_timestamp}'), ('data', data_dtype, (samples,))])
+        times = np.fromfile(fqpn, dtype=dtype, count=min(size // chunk_size, 100))['time'].astype(np.int64)
+        if np.all((times > 0) & (times <= now_ms)) and np.all(np.diff(times) >= 0):
+            return samples
+    return None
+
+
+def estimate_stream_start(fqpn: pathlib.Path, samples: int, period_ms: float, index, itemsize: int = 8):
+    # the last sample was written close to the modification time of the file, count back from there
+    last_ms = samples * period_ms
+    if index is not None and len(index) > 0:
+        last = index[-1]
+        last_ms = int(last['time']) + (samples - 1 - int(last['offset']) // itemsize) * period_ms
+    return os.path.getmtime(fqpn) * 1_000 - last_ms
+
+
+def repair_header(report: FileReport, fqpn: pathlib.Path, repair: bool):
+    # returns the header settings, rebuilding them from strategies.ini and the data if missing
+    if fqpn.with_suffix('.txt').exists():
+        return read_header(fqpn)
+
+    report.issues.append('missing .txt header')
+    sensor_name, output_type = infer_output_type(fqpn)
+    strategy = PerfusionConfig.read_section('strategies', output_type)
+    data_dtype = np.dtype('float64')
+    settings = {'Sensor Name': sensor_name, 'Output Type': output_type, 'Data Type': str(data_dtype)}
+
+    if 'points' in str(fqpn).lower():
+        bytes_per_timestamp = int(strategy.get('bytes_per_timestamp', 8))
+        samples = strategy.get('samples_per_timestamp', None)
+        samples = int(samples) if samples else infer_points_layout(fqpn, data_dtype, bytes_per_timestamp)
+        if samples is None:
+            report.issues.append('could not determine the layout of the points file')
+            return None
+        settings['samples_per_timestamp'] = samples
+        settings['bytes_per_timestamp'] = bytes_per_timestamp
+        dtype = np.dtype([('time', f'>u{bytes_per_timestamp}'), ('data', data_dtype, (samples,))])
+        first = np.fromfile(fqpn, dtype=dtype, count=1)
+        acq_start_ms = int(first['time'][0]) if len(first) else os.path.getmtime(fqpn) * 1_000
+    elif fqpn.with_suffix('.ctbl').exists():
+        # the codec cannot be recovered from the data, leave compressed files for manual repair
+        report.issues.append('compressed file without a header cannot be repaired')
+        return None
+    else:
+        # the sampling period is given by the spacing of the index entries if there is an index
+        period_ms = 0
+        index_fqpn = fqpn.with_suffix('.idx')
+        index = None
+        if index_fqpn.exists():
+            index = np.fromfile(index_fqpn, dtype=ReadWrite.INDEX_DTYPE)
+            dt = np.diff(index['time'].astype(np.int64))
+            ds = np.diff(index['offset'].astype(np.int64)) // data_dtype.itemsize
+            if np.any(ds > 0):
+                period_ms = int(round(float(np.median(dt[ds > 0] / ds[ds > 0]))))
+        settings['Sampling Period (ms)'] = period_ms
+        acq_start_ms = estimate_stream_start(fqpn, os.path.getsize(fqpn) // data_dtype.itemsize,
+                                             period_ms or 100, index, data_dtype.itemsize)
+        report.issues.append('start of acquisition is estimated from the file modification time')
+
+    if repair:
+        write_header(fqpn, settings, acq_start_ms)
+        report.repairs.append(f'wrote header for {output_type} of {sensor_name}')
+        return read_header(fqpn)
+    return None
+
+
+def check_start(report: FileReport, fqpn: pathlib.Path, settings: dict, first_time, samples: int,
+                period_ms: float, index, repair: bool, itemsize: int = 8):
+    if not settings.get('Start of Acquisition', '').startswith('1970-01-01'):
+        return
+    report.issues.append('start of acquisition is 1970-01-01')
+    if not repair:
+        return
+    if first_time is not None:
+        acq_start_ms = first_time
+        report.repairs.append('set start of acquisition to the first timestamp')
+    else:
+        acq_start_ms = estimate_stream_start(fqpn, samples, period_ms, index, itemsize)
+        report.repairs.append('set start of acquisition estimated from the file modification time')
+    write_header(fqpn, settings, acq_start_ms)
+
+
+def check_stream(report: FileReport, fqpn: pathlib.Path, settings: dict, gap_factor: float, repair: bool):
+    reader = ReadWrite.read_file(fqpn)
+    itemsize = reader.data_dtype.itemsize
+    size = os.path.getsize(fqpn)
+    if size % itemsize:
+        report.issues.append(f'partial trailing sample ({size % itemsize} bytes)')
+        if repair:
+            truncate(fqpn, size - size % itemsize)
+            report.repairs.append(f'truncated {size % itemsize} bytes')
+    samples = size // itemsize
+    report.records = samples
+
+    period_ms = reader.sensor.sampling_period_ms
+    index = check_index(report, fqpn, samples * itemsize, period_ms, itemsize, gap_factor, repair)
+    check_start(report, fqpn, settings, None, samples, period_ms, index, repair, itemsize)
+
+    data = reader._open_mmap()
+    if data is not None and data.dtype.kind == 'f':
+        check_nans(report, (np.isnan(block) for block in iter_column_blocks(data)))
+    reader.close()
+
+
+def check_compressed(report: FileReport, fqpn: pathlib.Path, settings: dict, gap_factor: float, repair: bool):
+    reader = ReadWrite.read_file(fqpn)
+    itemsize = reader.data_dtype.itemsize
+    size = os.path.getsize(fqpn)
+    table_fqpn = reader.table_fqpn
+    table_size = os.path.getsize(table_fqpn) if table_fqpn.exists() else 0
+    entry_size = ReadWrite.CHUNK_TABLE_DTYPE.itemsize
+    if table_size % entry_size:
+        report.issues.append(f'chunk table has a partial trailing entry ({table_size % entry_size} bytes)')
+    table = np.fromfile(table_fqpn, dtype=ReadWrite.CHUNK_TABLE_DTYPE, count=table_size // entry_size) \
+        if table_size else np.zeros(0, dtype=ReadWrite.CHUNK_TABLE_DTYPE)
+
+    # chunks are written back to back, a chunk is valid if it follows the previous one
+    # and was completely written to the data file
+    offsets = table['offset'].astype(np.int64)
+    ends = offsets + table['nbytes'].astype(np.int64)
+    first = table['first_sample'].astype(np.int64)
+    counts = table['samples'].astype(np.int64)
+    contiguous = (offsets == np.concatenate(([0], ends[:-1]))) & \
+                 (first == np.concatenate(([0], np.cumsum(counts)[:-1]))) & (ends <= size)
+    valid = len(table) if np.all(contiguous) else int(np.argmin(contiguous))
+    if valid < len(table):
+        report.issues.append(f'{len(table) - valid} chunk table entries are past the end of the data or invalid')
+    data_end = int(ends[valid - 1]) if valid else 0
+    if size > data_end:
+        report.issues.append(f'{size - data_end} bytes of data are not in the chunk table')
+
+    if repair and (valid < len(table) or table_size % entry_size or size > data_end):
+        truncate(table_fqpn, valid * entry_size)
+        truncate(fqpn, data_end)
+        report.repairs.append(f'truncated to {valid} complete chunks')
+    table = table[:valid]
+    samples = int(np.sum(counts[:valid]))
+    report.records = samples
+
+    period_ms = reader.sensor.sampling_period_ms
+    index = check_index(report, fqpn, samples * itemsize, period_ms, itemsize, gap_factor, repair)
+    check_start(report, fqpn, settings, None, samples, period_ms, index, repair, itemsize)
+
+    if reader.data_dtype.kind == 'f':
+        check_nans(report, (np.isnan(reader.read_compressed_chunk(chunk_no, entry))
+                            for chunk_no, entry in enumerate(table)))
+    reader.close()
+
+
+def check_points(report: FileReport, fqpn: pathlib.Path, settings: dict, gap_factor: float, repair: bool):
+    reader = ReadWrite.read_file(fqpn)
+    chunk_size = reader.chunk_dtype.itemsize
+    size = os.path.getsize(fqpn)
+    if size % chunk_size:
+        report.issues.append(f'partial trailing chunk ({size % chunk_size} bytes)')
+        if repair:
+            truncate(fqpn, size - size % chunk_size)
+            report.repairs.append(f'truncated {size % chunk_size} bytes')
+    chunks = reader._open_chunks()
+    report.records = 0 if chunks is None else len(chunks)
+
+    # points are indexed on their timestamps, the gaps are found from the timestamps directly
+    check_index(report, fqpn, report.records * chunk_size, 0, chunk_size, gap_factor, repair)
+    if chunks is None:
+        check_start(report, fqpn, settings, None, 0, 0, None, repair)
+        reader.close()
+        return
+
+    times = chunks['time']
+    check_times(report, times, 'timestamps')
+    check_start(report, fqpn, settings, int(times[0]), report.records, 0, None, repair)
+    if len(times) > 2:
+        dt = np.diff(times.astype(np.int64))
+        typical = float(np.median(dt))
+        if typical > 0:
+            gaps = dt > gap_factor * typical
+            if np.any(gaps):
+                report.issues.append(f'{int(np.count_nonzero(gaps))} time gaps longer than '
+                                     f'{gap_factor} x {typical:.0f} ms, longest is {int(dt.max())} ms')
+
+    if reader.data_dtype.kind == 'f':
+        # a chunk with any NaN sample counts towards the run
+        check_nans(report, (np.isnan(block['data']).reshape(len(block), -1).any(axis=1)
+                            for block in iter_column_blocks(chunks)))
+    reader.close()
+
+
+def check_file(fqpn: pathlib.Path, repair: bool = False, gap_factor: float = 1.5):
+    report = FileReport(fqpn.name, get_kind(fqpn))
+    try:
+        settings = repair_header(report, fqpn, repair)
+        if settings is None:
+            return report
+        report.kind = get_kind(fqpn)
+        if report.kind == 'points':
+            check_points(report, fqpn, settings, gap_factor, repair)
+        elif report.kind == 'compressed':
+            check_compressed(report, fqpn, settings, gap_factor, repair)
+        else:
+            check_stream(report, fqpn, settings, gap_factor, repair)
+    except Exception as e:
+        report.issues.append(f'could not be checked: {e}')
+    return report
+
+
+def init_worker(active_config):
+    # workers started with spawn (e.g. on Windows) do not inherit the configuration set in main,
+    # which is needed to find the strategy of a file when repairing its header
+    PerfusionConfig.ACTIVE_CONFIG = active_config
+
+
+def check_folder(base_folder: pathlib.Path, workers: int = None, repair: bool = False, gap_factor: float = 1.5):
+    files = sorted(pathlib.Path(file.path) for file in os.scandir(base_folder)
+                   if os.path.splitext(file.name)[-1].lower() == '.dat')
+    total = len(files)
+    reports = []
+    if workers == 1:
+        for idx, fqpn in enumerate(files):
+            report = check_file(fqpn, repair, gap_factor)
+            print(f'[{idx + 1}/{total}] {report}')
+            reports.append(report)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(PerfusionConfig.ACTIVE_CONFIG,)) as pool:
+            futures = {pool.submit(check_file, fqpn, repair, gap_factor): fqpn for fqpn in files}
+            for idx, future in enumerate(as_completed(futures)):
+                fqpn = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:
+                    report = FileReport(fqpn.name, issues=[f'could not be checked: {e}'])
+                print(f'[{idx + 1}/{total}] {report}')
+                reports.append(report)
+
+    reports.sort(key=lambda r: r.name)
+    with open(base_folder / REPORT_FILENAME, 'wt') as fid:
+        bad = sum(1 for report in reports if not report.ok)
+        fid.write(f'Integrity report for {base_folder} at {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
+        fid.write(f'{total} files checked, {bad} with issues{" (repaired)" if repair else ""}\n\n')
+        fid.write('\n'.join(str(report) for report in reports))
+        fid.write('\n')
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check, and optionally repair, all data files in a date folder')
+    parser.add_argument('date_str', help='date folder to check (yyyy-mm-dd)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of files to check in parallel')
+    parser.add_argument('--repair', action='store_true',
+                        help='truncate partial data, remove invalid index entries and rewrite bad headers')
+    parser.add_argument('--gap-factor', type=float, default=1.5,
+                        help='report a gap when the time between samples is this many times the expected time')
+    args = parser.parse_args()
+
+    base_folder = PerfusionConfig.ACTIVE_CONFIG.basepath / \
+                  PerfusionConfig.ACTIVE_CONFIG.get_data_folder(args.date_str)
+
+    if not os.path.isdir(base_folder):
+        print(f'Could not find folder {base_folder}')
+    else:
+        start = time.perf_counter()
+        reports = check_folder(base_folder, workers=args.workers, repair=args.repair, gap_factor=args.gap_factor)
+        bad = sum(1 for report in reports if not report.ok)
+        print(f'{len(reports)} files checked, {bad} with issues, report written to {base_folder / REPORT_FILENAME}')
+        print(f'finished in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == "__main__":
+    PerfusionConfig.set_test_config()
+    utils.setup_default_logging('app_integrity', logging.DEBUG)
+
+    main()
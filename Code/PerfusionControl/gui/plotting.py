@@ -22,7 +22,7 @@ import pyPerfusion.PerfusionConfig as PerfusionConfig
 
 
 class SensorPlot:
-    def __init__(self, sensor, axes, readout=True):
+    def __init__(self, sensor, axes, readout=True, decimation='linspace'):
         self._lgr = logging.getLogger(__name__)
         self._sensor = sensor
         self._reader = None
@@ -34,7 +34,9 @@ class SensorPlot:
         self._low_range = None
         self._high_range = None
         self._axhspan = None
-
+        # how the reader reduces the data to plot_len points, see Strategy_ReadWrite.DECIMATION_MODES
+        # use minmax or lttb to show spikes and pulsatile waveforms without plotting more points
+        self.decimation = decimation
 
     @property
     def name(self):
@@ -50,7 +52,7 @@ class SensorPlot:
             return
 
         try:
-            data_time, data = self._reader.retrieve_buffer(frame_ms, plot_len)
+            data_time, data = self._reader.retrieve_buffer(frame_ms, plot_len, decimation=self.decimation)
             start_t = frame_ms
             if len(data) < plot_len:
                 if len(data_time) == 0:
@@ -135,15 +137,15 @@ class SensorPlot:
 
 
 class EventPlot(SensorPlot):
-    def __init__(self, sensor, axes, readout=True):
-        super().__init__(sensor, axes, readout)
+    def __init__(self, sensor, axes, readout=True, decimation='linspace'):
+        super().__init__(sensor, axes, readout, decimation)
         self._line = self._axes.vlines([], ymin=0, ymax=100, color=self._color)
         self._line.set_label(self.name)
 
     def plot(self, frame_ms, plot_len):
         if not self._reader:
             return
-        data_time, data = self._reader.retrieve_buffer(frame_ms, plot_len)
+        data_time, data = self._reader.retrieve_buffer(frame_ms, plot_len, decimation=self.decimation)
         # self._lgr.debug(f'{self._sensor.cfg.name}: data_time is {data_time}')
         if data is None or len(data) == 0:
             return
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+""" Catalog of every data file in the data folders
+
+The catalog is a SQLite database in the base path of the active configuration with one
+row per .dat file, filled from the header (.txt) and the size of the files. Rows are only
+refreshed when the data or header file has changed since it was last cataloged, so updating
+the catalog of a folder with unchanged files only needs a stat of each file.
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import os
+import pathlib
+import sqlite3
+from dataclasses import dataclass, astuple, fields
+
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+import pyPerfusion.utils as utils
+from pyPerfusion.folder_management import FolderManagement
+
+
+CATALOG_FILENAME = 'catalog.sqlite'
+
+
+@dataclass
+class CatalogEntry:
+    # path is relative to the base path, times are epoch ms
+    path: str = ''
+    date: str = ''
+    sensor: str = None
+    strategy: str = None
+    kind: str = None
+    data_type: str = None
+    sampling_period_ms: float = None
+    samples_per_timestamp: int = None
+    start_ms: float = None
+    end_ms: float = None
+    samples: int = 0
+    size_bytes: int = 0
+    mtime: float = 0
+    header_mtime: float = 0
+
+    @property
+    def duration_ms(self):
+        if self.start_ms is None or self.end_ms is None:
+            return 0
+        return self.end_ms - self.start_ms
+
+
+_COLUMNS = [f.name for f in fields(CatalogEntry)]
+_SQL_TYPES = {str: 'TEXT', float: 'REAL', int: 'INTEGER'}
+
+
+def describe_file(fqpn: pathlib.Path, base_path: pathlib.Path) -> CatalogEntry:
+    stat = fqpn.stat()
+    header = fqpn.with_suffix('.txt')
+    entry = CatalogEntry(path=fqpn.relative_to(base_path).as_posix(), date=fqpn.parent.name,
+                         size_bytes=stat.st_size, mtime=stat.st_mtime,
+                         header_mtime=header.stat().st_mtime if header.exists() else 0)
+    if not header.exists():
+        # still cataloged so the file can be found, see app_integrity to repair the header
+        return entry
+
+    with open(header) as reader:
+        for line in reader:
+            key, sep, value = line.strip().partition(': ')
+            if key == 'Sensor Name':
+                entry.sensor = value
+            elif key == 'Output Type':
+                entry.strategy = value
+
+    reader = ReadWrite.read_file(fqpn)
+    entry.data_type = str(reader.data_dtype)
+    if isinstance(reader, ReadWrite.ReaderPoints):
+        entry.kind = 'points'
+        entry.samples_per_timestamp = reader.cfg.samples_per_timestamp
+        chunks = reader._open_chunks()
+        if chunks is not None:
+            entry.samples = len(chunks)
+            entry.start_ms = float(chunks['time'][0])
+            entry.end_ms = float(chunks['time'][-1])
+    else:
+        entry.kind = 'compressed' if isinstance(reader, ReadWrite.ReaderCompressed) else 'stream'
+        entry.sampling_period_ms = float(reader.sensor.sampling_period_ms)
+        data = reader._open_mmap()
+        if data is not None:
+            entry.samples = len(data)
+            acq_start_ms = reader.sensor.get_acq_start_ms()
+            first, last = reader.get_sample_times([0, len(data) - 1])
+            entry.start_ms = float(acq_start_ms + first)
+            entry.end_ms = float(acq_start_ms + last)
+    reader.close()
+    return entry
+
+
+class Catalog:
+    def __init__(self, fm: FolderManagement = None, filename: pathlib.Path = None):
+        self._lgr = utils.get_object_logger(__name__, 'Catalog')
+        fm = fm or PerfusionConfig.ACTIVE_CONFIG
+        self.base_path = pathlib.Path(fm.basepath)
+        self.data_path = self.base_path / 'data'
+        self.fqpn = filename or self.base_path / CATALOG_FILENAME
+        self._conn = sqlite3.connect(self.fqpn)
+        self._create_tables()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _create_tables(self):
+        columns = ', '.join(f'{f.name} {_SQL_TYPES[f.type]}' for f in fields(CatalogEntry))
+        with self._conn:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS files ({columns}, PRIMARY KEY (path))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS files_sensor ON files (sensor, strategy)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS files_time ON files (start_ms, end_ms)')
+
+    def get_dates(self):
+        if not self.data_path.exists():
+            return []
+        return sorted(folder.name for folder in os.scandir(self.data_path) if folder.is_dir())
+
+    def _get_stored(self, date_str):
+        rows = self._conn.execute('SELECT path, size_bytes, mtime, header_mtime FROM files WHERE date = ?',
+                                  (date_str,))
+        return {row[0]: row[1:] for row in rows}
+
+    def update(self, date_str: str = None):
+        # catalog new and changed files in one date folder (default all) and drop deleted files
+        # returns the number of rows which were added or refreshed
+        dates = [date_str] if date_str else self.get_dates()
+        updated = 0
+        for date in dates:
+            folder = self.data_path / date
+            stored = self._get_stored(date)
+            entries = []
+            found = set()
+            if folder.exists():
+                for file in os.scandir(folder):
+                    if os.path.splitext(file.name)[-1].lower() != '.dat':
+                        continue
+                    fqpn = pathlib.Path(file.path)
+                    path = fqpn.relative_to(self.base_path).as_posix()
+                    found.add(path)
+                    header = fqpn.with_suffix('.txt')
+                    stat = file.stat()
+                    current = (stat.st_size, stat.st_mtime, header.stat().st_mtime if header.exists() else 0)
+                    if stored.get(path, None) == current:
+                        continue
+                    try:
+                        entries.append(describe_file(fqpn, self.base_path))
+                    except Exception as e:
+                        self._lgr.warning(f'Could not catalog {fqpn}: {e}')
+            removed = [(path,) for path in stored.keys() - found]
+            with self._conn:
+                placeholders = ', '.join('?' * len(_COLUMNS))
+                self._conn.executemany(f'INSERT OR REPLACE INTO files ({", ".join(_COLUMNS)}) '
+                                       f'VALUES ({placeholders})', [astuple(entry) for entry in entries])
+                self._conn.executemany('DELETE FROM files WHERE path = ?', removed)
+            updated += len(entries)
+        return updated
+
+    def is_unchanged(self, fqpn: pathlib.Path):
+        # True if the file has not changed since it was cataloged
+        fqpn = pathlib.Path(fqpn)
+        row = self._conn.execute('SELECT size_bytes, mtime, header_mtime FROM files WHERE path = ?',
+                                 (fqpn.relative_to(self.base_path).as_posix(),)).fetchone()
+        if row is None or not fqpn.exists():
+            return False
+        header = fqpn.with_suffix('.txt')
+        stat = fqpn.stat()
+        return row == (stat.st_size, stat.st_mtime, header.stat().st_mtime if header.exists() else 0)
+
+    def find(self, sensor: str = None, strategy: str = None, date_str: str = None, kind: str = None,
+             start_ms: float = None, end_ms: float = None, min_duration_ms: float = None):
+        # files matching every given condition, start_ms/end_ms (epoch ms) select files with data
+        # in [start_ms, end_ms). sensor and strategy may use SQL LIKE wildcards, e.g. 'HA%'
+        conditions = []
+        params = []
+        for column, value in (('sensor', sensor), ('strategy', strategy), ('kind', kind)):
+            if value is not None:
+                conditions.append(f'{column} LIKE ?')
+                params.append(value)
+        if date_str is not None:
+            conditions.append('date LIKE ?')
+            params.append(date_str)
+        if start_ms is not None:
+            conditions.append('end_ms >= ?')
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append('start_ms < ?')
+            params.append(end_ms)
+        if min_duration_ms is not None:
+            conditions.append('end_ms - start_ms >= ?')
+            params.append(min_duration_ms)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self._conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM files{where} ORDER BY date, path', params)
+        return [CatalogEntry(*row) for row in rows]
+
+    def get_fqpn(self, entry: CatalogEntry):
+        return self.base_path / entry.path
+
@@ -82,9 +82,9 @@ def read_into_dataclass(cfg_name: str, section_name: str, cfg, fm: FolderManagem
                     logging.getLogger(__name__).debug(f'Config contained entry {key} which is not part of dataclass {cfg}')
                 continue
             try:
-                # check if value is a list (i.e.: #, #)
+                # check if value is a list (i.e.: #, #), a list field may also hold a single value
                 normal_value = True
-                if ',' in value:
+                if ',' in value or isinstance(dummy, list):
                     try:
                         value = [float(x.strip()) for x in ''.join(value).strip('[]').split(',')]
                         normal_value = False
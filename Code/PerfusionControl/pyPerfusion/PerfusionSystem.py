@@ -177,7 +177,7 @@ class PerfusionSystem:
 
         # load strategies
         lgr.debug(f'strategies are {obj.cfg.strategy_names}')
-        for name in obj.cfg.strategy_names.split(', '):
+        for name, input_name in parse_strategy_names(obj.cfg.strategy_names):
             # lgr.debug(f'Getting strategy {name}')
             params = PerfusionConfig.read_section('strategies', name)
             try:
@@ -191,7 +191,7 @@ class PerfusionSystem:
                     # lgr.debug(f'adding strategy {name}')
                     strategy = strategy_class(name)
                     strategy.cfg = cfg
-                    obj.add_strategy(strategy)
+                    obj.add_strategy(strategy, input_name)
                 except AttributeError:
                     self._lgr.exception(f'Could not find strategy class for {name}')
                     pass
@@ -13,6 +13,7 @@ flow or pressure. It is also used to log how actuators, e.g., pumps, are being c
 This work was created by an employee of the US Federal Gov
 and under the public domain.
 """
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread, Event
 from dataclasses import dataclass, field
 from typing import List
@@ -26,9 +27,31 @@ from pyPerfusion.Strategy_Processing import *
 import pyPerfusion.PerfusionConfig as PerfusionConfig
 
 
+# the input of a strategy which processes the buffers from the sensor itself
+SENSOR_INPUT = ''
+
+
+def parse_strategy_names(strategy_names: str):
+    # (name, input name) of each entry of BaseSensorConfig.strategy_names, the input name is
+    # None if not given (the previous strategy) or SENSOR_INPUT for Name()
+    strategies = []
+    for entry in strategy_names.split(','):
+        name, bracket, input_name = entry.partition('(')
+        name = name.strip()
+        if not name:
+            continue
+        input_name = input_name.strip().rstrip(')').strip() if bracket else None
+        strategies.append((name, input_name))
+    return strategies
+
+
 @dataclass
 class BaseSensorConfig:
+    # each strategy processes the output of the strategy before it unless its input is named,
+    # e.g. "Raw, LowPass_2Hz(Raw), Pulse(LowPass_2Hz), RMS_11pt(Raw)", Name() uses the sensor buffer
     strategy_names: str = ''
+    # independent branches of strategies run in parallel on this many threads, 0 runs them in order
+    strategy_workers: int = 0
 
 
 @dataclass
@@ -86,6 +109,10 @@ class Sensor:
         self.cfg = SensorConfig()
 
         self._strategies = []
+        # name of the input of each strategy and the order to run them in (None until needed)
+        self._inputs = {}
+        self._order = None
+        self._pool = None
 
     @property
     def data_dtype(self):
@@ -98,9 +125,70 @@ class Sensor:
     def get_acq_start_ms(self):
         return self.hw.get_acq_start_ms()
 
-    def add_strategy(self, strategy):
+    def add_strategy(self, strategy, input_name: str = None):
         strategy.open(sensor=self)
+        self._add_to_graph(strategy, input_name)
+
+    def _add_to_graph(self, strategy, input_name: str = None):
+        # input_name is the strategy whose output is processed, SENSOR_INPUT for the buffers
+        # from the sensor or None for the previously added strategy
+        if input_name is None:
+            input_name = self._strategies[-1].name if self._strategies else SENSOR_INPUT
         self._strategies.append(strategy)
+        self._inputs[strategy.name] = input_name
+        self._order = None
+
+    def get_strategy_input(self, name: str):
+        return self._inputs.get(name, None)
+
+    def _get_order(self):
+        # inputs run before the strategies using them, otherwise in the order they were added
+        if self._order is None:
+            done = {SENSOR_INPUT}
+            order = []
+            remaining = list(self._strategies)
+            while remaining:
+                ready = [strategy for strategy in remaining if self._inputs[strategy.name] in done]
+                if not ready:
+                    break
+                order.extend(ready)
+                done.update(strategy.name for strategy in ready)
+                remaining = [strategy for strategy in remaining if strategy.name not in done]
+            for strategy in remaining:
+                self._lgr.error(f'Input {self._inputs[strategy.name]} of strategy {strategy.name} is not a '
+                                f'strategy of {self.name} or is part of a cycle, {strategy.name} will not be run')
+            self._order = order
+        return self._order
+
+    def _process_strategies(self, buf, t):
+        # every strategy using the same input is given the same buffer, strategies must not
+        # modify the buffer they are given
+        outputs = {SENSOR_INPUT: (buf, t)}
+        if self._pool is None:
+            for strategy in self._get_order():
+                outputs[strategy.name] = strategy.process_buffer(*outputs[self._inputs[strategy.name]])
+            return
+
+        # inputs are submitted before the strategies using them, so a strategy waiting
+        # for its input never blocks the input from running
+        futures = {}
+        for strategy in self._get_order():
+            input_name = self._inputs[strategy.name]
+            futures[strategy.name] = self._pool.submit(self._run_strategy, strategy, futures.get(input_name, None),
+                                                       outputs[SENSOR_INPUT])
+        # finish this buffer before the next, each strategy must see the buffers in order
+        for future in futures.values():
+            future.result()
+
+    def _flush_strategies(self, force: bool = False):
+        # keeps the flush and fsync intervals of each strategy while no data is arriving
+        for strategy in self._strategies:
+            strategy.flush_pending(force)
+
+    @staticmethod
+    def _run_strategy(strategy, input_future, sensor_output):
+        buf, t = sensor_output if input_future is None else input_future.result()
+        return strategy.process_buffer(buf, t)
 
     def get_reader_names(self):
         strategy_names = [strategy.name for strategy in self._strategies]
@@ -143,9 +231,8 @@ class Sensor:
                 while data_buf is not None:
                     data_buf, t = self.hw.get_data()
                     if data_buf is not None:
-                        buf = data_buf
-                        for strategy in self._strategies:
-                            buf, t = strategy.process_buffer(buf, t)
+                        self._process_strategies(data_buf, t)
+            self._flush_strategies()
 
     def open(self):
         pass
@@ -159,6 +246,9 @@ class Sensor:
         if self.__thread:
             self.stop()
         self._evt_halt.clear()
+        if self.cfg.strategy_workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=self.cfg.strategy_workers,
+                                            thread_name_prefix=f'{__name__} {self.name} strategies')
         self.__thread = Thread(target=self.run)
         self.__thread.name = f'{__name__} {self.name}'
         self.__thread.start()
@@ -167,7 +257,13 @@ class Sensor:
         self._evt_halt.set()
         if self.__thread:
             self.__thread.join(2.0)
+            if not self.__thread.is_alive():
+                # nothing buffered is left waiting for the flush interval
+                self._flush_strategies(force=True)
             self.__thread = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 
 class CalculatedSensor(Sensor):
@@ -188,23 +284,27 @@ class CalculatedSensor(Sensor):
     def get_acq_start_ms(self):
         return self.reader.sensor.get_acq_start_ms()
 
-    def add_strategy(self, strategy):
+    def add_strategy(self, strategy, input_name: str = None):
         # CalculatedSensor won't be fully active until the readers are set
         # wait until run() to open them
-        self._strategies.append(strategy)
+        self._add_to_graph(strategy, input_name)
 
     def run(self):
         for strategy in self._strategies:
             strategy.open(sensor=self)
 
+        samples = max(self.cfg.samples_per_calc, 1)
         while not PerfusionConfig.MASTER_HALT.is_set():
-            if self._evt_halt.wait(self._timeout):
+            # the reader is woken by its writer as soon as enough samples are written
+            # the timeout only bounds how long it takes to notice a halt
+            self.reader.wait_for_data(samples, self._timeout)
+            if self._evt_halt.is_set():
                 break
-            t, data_buf = self.reader.get_data_from_last_read(self.cfg.samples_per_calc)
-            if data_buf is not None:
-                buf = data_buf
-                for strategy in self._strategies:
-                    buf, t = strategy.process_buffer(buf, t)
+            t, data_buf = self.reader.get_data_from_last_read(samples)
+            while data_buf is not None:
+                self._process_strategies(data_buf, t)
+                t, data_buf = self.reader.get_data_from_last_read(samples)
+            self._flush_strategies()
 
 
 class DivisionSensor(Sensor):
@@ -226,23 +326,27 @@ class DivisionSensor(Sensor):
     def get_acq_start_ms(self):
         return self.reader_dividend.sensor.get_acq_start_ms()
 
-    def add_strategy(self, strategy):
+    def add_strategy(self, strategy, input_name: str = None):
         # Division won't be fully active until the readers are set
         # wait until run() to open them
-        self._strategies.append(strategy)
+        self._add_to_graph(strategy, input_name)
 
     def run(self):
         for strategy in self._strategies:
             strategy.open(sensor=self)
+        samples = max(self.cfg.samples_per_calc, 1)
         while not PerfusionConfig.MASTER_HALT.is_set():
-            if self._evt_halt.wait(self._timeout):
+            # both inputs must have data, the timeout only bounds how long it takes to notice a halt
+            if self.reader_dividend.wait_for_data(samples, self._timeout):
+                self.reader_divisor.wait_for_data(samples, self._timeout)
+            if self._evt_halt.is_set():
                 break
-            t_f, dividend = self.reader_dividend.get_data_from_last_read(self.cfg.samples_per_calc)
-            t_p, divisor = self.reader_divisor.get_data_from_last_read(self.cfg.samples_per_calc)
-            if dividend is not None and divisor is not None:
-                buf = np.divide(dividend, divisor)
-                for strategy in self._strategies:
-                    buf, t = strategy.process_buffer(buf, t_f)
+            while self.reader_dividend.get_unread_count() >= samples \
+                    and self.reader_divisor.get_unread_count() >= samples:
+                t_f, dividend = self.reader_dividend.get_data_from_last_read(samples)
+                t_p, divisor = self.reader_divisor.get_data_from_last_read(samples)
+                self._process_strategies(np.divide(dividend, divisor), t_f)
+            self._flush_strategies()
 
 
 class GasMixerSensor(Sensor):
@@ -18,12 +18,24 @@ def get_class(name: str):
         return Strategy_Processing.RMS
     elif name == 'MovingAverage':
         return Strategy_Processing.MovingAverage
+    elif name == 'Filter':
+        return Strategy_Processing.Filter
+    elif name == 'Decimate':
+        return Strategy_Processing.Decimate
     elif name == 'RunningSum':
         return Strategy_Processing.RunningSum
+    elif name == 'Rollup':
+        return Strategy_Processing.Rollup
+    elif name == 'PulseAnalyzer':
+        return Strategy_Processing.PulseAnalyzer
+    elif name == 'SpectrumAnalyzer':
+        return Strategy_Processing.SpectrumAnalyzer
     elif name == 'WriterStream':
         return Strategy_RW.WriterStream
     elif name == 'WriterPoints':
         return Strategy_RW.WriterPoints
+    elif name == 'WriterCompressed':
+        return Strategy_RW.WriterCompressed
     else:
         return None
 
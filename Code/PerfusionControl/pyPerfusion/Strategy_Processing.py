@@ -9,11 +9,19 @@ This work was created by an employee of the US Federal Gov
 and under the public domain.
 """
 import logging
-from dataclasses import dataclass
+import pathlib
+from dataclasses import dataclass, field
+from typing import List
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+try:
+    import scipy.signal
+except ImportError:
+    scipy = None
 
 import pyPerfusion.Strategy_ReadWrite as Strategy_ReadWrite
+import pyPerfusion.PerfusionConfig as PerfusionConfig
 import pyPerfusion.utils as utils
 
 
@@ -27,6 +35,56 @@ class RunningSumConfig(Strategy_ReadWrite.WriterConfig):
     calibration_seconds: int = 1
 
 
+@dataclass
+class FilterConfig(Strategy_ReadWrite.WriterConfig):
+    # design is butter (Butterworth IIR of filter_order) or fir (windowed FIR with filter_order + 1 taps)
+    # filter_type is lowpass, highpass, bandpass or bandstop, band filters use cutoff_hz to cutoff_high_hz
+    design: str = 'butter'
+    filter_type: str = 'lowpass'
+    filter_order: int = 4
+    cutoff_hz: float = 10.0
+    cutoff_high_hz: float = 0.0
+    # FIR coefficients, used instead of designing the filter if given
+    taps: List = field(default_factory=list)
+    # mains notch (e.g. 50 or 60 Hz) applied after the filter, 0 disables
+    notch_hz: float = 0.0
+    notch_q: float = 30.0
+
+
+@dataclass
+class DecimateConfig(Strategy_ReadWrite.WriterConfig):
+    # keep every factor-th sample after a low-pass FIR of factor * taps_per_phase + 1 taps
+    # cutoff is a fraction of the Nyquist frequency of the decimated output
+    factor: int = 10
+    taps_per_phase: int = 8
+    cutoff: float = 0.8
+
+
+@dataclass
+class RollupConfig(Strategy_ReadWrite.WriterConfig):
+    levels_s: List = field(default_factory=lambda: [1, 10, 60, 600])
+
+
+@dataclass
+class PulseConfig(Strategy_ReadWrite.WriterConfig):
+    # a beat starts when the signal rises through the mean of the previous beat plus
+    # hysteresis * its pulse height, and must fall below the mean minus that before the next beat
+    hysteresis: float = 0.1
+    # beats outside this rate are not recorded, no beat for 60 / min_bpm seconds restarts the detection
+    # which is (re)started from the mean and height of the following 60 / min_bpm seconds of samples
+    min_bpm: float = 10.0
+    max_bpm: float = 300.0
+
+
+@dataclass
+class SpectrumConfig(Strategy_ReadWrite.WriterConfig):
+    # Welch's method: Hann windowed segments of segment_len samples overlapping by overlap (fraction)
+    # are averaged and a spectrum is written every segments_per_spectrum segments
+    segment_len: int = 1_024
+    overlap: float = 0.5
+    segments_per_spectrum: int = 8
+
+
 class RMS(Strategy_ReadWrite.WriterStream):
     def __init__(self, name: str):
         super().__init__(name)
@@ -43,17 +101,20 @@ class RMS(Strategy_ReadWrite.WriterStream):
     def _process(self, buffer, t=None):
         if self._window_buffer is None:
             self._window_buffer = np.zeros(self.cfg.window_len, dtype=self.data_dtype)
-        idx = 0
-        for sample in buffer:
-            sqr = sample * sample
-            front = self._window_buffer[0]
-            self._window_buffer = np.roll(self._window_buffer, -1)
-            self._window_buffer[-1] = sqr
-            self._sum += sqr - front
-            rms = np.sqrt(self._sum / self.cfg.window_len)
-            self._processed_buffer = np.roll(self._processed_buffer, -1)
-            self._processed_buffer[-1] = rms
-            idx += 1
+        if len(buffer) == 0:
+            self._processed_buffer = np.empty(0, dtype=self.data_dtype)
+            return
+        buffer = np.asarray(buffer)
+        # the window holds the squares of the last window_len samples, each new square
+        # replaces the oldest one in the running sum
+        squares = np.concatenate((self._window_buffer, (buffer * buffer).astype(self.data_dtype)))
+        deltas = squares[len(self._window_buffer):] - squares[:len(buffer)]
+        # cumsum adds in the same order as updating the running sum a sample at a time
+        sums = np.cumsum(np.concatenate(([self._sum], deltas)))
+        self._sum = sums[-1]
+        self._window_buffer = squares[len(squares) - self.cfg.window_len:].copy()
+        # one output for each input sample, so buffers of any length (e.g. from Decimate) can be chained
+        self._processed_buffer = np.sqrt(sums[1:] / self.cfg.window_len)
 
     def reset(self):
         super().reset()
@@ -76,25 +137,207 @@ class MovingAverage(Strategy_ReadWrite.WriterStream):
     def _process(self, buffer, t=None):
         if self._window_buffer is None:
             self._window_buffer = np.zeros(self.cfg.window_len, dtype=self.data_dtype)
-        idx = 0
-        for sample in buffer:
-            front = self._window_buffer[0]
-            self._window_buffer = np.roll(self._window_buffer, -1)
-            self._window_buffer[-1] = sample
-            self._sum += sample - front
-            avg = np.sum(self._window_buffer) / self.cfg.window_len
-            self._processed_buffer = np.roll(self._processed_buffer, -1)
-            self._processed_buffer[-1] = avg
-            # self._lgr.debug(f'sample: {sample}: avg: {avg}')
-            # self._lgr.debug(f'buffer: {buffer}')
-            # self._lgr.debug(f'processed buffer: {self._processed_buffer}')
-            idx += 1
+        if len(buffer) == 0:
+            self._processed_buffer = np.empty(0, dtype=self.data_dtype)
+            return
+        samples = np.concatenate((self._window_buffer, np.asarray(buffer, dtype=self.data_dtype)))
+        # one window ending at each new sample, summed the same way as np.sum of a single window
+        # so the averages match summing the window a sample at a time exactly
+        windows = sliding_window_view(samples[1:], self.cfg.window_len)
+        avg = np.sum(windows, axis=1) / self.cfg.window_len
+        self._window_buffer = samples[len(samples) - self.cfg.window_len:].copy()
+        self._processed_buffer = avg
 
     def reset(self):
         super().reset()
         self._sum = 0
 
 
+class Filter(Strategy_ReadWrite.WriterStream):
+    # Low/high/band pass and notch filtering designed from the config when opened. IIR filters
+    # are run as a cascade of second-order sections, every buffer is filtered in one call and
+    # the filter state is carried to the next buffer so the output is continuous
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = FilterConfig()
+        self.data_dtype = np.dtype(np.float64)
+        self._taps = None
+        self._sos = None
+        self._fir_state = None
+        self._sos_state = None
+
+    @classmethod
+    def get_config_type(cls):
+        return FilterConfig
+
+    def open(self, sensor=None):
+        # a single tap may be given as a number
+        self.cfg.taps = [float(tap) for tap in np.atleast_1d(self.cfg.taps)]
+        super().open(sensor)
+        self._design()
+
+    def _design(self):
+        self._taps = None
+        self._sos = None
+        self.reset()
+        if scipy is None:
+            self._lgr.warning(f'{self.name}: scipy is not installed, data will not be filtered')
+            return
+        fs = 1_000 / self.sensor.sampling_period_ms
+        cutoff = self.cfg.cutoff_hz
+        if self.cfg.filter_type in ('bandpass', 'bandstop'):
+            cutoff = [self.cfg.cutoff_hz, self.cfg.cutoff_high_hz]
+
+        # every frequency must be below the Nyquist frequency of the sensor
+        frequencies = [] if len(self.cfg.taps) > 0 else list(np.atleast_1d(cutoff))
+        if self.cfg.notch_hz > 0:
+            frequencies.append(self.cfg.notch_hz)
+        invalid = [freq for freq in frequencies if not 0 < freq < fs / 2]
+        if invalid:
+            self._lgr.error(f'{self.name}: {invalid} Hz must be between 0 and {fs / 2} Hz (half the sampling '
+                            f'rate of {self.sensor.name}), data will not be filtered')
+            return
+
+        try:
+            if len(self.cfg.taps) > 0:
+                self._taps = np.asarray(self.cfg.taps, dtype=np.float64)
+            elif self.cfg.design == 'fir':
+                # highpass and bandstop designs need an even filter_order (odd number of taps)
+                self._taps = scipy.signal.firwin(self.cfg.filter_order + 1, cutoff, pass_zero=self.cfg.filter_type,
+                                                 fs=fs)
+            elif self.cfg.design == 'butter':
+                self._sos = scipy.signal.butter(self.cfg.filter_order, cutoff, btype=self.cfg.filter_type,
+                                                output='sos', fs=fs)
+            else:
+                self._lgr.error(f'{self.name}: unknown filter design {self.cfg.design}, data will not be filtered')
+
+            if self.cfg.notch_hz > 0:
+                notch = scipy.signal.tf2sos(*scipy.signal.iirnotch(self.cfg.notch_hz, self.cfg.notch_q, fs=fs))
+                self._sos = notch if self._sos is None else np.vstack((self._sos, notch))
+        except ValueError as e:
+            self._lgr.error(f'{self.name}: could not design filter ({e}), data will not be filtered')
+            self._taps = None
+            self._sos = None
+
+    def _process(self, buffer, t=None):
+        data = np.asarray(buffer, dtype=self.data_dtype)
+        if len(data) == 0:
+            self._processed_buffer = data
+            return
+        # start in the steady state for the first sample, so there is no step response at startup
+        if self._taps is not None:
+            if self._fir_state is None and len(self._taps) == 1:
+                # a single tap is a gain, there is no state to carry
+                self._fir_state = np.zeros(0)
+            elif self._fir_state is None:
+                self._fir_state = scipy.signal.lfilter_zi(self._taps, 1.0) * data[0]
+            data, self._fir_state = scipy.signal.lfilter(self._taps, 1.0, data, zi=self._fir_state)
+        if self._sos is not None:
+            if self._sos_state is None:
+                self._sos_state = scipy.signal.sosfilt_zi(self._sos) * data[0]
+            data, self._sos_state = scipy.signal.sosfilt(self._sos, data, zi=self._sos_state)
+        self._processed_buffer = data
+
+    def reset(self):
+        self._fir_state = None
+        self._sos_state = None
+
+
+class DecimatedSensor:
+    # Stands in for the sensor of a Decimate strategy so the header, index, ring buffer and
+    # readers all use the decimated sampling period, everything else comes from the sensor
+    def __init__(self, sensor, factor: int):
+        self._sensor = sensor
+        self._factor = factor
+
+    @property
+    def sampling_period_ms(self):
+        return self._sensor.sampling_period_ms * self._factor
+
+    def __getattr__(self, item):
+        return getattr(self._sensor, item)
+
+
+class Decimate(Strategy_ReadWrite.WriterStream):
+    # Low-pass filters and keeps every cfg.factor-th sample, so the file is written at
+    # sampling_period_ms * factor. Only the kept outputs of the FIR are computed (the same work
+    # as a polyphase filter) and the last input samples are carried to the next buffer, so the
+    # output is continuous. The output is timestamped for the group delay of the filter. Any
+    # strategies after this one receive the decimated buffer, which holds about len(buffer) / factor
+    # samples and is empty if no sample was kept, so they must accept buffers of any length
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = DecimateConfig()
+        self.data_dtype = np.dtype(np.float64)
+        self._taps = None
+        self._history = None
+        self._skip = 0
+        self._samples_after = 0
+
+    @classmethod
+    def get_config_type(cls):
+        return DecimateConfig
+
+    def open(self, sensor=None):
+        self.cfg.factor = max(int(self.cfg.factor), 1)
+        super().open(DecimatedSensor(sensor, self.cfg.factor))
+        self._design()
+
+    def _design(self):
+        # Blackman windowed sinc with unity gain at DC, reversed so each output is a dot product
+        num_taps = self.cfg.factor * int(self.cfg.taps_per_phase) + 1
+        cutoff = self.cfg.cutoff / self.cfg.factor
+        n = np.arange(num_taps) - (num_taps - 1) / 2
+        taps = np.sinc(cutoff * n) * np.blackman(num_taps)
+        self._taps = (taps / np.sum(taps))[::-1].copy()
+        self.reset()
+
+    def reset(self):
+        self._history = None
+        # input samples to skip before the next output, the first output is the sample one group
+        # delay from the start so it is not timestamped before the first input
+        self._skip = int(np.ceil((len(self._taps) - 1) / 2)) if self._taps is not None else 0
+        self._samples_after = 0
+
+    def _process(self, buffer, t=None):
+        data = np.asarray(buffer, dtype=self.data_dtype)
+        if len(data) == 0:
+            self._processed_buffer = data
+            return
+        num_taps = len(self._taps)
+        if self._history is None:
+            # start in the steady state for the first sample, so there is no step response at startup
+            self._history = np.full(num_taps - 1, data[0])
+        samples = np.concatenate((self._history, data))
+        self._history = samples[len(samples) - num_taps + 1:].copy()
+
+        # index (into data) of each kept sample
+        kept = np.arange(self._skip, len(data), self.cfg.factor)
+        if len(kept) > 0:
+            self._skip = int(kept[-1]) + self.cfg.factor - len(data)
+        else:
+            self._skip -= len(data)
+        windows = sliding_window_view(samples, num_taps)[kept]
+        # summed row by row (not a matrix product) so the result does not depend on the buffer size
+        self._processed_buffer = np.sum(windows * self._taps, axis=1)
+        # samples from the last kept sample to the end of the buffer
+        if len(kept) > 0:
+            self._samples_after = len(data) - 1 - int(kept[-1])
+        else:
+            self._samples_after += len(data)
+
+    def _get_output_time(self, t):
+        # stamp the last kept sample, less the group delay of the filter
+        if t is None or len(self._processed_buffer) == 0:
+            return t
+        period = self.sensor.sampling_period_ms / self.cfg.factor
+        shift = (self._samples_after + (len(self._taps) - 1) / 2) * period
+        last_ms = int(np.asarray(t).reshape(-1)[-1])
+        return int(max(round(last_ms - shift), 0))
+
+
 class RunningSum(Strategy_ReadWrite.WriterStream):
     def __init__(self, name: str):
         super().__init__(name)
@@ -145,3 +388,537 @@ class RunningSum(Strategy_ReadWrite.WriterStream):
         self._cal_idx = 0
         self._calibrating = True
 
+
+
+# order of the samples in each chunk written by Rollup
+ROLLUP_STATS = ('min', 'max', 'mean', 'count')
+
+
+class Rollup(Strategy_ReadWrite.WriterStream):
+    # Maintains min/max/mean/count of the stream over fixed time buckets (e.g. 1s, 10s, 1 min, 10 min)
+    # Each level is written to its own points file ({sensor}_{name}_{level}sPoints.dat) with the
+    # bucket start time (epoch ms) as the timestamp. The stream is passed to the next strategy unaltered
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = RollupConfig()
+        self.data_dtype = np.dtype(np.float64)
+        self._levels = []
+
+    @classmethod
+    def get_config_type(cls):
+        return RollupConfig
+
+    @property
+    def is_segmented(self):
+        # nothing is written to the stream file, the level writers segment their own files
+        return False
+
+    def get_reader(self):
+        return RollupReader(self.name, self.fqpn, self.cfg, self.sensor,
+                            {level['ms']: level['writer'].get_reader() for level in self._levels})
+
+    def open(self, sensor=None):
+        # a single level may be given as a number
+        self.cfg.levels_s = [float(level_s) for level_s in np.atleast_1d(self.cfg.levels_s)]
+        self._base_path = PerfusionConfig.get_date_folder()
+        self._filename = pathlib.Path(f'{sensor.name}_{self.name}')
+        self.sensor = sensor
+        self._sync_writes()
+        self.close_levels()
+        self._print_stream_info()
+
+        self._levels = []
+        for level_s in self.cfg.levels_s:
+            writer = Strategy_ReadWrite.WriterPoints(f'{self.name}_{level_s:g}sPoints')
+            writer.cfg = Strategy_ReadWrite.WriterPointsConfig(bytes_per_timestamp=8,
+                                                               samples_per_timestamp=len(ROLLUP_STATS),
+                                                               segment_interval_s=self.cfg.segment_interval_s,
+                                                               segment_bytes=self.cfg.segment_bytes)
+            writer.open(sensor)
+            self._levels.append({'ms': int(level_s * 1_000), 'writer': writer, 'partial': None})
+
+    def flush_pending(self, force: bool = False):
+        for level in self._levels:
+            level['writer'].flush_pending(force)
+
+    def close_levels(self):
+        for level in self._levels:
+            # write the incomplete bucket so no samples are lost
+            if level['partial'] is not None:
+                self._write_buckets(level, [level['partial']])
+                level['partial'] = None
+            level['writer'].close()
+
+    def close(self):
+        self._sync_writes()
+        self.close_levels()
+        self._levels = []
+
+    def _write_buckets(self, level, buckets):
+        for bucket_id, b_min, b_max, b_sum, b_count in buckets:
+            stats = np.array([b_min, b_max, b_sum / b_count, b_count], dtype=self.data_dtype)
+            level['writer'].process_buffer(stats, np.uint64(bucket_id * level['ms']))
+
+    def _update_level(self, level, sample_ms, data):
+        bucket = sample_ms // level['ms']
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+        ids = bucket[starts]
+        mins = np.minimum.reduceat(data, starts)
+        maxs = np.maximum.reduceat(data, starts)
+        sums = np.add.reduceat(data, starts)
+        counts = np.diff(np.append(starts, len(data)))
+        buckets = list(zip(ids.tolist(), mins.tolist(), maxs.tolist(), sums.tolist(), counts.tolist()))
+
+        partial = level['partial']
+        if partial is not None:
+            if partial[0] == buckets[0][0]:
+                first = buckets[0]
+                buckets[0] = (first[0], min(partial[1], first[1]), max(partial[2], first[2]),
+                              partial[3] + first[3], partial[4] + first[4])
+            else:
+                buckets.insert(0, partial)
+        # the last bucket may still receive samples from the next buffer
+        level['partial'] = buckets.pop()
+        self._write_buckets(level, buckets)
+
+    def _write_to_file(self, data_buf, t=None):
+        if t is None or len(data_buf) == 0:
+            return
+        # timestamps are for the last sample in the buffer, rollups are aligned to wall-clock time
+        end_ms = self._get_index_time(t) + int(self.sensor.get_acq_start_ms())
+        period = self.sensor.sampling_period_ms
+        sample_ms = end_ms - (len(data_buf) - 1 - np.arange(len(data_buf), dtype=np.int64)) * period
+        data = np.asarray(data_buf, dtype=self.data_dtype)
+        for level in self._levels:
+            self._update_level(level, sample_ms, data)
+
+
+class RollupReader:
+    # Reads the levels written by Rollup. retrieve_buffer picks the coarsest level which still
+    # provides samples_needed points over last_ms, falling back to raw_reader (if set) when
+    # every level is too coarse
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: RollupConfig, sensor, level_readers: dict,
+                 raw_reader=None):
+        self.name = name
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.fqpn = fqpn
+        self.cfg = cfg
+        self.sensor = sensor
+        self.level_readers = level_readers
+        self.raw_reader = raw_reader
+
+    @property
+    def data_dtype(self):
+        return np.dtype(np.float64)
+
+    def get_level_reader(self, resolution_ms):
+        # coarsest level no larger than resolution_ms
+        levels = [level_ms for level_ms in self.level_readers.keys() if level_ms <= resolution_ms]
+        if not levels:
+            return None
+        return self.level_readers[max(levels)]
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace', stat: str = 'mean'):
+        reader = None
+        if last_ms > 0 and samples_needed > 0:
+            reader = self.get_level_reader(last_ms / samples_needed)
+        if reader is None:
+            if self.raw_reader is not None:
+                return self.raw_reader.retrieve_buffer(last_ms, samples_needed, decimation=decimation)
+            reader = self.level_readers[min(self.level_readers.keys())]
+        return reader.retrieve_buffer(last_ms, samples_needed, index=ROLLUP_STATS.index(stat),
+                                      decimation=decimation)
+
+    def get_last_acq(self, stat: str = 'mean'):
+        reader = self.level_readers[min(self.level_readers.keys())]
+        return reader.get_last_acq(index=ROLLUP_STATS.index(stat))
+
+    def get_all(self, level_s, start_ms=None, end_ms=None):
+        return self.level_readers[int(level_s * 1_000)].get_all(start_ms=start_ms, end_ms=end_ms)
+
+    def close(self):
+        for reader in self.level_readers.values():
+            reader.close()
+
+
+# order of the samples in each beat written by PulseAnalyzer
+BEAT_STATS = ('systolic', 'diastolic', 'mean', 'rate_bpm', 'pulsatility')
+
+
+class PulseAnalyzer(Strategy_ReadWrite.WriterStream):
+    # Detects each beat of a pulsatile stream (pressure or flow) and writes one record per beat
+    # with the stats in BEAT_STATS to a points file, timestamped (epoch ms) at the start of the
+    # beat. The pulsatility index is (systolic - diastolic) / mean. The buffer is passed on unchanged
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = PulseConfig()
+        self.data_dtype = np.dtype(np.float64)
+        self._writer = None
+        self._level = None
+        self._height = 0.0
+        self._above = False
+        # (start ms, max, min, sum, count) of the beat in progress
+        self._partial = None
+        self._samples_since_beat = 0
+        # samples (and their epoch ms) collected to (re)start the detection
+        self._seed_data = []
+        self._seed_ms = []
+
+    @classmethod
+    def get_config_type(cls):
+        return PulseConfig
+
+    @property
+    def is_segmented(self):
+        # nothing is written to the stream file, the beat writer segments its own file
+        return False
+
+    def get_reader(self):
+        return PulseReader(self.name, self.fqpn, self.cfg, self.sensor, self._writer.get_reader())
+
+    def open(self, sensor=None):
+        self._sync_writes()
+        self._base_path = PerfusionConfig.get_date_folder()
+        self._filename = pathlib.Path(f'{sensor.name}_{self.name}')
+        self.sensor = sensor
+        if self._writer is not None:
+            self._writer.close()
+        self._print_stream_info()
+
+        self._writer = Strategy_ReadWrite.WriterPoints(f'{self.name}Points')
+        self._writer.cfg = Strategy_ReadWrite.WriterPointsConfig(bytes_per_timestamp=8,
+                                                                 samples_per_timestamp=len(BEAT_STATS),
+                                                                 segment_interval_s=self.cfg.segment_interval_s,
+                                                                 segment_bytes=self.cfg.segment_bytes)
+        self._writer.open(sensor)
+        self.reset()
+
+    def close(self):
+        self._sync_writes()
+        if self._writer is not None:
+            self._writer.close()
+
+    def flush_pending(self, force: bool = False):
+        if self._writer is not None:
+            self._writer.flush_pending(force)
+
+    def reset(self):
+        self._level = None
+        self._height = 0.0
+        self._above = False
+        self._partial = None
+        self._samples_since_beat = 0
+        self._seed_data = []
+        self._seed_ms = []
+
+    @property
+    def _beat_limit(self):
+        # samples in the longest beat, no beat for longer restarts the detection
+        return int(np.ceil(60_000 / self.cfg.min_bpm / self.sensor.sampling_period_ms))
+
+    def _write_to_file(self, data_buf, t=None):
+        if t is None or len(data_buf) == 0:
+            return
+        # timestamps are for the last sample in the buffer
+        end_ms = self._get_index_time(t) + int(self.sensor.get_acq_start_ms())
+        period = self.sensor.sampling_period_ms
+        sample_ms = end_ms - (len(data_buf) - 1 - np.arange(len(data_buf), dtype=np.int64)) * period
+        data = np.asarray(data_buf, dtype=self.data_dtype)
+
+        # every decision is made at a sample, not at the end of a buffer, so the beats do not
+        # depend on how the stream is split into buffers
+        pos = 0
+        while pos < len(data):
+            if self._level is not None:
+                pos += self._scan(data[pos:], sample_ms[pos:])
+                continue
+            # (re)start from the mean and height of the longest beat from here, then scan those samples
+            needed = self._beat_limit - sum(len(part) for part in self._seed_data)
+            self._seed_data.append(data[pos:pos + needed])
+            self._seed_ms.append(sample_ms[pos:pos + needed])
+            pos += len(self._seed_data[-1])
+            if len(self._seed_data[-1]) < needed:
+                return
+            seed = np.concatenate(self._seed_data)
+            self._level = float(np.mean(seed))
+            self._height = float(np.ptp(seed))
+            data = np.concatenate((seed, data[pos:]))
+            sample_ms = np.concatenate((np.concatenate(self._seed_ms), sample_ms[pos:]))
+            self._seed_data = []
+            self._seed_ms = []
+            pos = 0
+
+    def _scan(self, data, sample_ms):
+        # processes samples with the current thresholds up to the end of the next beat or a restart
+        # returns the number of samples processed
+        # above the upper threshold is 1, below the lower is 0 and in between keeps the previous state
+        margin = self.cfg.hysteresis * self._height
+        state = np.full(len(data), -1, dtype=np.int8)
+        state[data >= self._level + margin] = 1
+        state[data <= self._level - margin] = 0
+        last_known = np.where(state >= 0, np.arange(len(data)), -1)
+        np.maximum.accumulate(last_known, out=last_known)
+        above = np.where(last_known >= 0, state[np.maximum(last_known, 0)], int(self._above)).astype(bool)
+        rising = np.flatnonzero(np.diff(np.concatenate(([self._above], above)).astype(np.int8)) == 1)
+        # the sample at which there has been no beat for too long
+        restart = max(self._beat_limit - self._samples_since_beat, 0)
+
+        if len(rising) > 0 and rising[0] <= restart:
+            edge = int(rising[0])
+            if self._partial is not None:
+                beat = self._add_to_partial(data[:edge])
+                self._write_beats([beat], [int(sample_ms[edge])])
+            # the beat starting at the edge, its samples are added by the next scan
+            self._partial = (int(sample_ms[edge]), -np.inf, np.inf, 0.0, 0)
+            self._above = True
+            self._samples_since_beat = 0
+            return edge
+        if restart < len(data):
+            self._level = None
+            self._above = False
+            self._partial = None
+            self._samples_since_beat = 0
+            return restart
+        if self._partial is not None:
+            self._partial = self._add_to_partial(data)
+        self._above = bool(above[-1])
+        self._samples_since_beat += len(data)
+        return len(data)
+
+    def _add_to_partial(self, data):
+        start_ms, b_max, b_min, b_sum, b_count = self._partial
+        if len(data) == 0:
+            return self._partial
+        return (start_ms, max(b_max, float(np.max(data))), min(b_min, float(np.min(data))),
+                b_sum + float(np.sum(data)), b_count + len(data))
+
+    def _write_beats(self, beats, end_ms):
+        for (start_ms, b_max, b_min, b_sum, b_count), b_end_ms in zip(beats, end_ms):
+            duration_ms = b_end_ms - start_ms
+            if b_count == 0 or duration_ms <= 0:
+                continue
+            rate_bpm = 60_000 / duration_ms
+            mean = b_sum / b_count
+            if self.cfg.min_bpm <= rate_bpm <= self.cfg.max_bpm:
+                pulsatility = (b_max - b_min) / mean if mean != 0 else np.nan
+                stats = np.array([b_max, b_min, mean, rate_bpm, pulsatility], dtype=self.data_dtype)
+                self._writer.process_buffer(stats, np.uint64(start_ms))
+            # follow slow changes in the signal from beat to beat
+            self._level = mean
+            self._height = b_max - b_min
+
+
+class PulseReader:
+    # Reads the beats written by PulseAnalyzer. The stat ('systolic', 'diastolic', 'mean',
+    # 'rate_bpm' or 'pulsatility') selects the value, so e.g. AutoFlow gets the mean of the
+    # last beat from get_last_acq
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: PulseConfig, sensor, beat_reader):
+        self.name = name
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.fqpn = fqpn
+        self.cfg = cfg
+        self.sensor = sensor
+        self.beat_reader = beat_reader
+
+    @property
+    def data_dtype(self):
+        return np.dtype(np.float64)
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace', stat: str = 'mean'):
+        return self.beat_reader.retrieve_buffer(last_ms, samples_needed, index=BEAT_STATS.index(stat),
+                                                decimation=decimation)
+
+    def get_last_acq(self, stat: str = 'mean'):
+        return self.beat_reader.get_last_acq(index=BEAT_STATS.index(stat))
+
+    def get_all(self, start_ms=None, end_ms=None, stat: str = None):
+        # every stat of each beat unless stat is given
+        index = None if stat is None else BEAT_STATS.index(stat)
+        return self.beat_reader.get_all(index, start_ms, end_ms)
+
+    def get_unread_count(self):
+        return self.beat_reader.get_unread_count()
+
+    def wait_for_data(self, beats: int = 1, timeout=None):
+        return self.beat_reader.wait_for_data(beats, timeout)
+
+    def get_new_data(self, stat: str = None):
+        index = None if stat is None else BEAT_STATS.index(stat)
+        return self.beat_reader.get_new_data(index)
+
+    def close(self):
+        self.beat_reader.close()
+
+
+class SpectrumAnalyzer(Strategy_ReadWrite.WriterStream):
+    # Periodically writes the power spectral density (units^2/Hz, one-sided, the same scaling as
+    # scipy.signal.welch) of a stream to a points file. Each record is the dominant frequency (Hz)
+    # and its amplitude (as a sine wave, DC excluded), followed by the density of each frequency
+    # bin, see get_frequencies. Records are timestamped (epoch ms) with the last sample used. All
+    # segments completed by a buffer are transformed in one rfft call and the samples of the next
+    # segment are carried in a preallocated buffer. The buffer is passed on unchanged
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = SpectrumConfig()
+        self.data_dtype = np.dtype(np.float64)
+        self._writer = None
+        self._window = None
+        self._work = None
+        self._carried = 0
+        self._power_sum = None
+        self._segments = 0
+
+    @classmethod
+    def get_config_type(cls):
+        return SpectrumConfig
+
+    @property
+    def is_segmented(self):
+        # nothing is written to the stream file, the spectrum writer segments its own file
+        return False
+
+    @property
+    def hop(self):
+        return max(int(round(self.cfg.segment_len * (1 - self.cfg.overlap))), 1)
+
+    def get_frequencies(self):
+        return np.fft.rfftfreq(self.cfg.segment_len, self.sensor.sampling_period_ms / 1_000)
+
+    def get_reader(self):
+        return SpectrumReader(self.name, self.fqpn, self.cfg, self.sensor, self._writer.get_reader(),
+                              self.get_frequencies())
+
+    def open(self, sensor=None):
+        self._sync_writes()
+        self._base_path = PerfusionConfig.get_date_folder()
+        self._filename = pathlib.Path(f'{sensor.name}_{self.name}')
+        self.sensor = sensor
+        if self._writer is not None:
+            self._writer.close()
+        self._print_stream_info()
+
+        self._writer = Strategy_ReadWrite.WriterPoints(f'{self.name}Points')
+        self._writer.cfg = Strategy_ReadWrite.WriterPointsConfig(bytes_per_timestamp=8,
+                                                                 samples_per_timestamp=2 + self.cfg.segment_len // 2 + 1,
+                                                                 segment_interval_s=self.cfg.segment_interval_s,
+                                                                 segment_bytes=self.cfg.segment_bytes,
+                                                                 # a ring of whole spectra would be tens of MB
+                                                                 # and spectra are only written every few seconds
+                                                                 ring_buffer_s=0)
+        self._writer.open(sensor)
+
+        self._window = np.hanning(self.cfg.segment_len + 1)[:-1]
+        fs = 1_000 / self.sensor.sampling_period_ms
+        # density scaling, doubled for the one-sided spectrum except DC and Nyquist
+        self._scale = np.full(self.cfg.segment_len // 2 + 1, 2 / (fs * np.sum(self._window ** 2)))
+        self._scale[0] /= 2
+        if self.cfg.segment_len % 2 == 0:
+            self._scale[-1] /= 2
+        self._power_sum = np.zeros(self.cfg.segment_len // 2 + 1)
+        self._work = np.zeros(self.cfg.segment_len * 2)
+        self.reset()
+
+    def close(self):
+        self._sync_writes()
+        if self._writer is not None:
+            self._writer.close()
+
+    def flush_pending(self, force: bool = False):
+        if self._writer is not None:
+            self._writer.flush_pending(force)
+
+    def reset(self):
+        self._carried = 0
+        self._segments = 0
+        if self._power_sum is not None:
+            self._power_sum[:] = 0
+
+    def _write_to_file(self, data_buf, t=None):
+        if t is None or len(data_buf) == 0:
+            return
+        # timestamps are for the last sample in the buffer
+        end_ms = self._get_index_time(t) + int(self.sensor.get_acq_start_ms())
+        period = self.sensor.sampling_period_ms
+        seg_len = self.cfg.segment_len
+
+        # append to the samples carried from the previous buffer, only growing the work buffer if needed
+        total = self._carried + len(data_buf)
+        if total > len(self._work):
+            work = np.zeros(max(total, 2 * len(self._work)))
+            work[:self._carried] = self._work[:self._carried]
+            self._work = work
+        self._work[self._carried:total] = data_buf
+
+        starts = np.arange(0, total - seg_len + 1, self.hop)
+        # each segment is used once, a partly averaged spectrum is carried to the next buffer
+        first = 0
+        while first < len(starts):
+            batch = starts[first:first + max(self.cfg.segments_per_spectrum - self._segments, 1)]
+            first += len(batch)
+            segments = sliding_window_view(self._work[:total], seg_len)[batch]
+            # remove the mean of each segment before windowing, as scipy.signal.welch does
+            segments = (segments - segments.mean(axis=1, keepdims=True)) * self._window
+            spectra = np.fft.rfft(segments, axis=1)
+            self._power_sum += np.sum(spectra.real ** 2 + spectra.imag ** 2, axis=0)
+            self._segments += len(batch)
+            if self._segments >= self.cfg.segments_per_spectrum:
+                last_sample = int(batch[-1]) + seg_len - 1
+                self._write_spectrum(end_ms - (total - 1 - last_sample) * period)
+
+        # keep the samples from the start of the next segment
+        next_start = int(starts[-1]) + self.hop if len(starts) > 0 else 0
+        next_start = min(next_start, total)
+        self._carried = total - next_start
+        self._work[:self._carried] = self._work[next_start:total]
+
+    def _write_spectrum(self, t_ms):
+        psd = self._power_sum * self._scale / self._segments
+        # the amplitude of a sine wave from its power, using the coherent gain of the window
+        mean_power = self._power_sum / self._segments
+        peak = int(np.argmax(mean_power[1:])) + 1 if len(mean_power) > 1 else 0
+        amplitude = 2 * np.sqrt(mean_power[peak]) / np.sum(self._window)
+        record = np.concatenate(([self.get_frequencies()[peak], amplitude], psd))
+        self._writer.process_buffer(record, np.uint64(t_ms))
+        self._power_sum[:] = 0
+        self._segments = 0
+
+
+class SpectrumReader:
+    # Reads the spectra written by SpectrumAnalyzer, get_last_acq returns the dominant
+    # frequency or its amplitude and get_last_spectrum the frequencies and density
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: SpectrumConfig, sensor, spectrum_reader, frequencies):
+        self.name = name
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.fqpn = fqpn
+        self.cfg = cfg
+        self.sensor = sensor
+        self.spectrum_reader = spectrum_reader
+        self.frequencies = frequencies
+
+    @property
+    def data_dtype(self):
+        return np.dtype(np.float64)
+
+    def get_last_acq(self, stat: str = 'dominant_hz'):
+        return self.spectrum_reader.get_last_acq(index=0 if stat == 'dominant_hz' else 1)
+
+    def get_last_spectrum(self):
+        ts, record = self.spectrum_reader.get_last_acq()
+        if ts is None:
+            return None, self.frequencies, None
+        return ts, self.frequencies, np.asarray(record[2:])
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace', stat: str = 'dominant_hz'):
+        return self.spectrum_reader.retrieve_buffer(last_ms, samples_needed, index=0 if stat == 'dominant_hz' else 1,
+                                                    decimation=decimation)
+
+    def get_all(self, start_ms=None, end_ms=None):
+        # timestamps and a 2-D array with the density of each spectrum
+        ts, records = self.spectrum_reader.get_all(None, start_ms, end_ms)
+        return ts, records[:, 2:]
+
+    def close(self):
+        self.spectrum_reader.close()
@@ -7,33 +7,113 @@
 This work was created by an employee of the US Federal Gov
 and under the public domain.
 """
+import io
 import pathlib
 import struct
+import zipfile
+import zlib
+import bisect
 import os
-from os import SEEK_CUR, SEEK_END, SEEK_SET
+import queue
+import time
+from collections import OrderedDict
+from os import SEEK_END, SEEK_SET
 from dataclasses import dataclass, asdict
 from datetime import datetime
+from threading import Lock, Condition, Thread
+from multiprocessing import shared_memory, resource_tracker
 import logging
 
 import numpy as np
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 import pyPerfusion.PerfusionConfig as PerfusionConfig
 import pyPerfusion.utils as utils
 
 
-# raw Writer does not have any parameters, but create a config class
-# for consistency
+# Each entry in the sidecar index (.idx) maps a timestamp to a byte offset in the data file
+# Stream files (WriterStream): time is ms since start of acquisition, offset is the last sample written
+# Points files (WriterPoints): time is the timestamp of the chunk, offset is the start of the chunk
+INDEX_DTYPE = np.dtype([('time', '>u8'), ('offset', '>u8')])
+
+# Compressed stream files (WriterCompressed) hold independently compressed chunks of samples.
+# Each entry in the chunk table (.ctbl) gives the location of a chunk in the data file and the
+# index of its first sample, so any sample is found without decompressing the rest of the file.
+# The sidecar index of a compressed file uses the offsets the samples would have uncompressed
+CHUNK_TABLE_DTYPE = np.dtype([('offset', '>u8'), ('nbytes', '>u8'), ('first_sample', '>u8'), ('samples', '>u8')])
+COMPRESSION_CODECS = ('zlib', 'lz4')
+
+# readers without a writer in the same process check the file for new data this often
+FOLLOW_POLL_S = 0.05
+
+# Ring buffers exported to shared memory (SharedRingBuffer) start with this header, followed by
+# the records at SHM_RECORDS_OFFSET. Records are a native uint64 'time' and 'data' of data_dtype,
+# with shape (samples_per_record,) for points files or a single sample (0) for streams.
+# total is the number of records written and is only updated after the records are in place.
+# sequence is odd while the writer is changing the records, a reader's copy is only valid if
+# sequence was even and unchanged for the whole copy
+SHM_HEADER_DTYPE = np.dtype([('version', '<u4'), ('samples_per_record', '<u4'), ('total', '<u8'),
+                             ('capacity', '<u8'), ('acq_start_ms', '<u8'), ('sampling_period_ms', '<f8'),
+                             ('data_dtype', 'S16'), ('sequence', '<u8')])
+SHM_VERSION = 2
+SHM_RECORDS_OFFSET = 64
+SHM_PREFIX = 'pyPerfusion_'
+# attempts to copy records from shared memory while the writer keeps changing them
+SHM_READ_RETRIES = 100
+
+# shared memory created by this process, a reader in the same process must leave it to the writer
+_created_shm_names = set()
+
+
 @dataclass
 class WriterConfig:
-    pass
+    # minimum time between entries in the sidecar index, 0 disables the index
+    index_interval_ms: int = 1_000
+    # By default every buffer is flushed as soon as it is written. Setting either flush limit
+    # buffers the writes until that much time has passed or that many bytes are pending.
+    # Readers only see flushed data and at most that much data is lost on a crash. Sensors call
+    # flush_pending each time they wake (about every 0.5 s) even without new data, so pending
+    # data is flushed (or fsynced) at most that long after its interval, and at once on stop
+    flush_interval_ms: int = 0
+    flush_bytes: int = 0
+    # periodically force the data to disk (0 leaves it to the OS)
+    fsync_interval_ms: int = 0
+    # Split the output into segments. A new segment is started every segment_interval_s
+    # (aligned to local time), once segment_bytes have been written and at midnight, in the
+    # folder for that day. The segments are listed in a manifest in the folder of the first
+    # segment and read back as one stream with SegmentedReader. 0 for both writes a single file
+    segment_interval_s: int = 0
+    segment_bytes: int = 0
+    # seconds of the most recent data kept in memory for live readers, 0 disables
+    # points writers assume at most one chunk every 10 ms when sizing the buffer
+    ring_buffer_s: int = 60
+    # export the ring buffer through shared memory for other processes, see SharedMemoryReader
+    shared_memory: bool = False
+    # write the file from the background AsyncWriter instead of the acquisition thread
+    # when the writer falls behind and its queue is full, wait for space or with async_drop
+    # drop the buffer (counted in dropped_buffers/dropped_samples)
+    async_write: bool = False
+    async_drop: bool = False
 
 
 @dataclass
-class WriterPointsConfig:
+class WriterPointsConfig(WriterConfig):
     bytes_per_timestamp: int = 4
     samples_per_timestamp: int = 1
 
 
+@dataclass
+class CompressedConfig(WriterConfig):
+    # samples in each compressed chunk, the last partial chunk is only written on close
+    chunk_samples: int = 8_192
+    # zlib, or lz4 if the lz4 package is installed
+    codec: str = 'zlib'
+    compression_level: int = 6
+
+
 @dataclass
 class ReaderStreamSensor:
     data_dtype: np.dtype = np.dtype('float64')
@@ -53,11 +133,31 @@ class ReaderPointsSensor:
         return self.acq_start_ms
 
 
+def is_compressed(filename):
+    # only the header of files written by WriterCompressed has a codec
+    settings_file = pathlib.Path(filename).with_suffix('.txt')
+    if not settings_file.exists():
+        return False
+    with open(settings_file) as reader:
+        return any(line.startswith('codec: ') for line in reader)
+
+
 def read_file(filename):
 
+    if pathlib.Path(filename).suffix == '.manifest':
+        if 'points' in str(filename).lower():
+            reader = SegmentedReaderPoints('Reader', filename, WriterPointsConfig())
+        else:
+            reader = SegmentedReader('Reader', filename, WriterConfig())
+        # each segment reads its own settings
+        return reader
+
     if 'points' in str(filename).lower():
         sensor = ReaderPointsSensor()
         reader = ReaderPoints('Reader', filename, WriterPointsConfig(), sensor)
+    elif is_compressed(filename):
+        sensor = ReaderStreamSensor()
+        reader = ReaderCompressed('Reader', pathlib.Path(filename), CompressedConfig(), sensor)
     else:
         sensor = ReaderStreamSensor()
         reader = Reader('Reader', filename, WriterConfig(), sensor)
@@ -67,25 +167,72 @@ def read_file(filename):
     return reader
 
 
-def convert_to_csv(reader):
-    ts, data = reader.get_all()
-    array_data = True
-    if type(reader) == Reader:
-        array_data = False
-        start_ts = reader.sensor.get_acq_start_ms()
+def _format_csv_time(epoch_ms):
+    # vectorized equivalent of str(datetime.fromtimestamp(t / 1000.0)) for a block of timestamps
+    epoch_us = np.round(np.asarray(epoch_ms, dtype=np.float64) * 1_000).astype(np.int64)
+    first, last = int(epoch_us[0]), int(epoch_us[-1])
+
+    def utc_offset_us(t_us):
+        return int(datetime.fromtimestamp(t_us / 1e6).astimezone().utcoffset().total_seconds() * 1e6)
+
+    if utc_offset_us(first) == utc_offset_us(last):
+        local_us = epoch_us + utc_offset_us(first)
+    else:
+        # block crosses a daylight savings change
+        local_us = epoch_us + np.array([utc_offset_us(t) for t in epoch_us], dtype=np.int64)
+    time_str = np.datetime_as_string(local_us.astype('datetime64[us]'), unit='us')
+    return np.char.replace(time_str, 'T', ' ')
+
+
+def iter_blocks(reader, start_ms=None, end_ms=None, columns=None, chunk_len: int = 100_000):
+    # Generates (epoch ms, 2-D samples) for reader in blocks of at most chunk_len rows, so files
+    # of any length can be exported with constant memory. start_ms/end_ms are epoch ms and select
+    # [start_ms, end_ms), columns selects which samples of each chunk in a points file are used
+    if isinstance(reader, SegmentedReader):
+        # each segment is a complete file with its own start of acquisition
+        for segment in reader._get_overlapping(start_ms, end_ms):
+            yield from iter_blocks(reader._get_reader(segment), start_ms, end_ms, columns, chunk_len)
+        return
+
+    if isinstance(reader, ReaderPoints):
+        chunks = reader._open_chunks()
+        if chunks is None:
+            return
+        start_idx = 0 if start_ms is None else bisect.bisect_left(chunks['time'], start_ms)
+        end_idx = len(chunks) if end_ms is None else bisect.bisect_left(chunks['time'], end_ms)
     else:
-        data = data.reshape(-1, reader.sensor.samples_per_timestamp)
-        start_ts = 0
-    csv = ''
-    for t, d in zip(ts, data):
-        if array_data:
-            data_str = ','.join(map(str, d))
-        # else:
-        #     data_str = f'{d}'
+        data = reader._open_mmap()
+        if data is None:
+            return
+        start_ts = reader.sensor.get_acq_start_ms()
+        start_idx = 0 if start_ms is None else reader.get_sample_index(start_ms - start_ts)
+        end_idx = len(data) if end_ms is None else min(reader.get_sample_index(end_ms - start_ts), len(data))
+
+    for block_start in range(start_idx, end_idx, chunk_len):
+        block_end = min(block_start + chunk_len, end_idx)
+        if isinstance(reader, ReaderPoints):
+            ts = chunks['time'][block_start:block_end].astype(np.float64)
+            values = chunks['data'][block_start:block_end]
+            if columns is not None:
+                values = values[:, columns]
+        else:
+            ts = reader.get_sample_times(np.arange(block_start, block_end)) + start_ts
+            values = data[block_start:block_end].reshape(-1, 1)
+        yield ts, values
+
+
+def iter_csv_blocks(reader, start_ms=None, end_ms=None, columns=None, chunk_len: int = 100_000):
+    # CSV text for each block from iter_blocks
+    for ts, values in iter_blocks(reader, start_ms, end_ms, columns, chunk_len):
+        data_str = values[:, 0].astype(str)
+        for col in range(1, values.shape[1]):
+            data_str = np.char.add(np.char.add(data_str, ','), values[:, col].astype(str))
+        rows = np.char.add(np.char.add(_format_csv_time(ts), ', '), data_str)
+        yield '\n'.join(rows.tolist()) + '\n'
 
-        csv += f'{datetime.fromtimestamp((start_ts + t) / 1000.0)}, {data_str}\n'
 
-    return csv
+def convert_to_csv(reader, start_ms=None, end_ms=None, columns=None):
+    return ''.join(iter_csv_blocks(reader, start_ms, end_ms, columns))
 
 
 def get_standard_filename(date_str, sensor_name, output_type):
@@ -96,30 +243,762 @@ def get_standard_filename(date_str, sensor_name, output_type):
     return fqpn
 
 
-def save_to_csv(filename):
+def save_to_csv(filename, start_ms=None, end_ms=None, columns=None, csv_filename=None):
     reader = read_file(filename)
-    ts, data = reader.get_all()
-
-    array_data = True
-    if type(reader) == Reader:
-        array_data = False
-        start_ts = reader.sensor.get_acq_start_ms()
+    if csv_filename is None:
+        csv_filename = reader.fqpn.with_suffix('.csv')
+
+    with open(csv_filename, 'wt') as csv_file:
+        for block in iter_csv_blocks(reader, start_ms, end_ms, columns):
+            csv_file.write(block)
+    reader.close()
+
+
+# Columnar export
+# Each file is an uncompressed npz (zip of .npy members) so numpy loads members lazily:
+#   columns                    names of the exported columns
+#   chunk_start_ms/_end_ms     time bounds (epoch ms) of each chunk
+#   chunk_count                rows in each chunk
+#   chunk_min/_max/_mean       per chunk (row) and column statistics
+#   time_#####, <column>_#####  epoch ms and values of each chunk
+# Readers can use the statistics to skip whole chunks and only load the columns they need
+def _write_npz_member(zf, name, array):
+    with zf.open(f'{name}.npy', 'w', force_zip64=True) as fid:
+        np.lib.format.write_array(fid, np.asanyarray(array), allow_pickle=False)
+
+
+def save_to_columnar(filename, column_names=None, start_ms=None, end_ms=None, columns=None,
+                     chunk_len: int = 100_000, npz_filename=None):
+    reader = read_file(filename)
+    if npz_filename is None:
+        npz_filename = reader.fqpn.with_suffix('.npz')
+
+    stats = {'chunk_start_ms': [], 'chunk_end_ms': [], 'chunk_count': [],
+             'chunk_min': [], 'chunk_max': [], 'chunk_mean': []}
+    names = None
+    with zipfile.ZipFile(npz_filename, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for chunk_idx, (ts, values) in enumerate(iter_blocks(reader, start_ms, end_ms, columns, chunk_len)):
+            if names is None:
+                if column_names is None:
+                    names = [reader.fqpn.stem] if values.shape[1] == 1 \
+                        else [f'{reader.fqpn.stem}_{col}' for col in range(values.shape[1])]
+                else:
+                    names = list(column_names)
+            _write_npz_member(zf, f'time_{chunk_idx:05d}', ts)
+            for col, name in enumerate(names):
+                _write_npz_member(zf, f'{name}_{chunk_idx:05d}', np.ascontiguousarray(values[:, col]))
+            stats['chunk_start_ms'].append(ts[0])
+            stats['chunk_end_ms'].append(ts[-1])
+            stats['chunk_count'].append(len(ts))
+            stats['chunk_min'].append(np.nanmin(values, axis=0))
+            stats['chunk_max'].append(np.nanmax(values, axis=0))
+            stats['chunk_mean'].append(np.nanmean(values, axis=0))
+
+        _write_npz_member(zf, 'columns', np.array(names if names else [], dtype=str))
+        for key, value in stats.items():
+            _write_npz_member(zf, key, np.array(value))
+    reader.close()
+    return npz_filename
+
+
+def _read_columnar_stats(npz):
+    keys = ('columns', 'chunk_start_ms', 'chunk_end_ms', 'chunk_count', 'chunk_min', 'chunk_max', 'chunk_mean')
+    return {key: npz[key] for key in keys}
+
+
+def read_columnar_stats(npz_filename):
+    with np.load(npz_filename) as npz:
+        stats = _read_columnar_stats(npz)
+    return stats
+
+
+def read_columnar(npz_filename, columns=None, start_ms=None, end_ms=None, chunk_filter=None):
+    # columns is a list of column names to load (default all)
+    # chunk_filter is called with the dict from read_columnar_stats and returns a boolean
+    # array selecting the chunks to load, e.g. lambda s: s['chunk_max'][:, 0] > 100
+    # returns epoch ms and a 2-D array with one column for each requested column
+    with np.load(npz_filename) as npz:
+        stats = _read_columnar_stats(npz)
+        names = list(stats['columns']) if columns is None else list(columns)
+        keep = np.ones(len(stats['chunk_count']), dtype=bool)
+        if start_ms is not None:
+            keep &= stats['chunk_end_ms'] >= start_ms
+        if end_ms is not None:
+            keep &= stats['chunk_start_ms'] < end_ms
+        if chunk_filter is not None:
+            keep &= np.asarray(chunk_filter(stats), dtype=bool)
+
+        all_ts = []
+        all_values = []
+        for chunk_idx in np.flatnonzero(keep):
+            ts = npz[f'time_{chunk_idx:05d}']
+            values = np.column_stack([npz[f'{name}_{chunk_idx:05d}'] for name in names])
+            rows = np.ones(len(ts), dtype=bool)
+            if start_ms is not None:
+                rows &= ts >= start_ms
+            if end_ms is not None:
+                rows &= ts < end_ms
+            all_ts.append(ts[rows])
+            all_values.append(values[rows])
+
+    if not all_ts:
+        return np.zeros(0, dtype=np.float64), np.zeros((0, len(names)), dtype=np.float64)
+    return np.concatenate(all_ts), np.concatenate(all_values)
+
+
+# Aligned queries
+# Several sensors are sampled onto one time grid so they can be combined row by row:
+#   streams are linearly interpolated between neighbouring samples, grid times which fall
+#   in a gap (more than 1.5 sampling periods between samples) or outside the data are NaN
+#   points are joined as-of the grid time, i.e. the last chunk at or before it is carried forward
+def _is_points_reader(reader):
+    return isinstance(reader, (ReaderPoints, SegmentedReaderPoints))
+
+
+def _get_reader_acq_start_ms(reader):
+    if isinstance(reader, SegmentedReader):
+        return reader.get_acq_start_ms()
+    return reader.sensor.get_acq_start_ms()
+
+
+def resample_stream(data_time, data, grid_ms, max_gap_ms=None):
+    # data_time and grid_ms in the same units, data_time in increasing order
+    data_time = np.asarray(data_time, dtype=np.float64)
+    data = np.asarray(data, dtype=np.float64)
+    result = np.full(len(grid_ms), np.nan)
+    if len(data_time) == 0:
+        return result
+    if max_gap_ms is None:
+        max_gap_ms = 1.5 * float(np.median(np.diff(data_time))) if len(data_time) > 1 else 0
+
+    last = len(data_time) - 1
+    right = np.searchsorted(data_time, grid_ms, side='left')
+    left_idx = np.clip(right - 1, 0, last)
+    right_idx = np.clip(right, 0, last)
+    exact = (right <= last) & (data_time[right_idx] == grid_ms)
+    dt = data_time[right_idx] - data_time[left_idx]
+    inside = (right > 0) & (right <= last) & (dt <= max_gap_ms)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(dt > 0, (grid_ms - data_time[left_idx]) / dt, 0)
+    interp = data[left_idx] + frac * (data[right_idx] - data[left_idx])
+    result[inside] = interp[inside]
+    result[exact] = data[right_idx[exact]]
+    return result
+
+
+def join_points(data_time, data, grid_ms, max_age_ms=None):
+    # as-of join, max_age_ms limits how long a chunk is carried forward
+    data_time = np.asarray(data_time, dtype=np.float64)
+    result = np.full(len(grid_ms), np.nan)
+    if len(data_time) == 0:
+        return result
+    idx = np.searchsorted(data_time, grid_ms, side='right') - 1
+    valid = idx >= 0
+    if max_age_ms is not None:
+        valid &= grid_ms - data_time[np.maximum(idx, 0)] <= max_age_ms
+    result[valid] = np.asarray(data, dtype=np.float64)[idx[valid]]
+    return result
+
+
+def align_readers(series, start_ms, end_ms, period_ms=None, max_age_ms=None):
+    # series is a list of (reader, column), column selects the sample of each chunk of a points
+    # reader and is ignored for streams. start_ms/end_ms are epoch ms and select [start_ms, end_ms)
+    # returns the epoch ms of the grid and a 2-D array with one column for each entry in series
+    # the grid period defaults to the shortest sampling period of the streams (1 s for only points)
+    parts = []
+    for reader, column in series:
+        if _is_points_reader(reader):
+            # the last chunk before start_ms is needed to fill the start of the grid
+            data_time, data = reader.get_all(column, None, end_ms)
+            parts.append((True, np.asarray(data_time, dtype=np.float64), data))
+        else:
+            acq_start_ms = _get_reader_acq_start_ms(reader)
+            # one sample either side of the range is needed to interpolate the ends of the grid
+            pad_ms = 1_000 if period_ms is None else max(period_ms, 1_000)
+            data_time, data = reader.get_all(start_ms - acq_start_ms - pad_ms, end_ms - acq_start_ms + pad_ms)
+            parts.append((False, np.asarray(data_time, dtype=np.float64) + acq_start_ms, data))
+
+    if period_ms is None:
+        periods = [float(np.median(np.diff(data_time))) for is_points, data_time, _ in parts
+                   if not is_points and len(data_time) > 1]
+        period_ms = min(periods) if periods else 1_000
+    grid_ms = np.arange(start_ms, end_ms, period_ms, dtype=np.float64)
+
+    aligned = np.empty((len(grid_ms), len(parts)), dtype=np.float64)
+    for col, (is_points, data_time, data) in enumerate(parts):
+        if is_points:
+            aligned[:, col] = join_points(data_time, data, grid_ms, max_age_ms)
+        else:
+            aligned[:, col] = resample_stream(data_time, data, grid_ms)
+    return grid_ms, aligned
+
+
+def get_aligned(date_str, series, start_ms, end_ms, period_ms=None, max_age_ms=None):
+    # series is a list of (sensor name, output type, column) saved in the folder for date_str
+    # segmented outputs are read through their manifest
+    readers = []
+    for sensor_name, output_type, column in series:
+        fqpn = get_standard_filename(date_str, sensor_name, output_type)
+        if not fqpn.exists() and fqpn.with_suffix('.manifest').exists():
+            fqpn = fqpn.with_suffix('.manifest')
+        readers.append((read_file(fqpn), column))
+    try:
+        return align_readers(readers, start_ms, end_ms, period_ms, max_age_ms)
+    finally:
+        for reader, _ in readers:
+            reader.close()
+
+
+# Decimation modes for retrieve_buffer when more samples exist than requested
+#   linspace: evenly spaced samples, fastest but aliases waveforms and hides short spikes
+#   minmax: the min and max of each bucket, so every excursion is shown
+#   lttb: Largest-Triangle-Three-Buckets, one sample per bucket chosen to preserve the shape
+DECIMATION_MODES = ('linspace', 'minmax', 'lttb')
+
+
+def decimate_minmax(data, samples_needed: int):
+    # returns the indices of the min and max sample in each bucket, in time order
+    total = len(data)
+    buckets = samples_needed // 2
+    if total <= samples_needed or buckets == 0:
+        return np.arange(total)
+    bucket_len = total // buckets
+    # equal sized buckets aligned to the newest sample, the oldest remainder is dropped
+    offset = total - buckets * bucket_len
+    values = np.asarray(data[offset:]).reshape(buckets, bucket_len)
+    start = np.arange(buckets) * bucket_len + offset
+    idx = np.stack([start + np.argmin(values, axis=1), start + np.argmax(values, axis=1)], axis=1)
+    return np.sort(idx, axis=1).reshape(-1)
+
+
+def decimate_lttb(data, samples_needed: int):
+    # returns the indices selected by Largest-Triangle-Three-Buckets, always
+    # including the first and last sample. x is the sample index
+    total = len(data)
+    if total <= samples_needed or samples_needed < 3:
+        return np.arange(total)
+    data = np.asarray(data, dtype=np.float64)
+    edges = (np.arange(samples_needed - 1) * (total - 2) / (samples_needed - 2)).astype(np.int64) + 1
+    edges[-1] = total - 1
+    # the average of each bucket, the last "bucket" is the last sample
+    bucket_avg_y = np.append(np.add.reduceat(data[1:total - 1], edges[:-1] - 1) / np.diff(edges), data[-1])
+    bucket_avg_x = np.append((edges[:-1] + edges[1:] - 1) / 2.0, total - 1)
+
+    idx = np.zeros(samples_needed, dtype=np.int64)
+    idx[-1] = total - 1
+    a = 0
+    for bucket in range(samples_needed - 2):
+        x = np.arange(edges[bucket], edges[bucket + 1])
+        area = np.abs((a - bucket_avg_x[bucket + 1]) * (data[x] - data[a]) -
+                      (a - x) * (bucket_avg_y[bucket + 1] - data[a]))
+        a = x[np.argmax(area)]
+        idx[bucket + 1] = a
+    return idx
+
+
+def decimate(data, samples_needed: int, decimation: str = 'linspace'):
+    # returns the indices of the samples to keep
+    if decimation == 'minmax':
+        return decimate_minmax(data, samples_needed)
+    elif decimation == 'lttb':
+        return decimate_lttb(data, samples_needed)
+    return np.linspace(0, len(data) - 1, min(samples_needed, len(data)), dtype=np.uint64)
+
+
+def encode_chunk(data, codec: str = 'zlib', level: int = 6):
+    # XOR the bits of consecutive floats (or subtract consecutive integers) so slowly varying
+    # signals become mostly zero bits, then group the bytes by significance so the zeros are
+    # contiguous before compressing. Each chunk starts from zero so it can be decoded on its own
+    bits = np.ascontiguousarray(data).view(f'u{data.dtype.itemsize}')
+    prev = np.zeros_like(bits)
+    prev[1:] = bits[:-1]
+    encoded = bits ^ prev if data.dtype.kind == 'f' else bits - prev
+    shuffled = encoded.view(np.uint8).reshape(-1, data.dtype.itemsize).T.tobytes()
+    if codec == 'lz4':
+        return lz4.frame.compress(shuffled, compression_level=level)
+    return zlib.compress(shuffled, level)
+
+
+def decode_chunk(payload, dtype: np.dtype, codec: str = 'zlib'):
+    shuffled = lz4.frame.decompress(payload) if codec == 'lz4' else zlib.decompress(payload)
+    encoded = np.frombuffer(shuffled, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy()
+    encoded = encoded.view(f'u{dtype.itemsize}').reshape(-1)
+    if dtype.kind == 'f':
+        bits = np.bitwise_xor.accumulate(encoded)
     else:
-        data = data.reshape(-1, reader.sensor.samples_per_timestamp)
-        start_ts = 0
+        bits = np.cumsum(encoded, dtype=encoded.dtype)
+    return bits.view(dtype)
+
+
+class MemmapCache:
+    # Keeps one read-only memory map per file so readers do not open/mmap/close the file
+    # on every call. The file is only remapped when it has grown (or been recreated).
+    # A writer shares one cache between all of its readers, the maps are released once
+    # every reader has closed or the writer is closed/reopened
+    def __init__(self):
+        self._lock = Lock()
+        self._maps = {}
+        self._readers = set()
+
+    def register(self, reader):
+        with self._lock:
+            self._readers.add(id(reader))
+
+    def release(self, reader):
+        with self._lock:
+            self._readers.discard(id(reader))
+            if not self._readers:
+                self._maps = {}
+
+    def clear(self):
+        with self._lock:
+            self._maps = {}
+
+    def get(self, fqpn: pathlib.Path, dtype: np.dtype):
+        # do not assume a full sample/chunk has been written to the file
+        try:
+            total_items = os.path.getsize(fqpn) // dtype.itemsize
+        except OSError:
+            total_items = 0
+        key = (str(fqpn), dtype)
+        with self._lock:
+            data = self._maps.get(key, None)
+            if data is None or len(data) != total_items:
+                if total_items == 0:
+                    # cannot mmap an empty file
+                    # this can happen if attempting to read a file before the first data was written
+                    data = None
+                    self._maps.pop(key, None)
+                else:
+                    data = np.memmap(fqpn, dtype=dtype, mode='r', shape=(total_items,))
+                    self._maps[key] = data
+        return data
+
+
+class RingBuffer:
+    # Fixed size history of the most recent records written by a strategy, so live readers
+    # are served from memory. records is a structured array with a 'time' field, times are
+    # the same as returned by the strategy's reader. A single lock is held only while copying
+    def __init__(self, capacity: int, dtype: np.dtype, records: np.ndarray = None):
+        self._lock = Lock()
+        self._records = np.zeros(capacity, dtype=dtype) if records is None else records
+        self._total = 0
+
+    def close(self):
+        pass
+
+    @property
+    def capacity(self):
+        return len(self._records)
+
+    @property
+    def dtype(self):
+        return self._records.dtype
+
+    def append(self, records):
+        total = len(records)
+        records = records[-self.capacity:]
+        with self._lock:
+            pos = (self._total + total - len(records)) % self.capacity
+            first = min(len(records), self.capacity - pos)
+            self._records[pos:pos + first] = records[:first]
+            self._records[:len(records) - first] = records[first:]
+            self._total += total
+
+    def _get_records(self):
+        # the records in the order they were written and whether they are everything written
+        with self._lock:
+            if self._total <= self.capacity:
+                return self._records[:self._total].copy(), True
+            pos = self._total % self.capacity
+            return np.concatenate((self._records[pos:], self._records[:pos])), False
+
+    def get_last(self, count: int):
+        # the last count records, or None if more have been written than the buffer holds
+        records, complete = self._get_records()
+        if len(records) == 0 or (len(records) < count and not complete):
+            return None
+        return records[-count:]
+
+    def get_since(self, start_ms):
+        # records at or after start_ms, or None if older records may have been overwritten
+        records, complete = self._get_records()
+        if len(records) == 0 or (not complete and records['time'][0] > start_ms):
+            return None
+        return records[bisect.bisect_left(records['time'], start_ms):]
+
+    def get_all(self):
+        records, complete = self._get_records()
+        return records if complete and len(records) > 0 else None
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace'):
+        # same selection as Reader.retrieve_buffer, None if the ring does not hold the whole request
+        if last_ms == 0:
+            records = self.get_last(samples_needed)
+            return None if records is None else (records['time'], records['data'])
+        if last_ms > 0:
+            last = self.get_last(1)
+            records = None if last is None else self.get_since(int(last['time'][0]) - last_ms)
+        else:
+            records = self.get_all()
+        if records is None:
+            return None
+        samples_needed = min(samples_needed, len(records))
+        if decimation == 'linspace':
+            idx = np.linspace(0, len(records) - 1, samples_needed, dtype=np.uint64)
+        else:
+            idx = decimate(records['data'], samples_needed, decimation)
+        return records['time'][idx], records['data'][idx]
+
+
+def get_shared_memory_name(sensor_name: str, strategy_name: str):
+    return f'{SHM_PREFIX}{sensor_name}_{strategy_name}'.replace(' ', '_')
+
+
+def get_shm_record_dtype(data_dtype, samples_per_record: int = 0):
+    if samples_per_record > 0:
+        return np.dtype([('time', np.uint64), ('data', data_dtype, (samples_per_record,))])
+    return np.dtype([('time', np.uint64), ('data', data_dtype)])
+
+
+class SharedRingBuffer(RingBuffer):
+    # RingBuffer kept in shared memory so other processes can map the same records, see
+    # SharedMemoryReader. Only the writer's process appends, so no lock is shared between processes
+    def __init__(self, name: str, capacity: int, dtype: np.dtype, sensor):
+        self._lgr = utils.get_object_logger(__name__, name)
+        self._sensor = sensor
+        size = SHM_RECORDS_OFFSET + capacity * dtype.itemsize
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a writer which did not close, e.g. after a crash
+            self._lgr.warning(f'replacing existing shared memory {name}')
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created_shm_names.add(self._shm.name)
+        self._header = np.ndarray((1,), dtype=SHM_HEADER_DTYPE, buffer=self._shm.buf)
+        self._header[0] = (SHM_VERSION, dtype['data'].shape[0] if dtype['data'].shape else 0, 0, capacity,
+                           0, getattr(sensor, 'sampling_period_ms', 0), dtype['data'].base.str, 0)
+        super().__init__(capacity, dtype,
+                         np.ndarray((capacity,), dtype=dtype, buffer=self._shm.buf, offset=SHM_RECORDS_OFFSET))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def append(self, records):
+        # sequence is odd until the records and total are both updated
+        self._header['sequence'][0] += 1
+        super().append(records)
+        self._header['acq_start_ms'][0] = int(self._sensor.get_acq_start_ms())
+        # publish the new total last, readers use it to decide which records are valid
+        self._header['total'][0] = self._total
+        self._header['sequence'][0] += 1
+
+    def close(self):
+        self._header = None
+        self._records = None
+        self._shm.close()
+        _created_shm_names.discard(self._shm.name)
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryReader(RingBuffer):
+    # Reads a SharedRingBuffer exported by another process, e.g.
+    #   reader = SharedMemoryReader(get_shared_memory_name('Hepatic Artery Flow', 'Raw'))
+    #   data_time, data = reader.retrieve_buffer(5_000, 500)
+    # Nothing is locked: records are copied and the copy is retried if the writer changed them
+    # meanwhile, see SHM_HEADER_DTYPE. records and total give zero-copy access to the shared arrays
+    def __init__(self, name: str):
+        self.name = name
+        self._lgr = utils.get_object_logger(__name__, name)
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if os.name == 'posix' and self._shm.name not in _created_shm_names:
+                # before Python 3.13, attaching registers the memory to be removed when this process
+                # exits. A writer in this process has already registered it and unregisters it when
+                # it unlinks the memory, so only unregister memory from another process
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._header = np.ndarray((1,), dtype=SHM_HEADER_DTYPE, buffer=self._shm.buf)
+        header = self._header[0]
+        if int(header['version']) != SHM_VERSION:
+            self._shm.close()
+            raise ValueError(f'{name} is shared memory version {int(header["version"])}, expected {SHM_VERSION}')
+        dtype = get_shm_record_dtype(np.dtype(header['data_dtype'].decode()), int(header['samples_per_record']))
+        super().__init__(int(header['capacity']), dtype,
+                         np.ndarray((int(header['capacity']),), dtype=dtype, buffer=self._shm.buf,
+                                    offset=SHM_RECORDS_OFFSET))
+        self._read_total = 0
 
-    with open(reader.fqpn.with_suffix('.csv'), 'wt') as csv_file:
-        for t, d in zip(ts, data):
-            if array_data:
-                data_str = ','.join(map(str, d))
+    def close(self):
+        self._header = None
+        self._records = None
+        self._shm.close()
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def total(self):
+        return int(self._header['total'][0])
+
+    @property
+    def data_dtype(self):
+        return self._records.dtype['data'].base
+
+    @property
+    def sampling_period_ms(self):
+        return float(self._header['sampling_period_ms'][0])
+
+    def get_acq_start_ms(self):
+        return int(self._header['acq_start_ms'][0])
+
+    def append(self, records):
+        raise TypeError('SharedMemoryReader is read only')
+
+    @property
+    def sequence(self):
+        return int(self._header['sequence'][0])
+
+    def _copy_records(self, first_total: int):
+        # copies the records written after first_total (at most capacity), oldest first
+        for attempt in range(SHM_READ_RETRIES):
+            sequence = self.sequence
+            if sequence % 2 == 1:
+                # the writer is part way through an append
+                time.sleep(0)
+                continue
+            total = self.total
+            start_total = max(first_total, total - self.capacity)
+            start, end = start_total % self.capacity, total % self.capacity
+            if total - start_total == 0:
+                records = self._records[:0].copy()
+            elif start < end:
+                records = self._records[start:end].copy()
             else:
-                data_str = f'{d}'
+                records = np.concatenate((self._records[start:], self._records[:end]))
+            if self.sequence == sequence:
+                return records, start_total, total
+        # nothing could be copied while the writer was idle, nothing is read
+        self._lgr.warning(f'{self.name}: records kept changing while being copied')
+        return self._records[:0].copy(), first_total, first_total
+
+    def _get_records(self):
+        # only what is in the buffer is available to another process, so treat it as complete
+        records, _, _ = self._copy_records(0)
+        return records, True
+
+    def get_new_data(self):
+        # records written since the previous call and how many were overwritten before being read
+        records, first_total, total = self._copy_records(self._read_total)
+        dropped = first_total - self._read_total
+        self._read_total = total
+        return records['time'], records['data'], dropped
+
+    def get_last_acq(self):
+        last = self.get_last(1)
+        if last is None:
+            return None, None
+        return last['time'][0], last['data'][0]
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace'):
+        result = super().retrieve_buffer(last_ms, samples_needed, decimation)
+        return ([], []) if result is None else result
+
+
+class WriteNotifier:
+    # Raised by a writer each time new data is visible to its readers, so readers in the
+    # same process can block until data arrives instead of polling the file
+    def __init__(self):
+        self._cond = Condition()
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    def notify(self):
+        with self._cond:
+            self._count += 1
+            self._cond.notify_all()
+
+    def wait(self, count: int, timeout=None):
+        # blocks until the writer notifies after count was read, returns the new count
+        with self._cond:
+            self._cond.wait_for(lambda: self._count != count, timeout)
+            return self._count
+
+
+@dataclass
+class AsyncWriterMetrics:
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    batches: int = 0
+    buffers_written: int = 0
+    buffers_dropped: int = 0
+    samples_dropped: int = 0
+    # total time process_buffer waited for space in the queue
+    blocked_s: float = 0
+    # time from queueing a buffer until it has been written and flushed
+    last_latency_ms: float = 0
+    mean_latency_ms: float = 0
+    max_latency_ms: float = 0
+
+
+class AsyncWriter:
+    # A background thread which performs the file writes of every strategy with cfg.async_write,
+    # so a slow disk does not hold up Sensor.run and the rest of the strategy chain. Buffers are
+    # queued in a bounded queue, and all buffers waiting in the queue are written as one batch
+    # with each file flushed once per batch. One writer is shared by the process, see get_async_writer
+    def __init__(self, max_queue: int = 1_000, max_batch: int = 256):
+        self._lgr = utils.get_object_logger(__name__, 'AsyncWriter')
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._max_batch = max_batch
+        self._metrics = AsyncWriterMetrics()
+        self._metrics_lock = Lock()
+        self._latency_total_ms = 0.0
+        self._thread = None
+        self._thread_lock = Lock()
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self.run, daemon=True)
+                self._thread.name = f'{__name__} AsyncWriter'
+                self._thread.start()
+
+    def submit(self, writer, data_buf, t=None, drop: bool = False):
+        # returns False if the buffer was dropped because the queue is full
+        self._start()
+        item = (writer, data_buf, t, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if drop:
+                with self._metrics_lock:
+                    self._metrics.buffers_dropped += 1
+                    self._metrics.samples_dropped += len(data_buf)
+                return False
+            # backpressure, wait for the writer to catch up
+            start = time.perf_counter()
+            self._queue.put(item)
+            with self._metrics_lock:
+                self._metrics.blocked_s += time.perf_counter() - start
+        with self._metrics_lock:
+            self._metrics.max_queue_depth = max(self._metrics.max_queue_depth, self._queue.qsize())
+        return True
+
+    def submit_flush(self, writer, force: bool = False):
+        # asks the writer thread to apply writer's flush/fsync intervals, e.g. when no data is arriving
+        # skipped if the queue is full, as the queued buffers are flushed when they are written
+        self._start()
+        try:
+            self._queue.put_nowait((writer, None, force, time.perf_counter()))
+        except queue.Full:
+            pass
+
+    def run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch):
+        writers = {}
+        forced = set()
+        for writer, data_buf, t, queued in batch:
+            writers[id(writer)] = writer
+            if data_buf is None:
+                # from submit_flush, t is whether to force the flush
+                if t:
+                    forced.add(id(writer))
+                continue
+            writer._batching = True
+            try:
+                writer._write_async(data_buf, t)
+            except Exception as e:
+                self._lgr.error(f'{writer.name}: {e}')
+        for writer in writers.values():
+            writer._batching = False
+            if writer._fid is not None:
+                writer._flush(0, id(writer) in forced)
+
+        now = time.perf_counter()
+        latencies = [(now - queued) * 1_000 for _, data_buf, _, queued in batch if data_buf is not None]
+        if not latencies:
+            return
+        with self._metrics_lock:
+            self._metrics.batches += 1
+            # flush markers from submit_flush are not buffers
+            self._metrics.buffers_written += len(latencies)
+            self._latency_total_ms += sum(latencies)
+            self._metrics.last_latency_ms = latencies[-1]
+            self._metrics.mean_latency_ms = self._latency_total_ms / self._metrics.buffers_written
+            self._metrics.max_latency_ms = max(self._metrics.max_latency_ms, max(latencies))
+
+    def sync(self):
+        # blocks until every queued buffer has been written
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            metrics = AsyncWriterMetrics(**asdict(self._metrics))
+        metrics.queue_depth = self._queue.qsize()
+        return metrics
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self._metrics = AsyncWriterMetrics()
+            self._latency_total_ms = 0.0
+
+
+_ASYNC_WRITER = None
+_ASYNC_WRITER_LOCK = Lock()
+
+
+def get_async_writer():
+    global _ASYNC_WRITER
+    with _ASYNC_WRITER_LOCK:
+        if _ASYNC_WRITER is None:
+            _ASYNC_WRITER = AsyncWriter()
+        return _ASYNC_WRITER
+
+
+def wait_for_data(reader, notifier: WriteNotifier = None, records: int = 1, timeout=None):
+    # Blocks until reader has at least records unread, see Reader.wait_for_data
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        # read the count before checking, so a write in between is not missed
+        count = notifier.count if notifier else None
+        if reader.get_unread_count() >= records:
+            return True
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return False
+        if notifier:
+            notifier.wait(count, remaining)
+        else:
+            time.sleep(FOLLOW_POLL_S if remaining is None else min(FOLLOW_POLL_S, remaining))
 
-            csv = f'{datetime.fromtimestamp((start_ts + t)/ 1000.0)}, {data_str}\n'
-            csv_file.write(csv)
 
 class Reader:
-    def __init__(self, name: str, fqpn: pathlib.Path, cfg: WriterConfig, sensor):
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: WriterConfig, sensor, cache: MemmapCache = None,
+                 notifier: WriteNotifier = None, ring: RingBuffer = None):
         self.name = name
         self._lgr = utils.get_object_logger(__name__, self.name)
         self._version = 1
@@ -128,6 +1007,29 @@ class Reader:
         self.sensor = sensor
         self._last_idx = 0
         self._read_last_idx = 0
+        self._cache = cache if cache is not None else MemmapCache()
+        self._cache.register(self)
+        self._notifier = notifier
+        # live readers from a writer are served from its ring buffer when it holds the request
+        self._ring = ring
+
+    def close(self):
+        self._cache.release(self)
+
+    def get_unread_count(self):
+        # complete samples written since the last get_data_from_last_read/get_new_data
+        data = self._open_mmap()
+        return 0 if data is None else len(data) - self._read_last_idx
+
+    def wait_for_data(self, samples: int = 1, timeout=None):
+        # Follow mode: blocks until at least samples have been written since the last read or
+        # timeout (s) expires, returns True if they are available. Readers from a writer in this
+        # process are woken by the writer, others check the file every FOLLOW_POLL_S
+        return wait_for_data(self, self._notifier, samples, timeout)
+
+    def get_new_data(self):
+        # every complete sample written since the last read, in one block
+        return self.get_data_from_last_read(self.get_unread_count())
 
     @property
     def data_dtype(self):
@@ -153,20 +1055,70 @@ class Reader:
         if self.sensor.sampling_period_ms == 0:
             self.sensor.sampling_period_ms = 100
 
+    @property
+    def index_fqpn(self):
+        return self.fqpn.with_suffix('.idx')
+
     def _open_read(self):
         fid = open(self.fqpn, 'rb')
         return fid
 
+    def _open_index(self):
+        # older files will not have an index
+        return self._cache.get(self.index_fqpn, INDEX_DTYPE)
+
+    def get_sample_times(self, sample_idx):
+        # returns ms since start of acquisition for each sample index
+        # if there is no index, assume no samples were dropped
+        period = self.sensor.sampling_period_ms
+        sample_idx = np.asarray(sample_idx, dtype=np.int64)
+        index = self._open_index()
+        if index is None or len(sample_idx) == 0:
+            return (sample_idx * period).astype(np.uint64)
+
+        # only the entries which bracket the requested samples are needed
+        itemsize = self.data_dtype.itemsize
+        first = bisect.bisect_right(index['offset'], int(sample_idx.min()) * itemsize) - 1
+        last = bisect.bisect_left(index['offset'], int(sample_idx.max()) * itemsize) + 1
+        entries = index[max(first, 0):last]
+        entry_idx = entries['offset'].astype(np.int64) // itemsize
+        entry_ms = entries['time'].astype(np.float64)
+
+        # count forward from the previous entry and backward from the next entry
+        # the writer indexes both sides of any gap, so if the two counts disagree the
+        # samples are after a gap and the larger time is the correct one
+        prev_entry = np.clip(np.searchsorted(entry_idx, sample_idx, side='right') - 1, 0, len(entries) - 1)
+        next_entry = np.clip(np.searchsorted(entry_idx, sample_idx, side='left'), 0, len(entries) - 1)
+        fwd_ms = entry_ms[prev_entry] + (sample_idx - entry_idx[prev_entry]) * period
+        bwd_ms = entry_ms[next_entry] - (entry_idx[next_entry] - sample_idx) * period
+        data_time = np.maximum(fwd_ms, bwd_ms)
+        return np.clip(data_time, 0, None).astype(np.uint64)
+
+    def get_sample_index(self, t_ms):
+        # returns the index of the first sample at or after t_ms (ms since start of acquisition)
+        period = self.sensor.sampling_period_ms
+        index = self._open_index()
+        if index is None:
+            return max(int(np.ceil(t_ms / period)), 0)
+
+        itemsize = self.data_dtype.itemsize
+        entry = bisect.bisect_right(index['time'], t_ms) - 1
+        if entry < 0:
+            entry_idx = int(index['offset'][0]) // itemsize
+            sample_idx = entry_idx - int((int(index['time'][0]) - t_ms) // period)
+        else:
+            entry_idx = int(index['offset'][entry]) // itemsize
+            sample_idx = entry_idx + int(np.ceil((t_ms - int(index['time'][entry])) / period))
+            # samples may have been dropped before the next entry, so also count back from it
+            if entry + 1 < len(index) and sample_idx > entry_idx:
+                next_idx = int(index['offset'][entry + 1]) // itemsize
+                next_ms = int(index['time'][entry + 1])
+                bwd_idx = max(next_idx - int((next_ms - t_ms) // period), entry_idx + 1)
+                sample_idx = min(sample_idx, bwd_idx)
+        return max(sample_idx, 0)
+
     def _open_mmap(self):
-        fid = self._open_read()
-        try:
-            data = np.memmap(fid, dtype=self.data_dtype, mode='r')
-        except ValueError as e:
-            # cannot mmap an empty file
-            # this can happen if attempting to read a file before the first data was written
-            # ignore the error and continue processing
-            data = None
-        return fid, data
+        return self._cache.get(self.fqpn, self.data_dtype)
 
     def get_file_size_in_bytes(self, fid):
         cur_pos = fid.tell()
@@ -175,30 +1127,38 @@ class Reader:
         fid.seek(cur_pos, SEEK_SET)
         return file_size
 
-    def retrieve_buffer(self, last_ms, samples_needed):
-        period = self.sensor.sampling_period_ms
-        fid, data = self._open_mmap()
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace'):
+        if self._ring is not None:
+            result = self._ring.retrieve_buffer(last_ms, samples_needed, decimation)
+            if result is not None:
+                return result
+
+        data = self._open_mmap()
 
         if data is None:
             return [], []
 
-        file_size_in_samples = int(self.get_file_size_in_bytes(fid) / self.data_dtype.itemsize)
+        file_size_in_samples = len(data)
         if last_ms == 0:
             # if last x samples requested, no timestamps are returned
             data = data[-samples_needed:]
             start_idx = file_size_in_samples - len(data)
+            idx = np.arange(start_idx, file_size_in_samples)
         else:
             if last_ms > 0:
-                data_size = int(last_ms / period)
+                # use the time of the last sample, not the file size, in case samples were dropped
+                end_ms = int(self.get_sample_times([file_size_in_samples - 1])[0])
+                start_idx = self.get_sample_index(end_ms - last_ms)
+                data_size = file_size_in_samples - start_idx
                 if samples_needed > data_size:
                     samples_needed = data_size
-                start_idx = file_size_in_samples - data_size
-                if start_idx < 0:
-                    start_idx = 0
             else:
                 start_idx = 0
             samples_needed = min(file_size_in_samples, samples_needed)
-            idx = np.linspace(start_idx, len(data) - 1, samples_needed, dtype=np.uint64)
+            if decimation == 'linspace':
+                idx = np.linspace(start_idx, len(data) - 1, samples_needed, dtype=np.uint64)
+            else:
+                idx = start_idx + decimate(data[start_idx:], samples_needed, decimation)
             try:
                 data = data[idx]
             except IndexError :
@@ -207,52 +1167,57 @@ class Reader:
                                     f'samples_needed = {samples_needed}')
                 return None, None
 
-        data_time = np.linspace(start_idx * period, file_size_in_samples * period,
-                                samples_needed, dtype=np.uint64)
+        data_time = self.get_sample_times(idx)
 
-        fid.close()
         return data_time, data
 
     def get_data_from_last_read(self, samples: int):
-        period = self.sensor.sampling_period_ms
-        fid, data = self._open_mmap()
-        if self._read_last_idx + samples > self.get_file_size_in_bytes(fid):
+        data = self._open_mmap()
+        if data is None or self._read_last_idx + samples > len(data):
             return None, None
         data = data[self._read_last_idx:self._read_last_idx + samples]
         end_idx = self._read_last_idx + len(data) - 1
-        data_time = np.linspace(self._read_last_idx * period, end_idx * period,
-                                samples, dtype=np.uint64)
+        data_time = self.get_sample_times(np.arange(self._read_last_idx, end_idx + 1))
         self._read_last_idx = end_idx + 1
-        fid.close()
         return data_time, data
 
     def get_last_acq(self):
-        fid, data = self._open_mmap()
-        file_size_in_samples = int(self.get_file_size_in_bytes(fid) / self.data_dtype.itemsize)
+        if self._ring is not None:
+            last = self._ring.get_last(1)
+            if last is not None:
+                return last['time'][0], last['data'][0]
+        data = self._open_mmap()
+        if data is None:
+            return None, None
+        file_size_in_samples = len(data)
         data = data[-1]
-        data_time = file_size_in_samples * self.sensor.sampling_period_ms
-        fid.close()
+        data_time = self.get_sample_times([file_size_in_samples - 1])[0]
         return data_time, data
 
-    def get_all(self):
-        period = self.sensor.sampling_period_ms
-        fid, data = self._open_mmap()
+    def get_all(self, start_ms=None, end_ms=None):
+        # start_ms/end_ms are ms since start of acquisition and select the samples
+        # in [start_ms, end_ms), the sidecar index is used to find them without a scan
+        data = self._open_mmap()
 
         if data is None:
             return [], []
 
-        file_size_in_samples = int(self.get_file_size_in_bytes(fid) / self.data_dtype.itemsize)
-        data_time = np.linspace(0, file_size_in_samples * period,
-                                num=file_size_in_samples, dtype=np.uint64)
-        fid.close()
+        file_size_in_samples = len(data)
+        start_idx = 0 if start_ms is None else self.get_sample_index(start_ms)
+        end_idx = file_size_in_samples if end_ms is None else self.get_sample_index(end_ms)
+        end_idx = min(end_idx, file_size_in_samples)
+        start_idx = min(start_idx, end_idx)
+        data_time = self.get_sample_times(np.arange(start_idx, end_idx))
+        data = data[start_idx:end_idx]
         return data_time, data
 
 
 class ReaderPoints(Reader):
-    def __init__(self, name: str, fqpn: pathlib.Path, cfg: WriterPointsConfig, sensor: ReaderPointsSensor):
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: WriterPointsConfig, sensor: ReaderPointsSensor,
+                 cache: MemmapCache = None, notifier: WriteNotifier = None, ring: RingBuffer = None):
         self.name = name
         self._lgr = utils.get_object_logger(__name__, self.name)
-        super().__init__(name, fqpn, cfg, sensor)
+        super().__init__(name, fqpn, cfg, sensor, cache, notifier, ring)
         self._version = 1
         self.fqpn = fqpn
         self.cfg = cfg
@@ -264,6 +1229,23 @@ class ReaderPoints(Reader):
                 self.cfg.samples_per_timestamp * self.data_dtype.itemsize)
         return bytes_per_chunk
 
+    @property
+    def chunk_dtype(self):
+        # matches the layout written by WriterPoints: a big-endian timestamp
+        # followed by samples_per_timestamp samples in the native data type
+        return np.dtype([('time', f'>u{self.cfg.bytes_per_timestamp}'),
+                         ('data', self.data_dtype, (self.cfg.samples_per_timestamp,))])
+
+    def _open_chunks(self):
+        return self._cache.get(self.fqpn, self.chunk_dtype)
+
+    def get_unread_count(self):
+        chunks = self._open_chunks()
+        return 0 if chunks is None else len(chunks) - self._read_last_idx
+
+    def get_new_data(self, index: int = None):
+        return self.get_data_from_last_read(self.get_unread_count(), index)
+
     def read_settings(self):
         settings_file = self.fqpn.with_suffix('.txt')
         with open(settings_file) as reader:
@@ -286,110 +1268,459 @@ class ReaderPoints(Reader):
                     self.cfg.bytes_per_timestamp = int(value)
 
     def read_chunk(self, fid):
-        dtype = np.dtype({'names': ('time', 'data'), 'formats': (np.uint64, np.float64)})
-        data = np.fromfile(fid, dtype=dtype)
-        ts = data['time']
-        data_chunk = data['data']
-        # chunk = fid.read(self.cfg.bytes_per_timestamp)
-        # if chunk:
-            # ts, = struct.unpack('!Q', chunk)
-            #data_chunk = np.fromfile(fid, dtype=self.data_dtype, count=self.cfg.samples_per_timestamp)
-        # else:
-        #     ts = None
-        #     data_chunk = None
-        return ts, data_chunk
-
-    def retrieve_buffer(self, last_ms, samples_needed, index: int = None):
-        data_time = np.zeros(0, dtype=self.data_dtype)
-        data = np.zeros(0, dtype=self.data_dtype)
-
-        fid = open(self.fqpn, 'rb')
-        fid.seek(0)
-        cur_time = utils.get_epoch_ms()
-        chunks_read = 0
-        while True:
-            chunk = fid.read(self.cfg.bytes_per_timestamp)
-            if chunk and (len(chunk) == self.cfg.bytes_per_timestamp):
-                chunks_read += 1
-                ts, = struct.unpack('!Q', chunk)
-                diff_t = cur_time - ts
-                if diff_t <= last_ms:
-                    data_chunk = np.fromfile(fid, dtype=self.data_dtype,
-                                             count=self.cfg.samples_per_timestamp)
-                    if index is None:
-                        data = np.append(data, data_chunk)
-                    else:
-                        data = np.append(data, data_chunk[index])
-                    data_time = np.append(data_time, ts - self.sensor.get_acq_start_ms())
-                else:
-                    fid.seek(self.bytes_per_chunk-self.cfg.bytes_per_timestamp, SEEK_CUR)
-            else:
-                break
+        # reads the chunk at the current position of fid
+        chunk = np.fromfile(fid, dtype=self.chunk_dtype, count=1)
+        if len(chunk) == 0:
+            return None, None
+        return int(chunk['time'][0]), chunk['data'][0]
+
+    def retrieve_buffer(self, last_ms, samples_needed, index: int = None, decimation: str = 'linspace'):
+        start_ms = int(utils.get_epoch_ms()) - last_ms
+        window = None if self._ring is None else self._ring.get_since(start_ms)
+        if window is None:
+            chunks = self._open_chunks()
+            if chunks is None:
+                return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=self.data_dtype)
+
+            # timestamps are written in increasing order, so a binary search on the
+            # timestamp column finds the start of the window without scanning the file
+            # bisect only touches log(n) records which avoids a byte-swapped copy of the column
+            start_idx = bisect.bisect_left(chunks['time'], start_ms)
+            window = chunks[start_idx:]
+
+        if decimation == 'linspace':
+            inc = int(len(window) / samples_needed)
+            if inc > 0:
+                window = window[0:-1:inc]
+        else:
+            window = window[decimate(window['data'][:, index or 0], samples_needed, decimation)]
 
-        inc = int(len(data) / samples_needed)
-        if inc > 0:
-            data = data[0:-1:inc]
-            data_time = data_time[0:-1:inc]
-        fid.close()
+        data_time = window['time'].astype(np.float64) - self.sensor.get_acq_start_ms()
+        if index is None:
+            data = window['data'].reshape(-1)
+        else:
+            data = window['data'][:, index]
+        data = np.array(data, dtype=self.data_dtype)
         return data_time, data
 
     def get_data_from_last_read(self, chunks_needed: int, index: int = None):
-        fid = self._open_read()
-        file_size = self.get_file_size_in_bytes(fid)
-
-        if not fid or file_size == 0:
+        # returns up to chunks_needed chunks written since the last call
+        # times are in seconds since the start of acquisition
+        chunks = self._open_chunks()
+        if chunks is None:
             return None, None
 
-        fid.seek(self._last_idx, SEEK_SET)
-        # do not assume a full chunk has been written to the file
-        total_chunks = file_size // self.bytes_per_chunk
-        timestamps = []
-        chunks = []
-        if chunks_needed < total_chunks:
-            total_chunks = chunks_needed
-        for chunk_idx in range(total_chunks):
-            ts, chunk = self.read_chunk(fid)
+        window = chunks[self._read_last_idx:self._read_last_idx + chunks_needed]
+        self._read_last_idx += len(window)
+        timestamps = (window['time'].astype(np.float64) - self.sensor.get_acq_start_ms()) / 1000.0
+        data = window['data'] if index is None else window['data'][:, index]
+        return timestamps, data
+
+    def get_last_acq(self, index: int = None):
+        last = None if self._ring is None else self._ring.get_last(1)
+        if last is not None:
+            last_chunk = last[0]
+        else:
+            chunks = self._open_chunks()
+            if chunks is None:
+                return None, None
+            last_chunk = chunks[-1]
+        data_chunk = last_chunk['data'] if index is None else last_chunk['data'][index]
+        return int(last_chunk['time']), data_chunk
+
+    def get_all(self, index: int = None, start_ms=None, end_ms=None):
+        # start_ms/end_ms use the same timestamps as written to the file and select [start_ms, end_ms)
+        # the timestamps are decoded in one operation, the data is a view of the file
+        chunks = self._open_chunks()
+        if chunks is None:
+            return np.zeros(0, dtype=np.uint64), np.zeros((0, self.cfg.samples_per_timestamp), dtype=self.data_dtype)
+
+        start_idx = 0 if start_ms is None else bisect.bisect_left(chunks['time'], start_ms)
+        end_idx = len(chunks) if end_ms is None else bisect.bisect_left(chunks['time'], end_ms)
+        window = chunks[start_idx:max(start_idx, end_idx)]
+        data_time = window['time'].astype(np.uint64)
+        data = window['data'] if index is None else window['data'][:, index]
+        return data_time, data
+
+
+class CompressedArray:
+    # Read-only array-like view of a compressed stream, standing in for the memory map used by
+    # Reader. Supports len() and integer, slice and index array lookups, decompressing only
+    # the chunks which contain the requested samples
+    def __init__(self, reader, table, tail=None):
+        self._reader = reader
+        self._table = table
+        self._first_sample = table['first_sample'].astype(np.int64) if table is not None \
+            else np.zeros(0, dtype=np.int64)
+        self._stored = int(table['first_sample'][-1] + table['samples'][-1]) if table is not None else 0
+        self._tail = tail if tail is not None else np.zeros(0, dtype=reader.data_dtype)
+        self.dtype = reader.data_dtype
+
+    def __len__(self):
+        return self._stored + len(self._tail)
+
+    def _get_range(self, start, stop):
+        if stop <= start:
+            return np.zeros(0, dtype=self.dtype)
+        parts = []
+        if start < self._stored:
+            first = bisect.bisect_right(self._first_sample, start) - 1
+            last = bisect.bisect_left(self._first_sample, min(stop, self._stored))
+            for chunk_no in range(first, last):
+                chunk = self._reader.read_compressed_chunk(chunk_no, self._table[chunk_no])
+                chunk_start = self._first_sample[chunk_no]
+                parts.append(chunk[max(start - chunk_start, 0):stop - chunk_start])
+        if stop > self._stored:
+            parts.append(self._tail[max(start - self._stored, 0):stop - self._stored])
+        return np.concatenate(parts) if len(parts) > 1 else np.array(parts[0], dtype=self.dtype)
+
+    def _get_samples(self, idx):
+        idx = np.asarray(idx, dtype=np.int64)
+        idx = np.where(idx < 0, idx + len(self), idx)
+        if len(idx) and (idx.min() < 0 or idx.max() >= len(self)):
+            raise IndexError(f'index out of range for {len(self)} samples')
+        data = np.empty(idx.shape, dtype=self.dtype)
+        in_tail = idx >= self._stored
+        data[in_tail] = self._tail[idx[in_tail] - self._stored]
+        stored_idx = idx[~in_tail]
+        if len(stored_idx):
+            chunk_nos = np.searchsorted(self._first_sample, stored_idx, side='right') - 1
+            stored = np.empty(stored_idx.shape, dtype=self.dtype)
+            for chunk_no in np.unique(chunk_nos):
+                chunk = self._reader.read_compressed_chunk(chunk_no, self._table[chunk_no])
+                in_chunk = chunk_nos == chunk_no
+                stored[in_chunk] = chunk[stored_idx[in_chunk] - self._first_sample[chunk_no]]
+            data[~in_tail] = stored
+        return data
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._get_range(start, stop)
+            return self._get_samples(np.arange(start, stop, step))
+        if np.isscalar(key):
+            return self._get_samples([key])[0]
+        return self._get_samples(key)
+
+
+class ReaderCompressed(Reader):
+    # Reader for files written by WriterCompressed, the interface is the same as Reader
+    # source is provided by the writer so its readers also see the samples not yet compressed
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: CompressedConfig, sensor, cache: MemmapCache = None,
+                 notifier: WriteNotifier = None, ring: RingBuffer = None, source=None, cached_chunks: int = 16):
+        super().__init__(name, fqpn, cfg, sensor, cache, notifier, ring)
+        self._source = source
+        self._cached_chunks = cached_chunks
+        self._chunks = OrderedDict()
+        self._chunks_lock = Lock()
+
+    @property
+    def table_fqpn(self):
+        return self.fqpn.with_suffix('.ctbl')
+
+    def read_settings(self):
+        super().read_settings()
+        with open(self.fqpn.with_suffix('.txt')) as reader:
+            for line in reader:
+                key, value = line.strip().split(': ')
+                if key == 'codec':
+                    self.cfg.codec = value
+                elif key == 'chunk_samples':
+                    self.cfg.chunk_samples = int(value)
+
+    def _open_table(self):
+        return self._cache.get(self.table_fqpn, CHUNK_TABLE_DTYPE)
+
+    def _open_mmap(self):
+        if self._source is not None:
+            table, tail = self._source(self.fqpn)
+        else:
+            table, tail = self._open_table(), None
+        if table is None and (tail is None or len(tail) == 0):
+            return None
+        return CompressedArray(self, table, tail)
+
+    def read_compressed_chunk(self, chunk_no: int, entry):
+        # keep the most recently used chunks decompressed as consecutive reads usually hit the same chunks
+        key = (int(chunk_no), int(entry['offset']), int(entry['nbytes']))
+        with self._chunks_lock:
+            chunk = self._chunks.get(key, None)
             if chunk is not None:
-                if index is not None and index < len(chunk):
-                    chunk = chunk[index]
-                timestamps.append((ts - self.sensor.get_acq_start_ms()) / 1000.0)
-                chunks.append(chunk)
+                self._chunks.move_to_end(key)
+                return chunk
+        raw = self._cache.get(self.fqpn, np.dtype(np.uint8))
+        offset = int(entry['offset'])
+        chunk = decode_chunk(raw[offset:offset + int(entry['nbytes'])], self.data_dtype, self.cfg.codec)
+        with self._chunks_lock:
+            self._chunks[key] = chunk
+            while len(self._chunks) > self._cached_chunks:
+                self._chunks.popitem(last=False)
+        return chunk
 
-        self._last_idx = fid.tell()
+    def close(self):
+        with self._chunks_lock:
+            self._chunks.clear()
+        super().close()
+
+
+class SegmentedReader:
+    # Presents the segments listed in a manifest (see WriterStream.is_segmented) as one stream
+    # with the same interface as Reader. Times are ms since the start of acquisition and each
+    # segment is only opened once a request overlaps it. live_reader is provided by the writer
+    # and returns its own reader for the segment being written, or None for other segments
+    def __init__(self, name: str, fqpn: pathlib.Path, cfg: WriterConfig, sensor=None, live_reader=None,
+                 notifier: WriteNotifier = None, ring: RingBuffer = None):
+        self.name = name
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.fqpn = pathlib.Path(fqpn)
+        self.cfg = cfg
+        self.sensor = sensor
+        self._acq_start_ms = 0
+        # (epoch ms of the first sample, ms added to the segment times, path) of each segment
+        self._segments = []
+        self._manifest_size = -1
+        self._readers = {}
+        self._live_reader = live_reader
+        self._notifier = notifier
+        self._ring = ring
+        self._read_segment = 0
+        self._pending_read = []
 
-        return timestamps, chunks
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
 
-    def get_last_acq(self, index: int = None):
-        fid = self._open_read()
-        file_size = self.get_file_size_in_bytes(fid)
-        if not fid or file_size == 0:
-            return None, None
+    def get_unread_count(self):
+        segments = self._load_manifest()
+        unread = sum(len(part[1]) for part in self._pending_read)
+        for segment in range(self._read_segment, len(segments)):
+            unread += self._get_reader(segment).get_unread_count()
+        return unread
 
-        # do not assume a full chunk has been written to the file
-        start_of_last_chunk = ((file_size // self.bytes_per_chunk) - 1) * self.bytes_per_chunk
-        if start_of_last_chunk < 0:
-            return None, None
-        fid.seek(start_of_last_chunk)
-        ts, data_chunk = self.read_chunk(fid)
-        if index is not None and index < len(data_chunk):
-            data_chunk = data_chunk[index]
-        fid.close()
-        return ts, data_chunk
+    def wait_for_data(self, samples: int = 1, timeout=None):
+        return wait_for_data(self, self._notifier, samples, timeout)
 
-    def get_all(self, index: int = None):
-        fid = self._open_read()
-        file_size = self.get_file_size_in_bytes(fid)
+    def get_new_data(self):
+        return self.get_data_from_last_read(self.get_unread_count())
 
-        total_chunks = file_size/self.bytes_per_chunk
-        fid.seek(0)
+    @property
+    def data_dtype(self):
+        if self.sensor is not None:
+            return self.sensor.data_dtype
+        return self._get_reader(0).data_dtype
 
-        format_str = f'(1,{self.cfg.samples_per_timestamp}){self.data_dtype}'
-        dtype = np.dtype({'names': ('time', 'data'), 'formats': (np.uint64, format_str)})
-        all_data = np.fromfile(fid, dtype=dtype)
-        data_time = [struct.unpack('!Q', chunk)[0] for chunk in all_data['time']]
-        data = all_data['data']
-        fid.close()
-        return data_time, data
+    def get_acq_start_ms(self):
+        self._load_manifest()
+        return self._acq_start_ms
+
+    def _load_manifest(self):
+        # the writer appends a line for each new segment, so only re-read when the manifest grows
+        try:
+            size = os.path.getsize(self.fqpn)
+        except OSError:
+            return self._segments
+        if size != self._manifest_size:
+            segments = []
+            with open(self.fqpn) as reader:
+                for line in reader:
+                    try:
+                        key, value = line.strip().split(': ')
+                        if key == 'Start of Acquisition (ms)':
+                            self._acq_start_ms = int(value)
+                        elif key == 'Segment':
+                            start_ms, offset_ms, filename = [v.strip() for v in value.split(',', 2)]
+                            fqpn = pathlib.Path(os.path.normpath(self.fqpn.parent / filename))
+                            segments.append((int(start_ms), int(offset_ms), fqpn))
+                    except ValueError:
+                        # the writer may be part way through a line
+                        break
+            self._segments = segments
+            self._manifest_size = size
+        return self._segments
+
+    def _get_reader(self, segment: int):
+        reader = self._readers.get(segment, None)
+        if reader is None:
+            fqpn = self._load_manifest()[segment][2]
+            reader = self._live_reader(fqpn) if self._live_reader else None
+            if reader is None:
+                reader = read_file(fqpn)
+            self._readers[segment] = reader
+        return reader
+
+    def _get_overlapping(self, start_epoch_ms=None, end_epoch_ms=None):
+        # segment i holds [start of segment i, start of segment i+1)
+        starts = [segment[0] for segment in self._load_manifest()]
+        first = 0 if start_epoch_ms is None else max(bisect.bisect_right(starts, start_epoch_ms) - 1, 0)
+        last = len(starts) if end_epoch_ms is None else bisect.bisect_left(starts, end_epoch_ms)
+        return range(first, last)
+
+    def _to_epoch(self, t_ms):
+        return None if t_ms is None else t_ms + self._acq_start_ms
+
+    def _shift(self, segment, data_time):
+        return np.asarray(data_time, dtype=np.float64) + self._segments[segment][1]
+
+    def _unshift(self, segment, t_ms):
+        return None if t_ms is None else t_ms - self._segments[segment][1]
+
+    def get_all(self, start_ms=None, end_ms=None):
+        all_time = []
+        all_data = []
+        self._load_manifest()
+        for segment in self._get_overlapping(self._to_epoch(start_ms), self._to_epoch(end_ms)):
+            data_time, data = self._get_reader(segment).get_all(self._unshift(segment, start_ms),
+                                                                self._unshift(segment, end_ms))
+            if len(data) > 0:
+                all_time.append(self._shift(segment, data_time))
+                all_data.append(np.asarray(data))
+        if not all_time:
+            return [], []
+        return np.concatenate(all_time).astype(np.uint64), np.concatenate(all_data)
+
+    def get_last_acq(self):
+        last = None if self._ring is None else self._ring.get_last(1)
+        if last is not None:
+            return last['time'][0], last['data'][0]
+        # a new segment may not have any data yet
+        for segment in reversed(range(len(self._load_manifest()))):
+            data_time, data = self._get_reader(segment).get_last_acq()
+            if data_time is not None:
+                return np.uint64(self._shift(segment, data_time)), data
+        return None, None
+
+    def retrieve_buffer(self, last_ms, samples_needed, decimation: str = 'linspace'):
+        if self._ring is not None:
+            result = self._ring.retrieve_buffer(last_ms, samples_needed, decimation)
+            if result is not None:
+                return result
+
+        segments = self._load_manifest()
+        if not segments:
+            return [], []
+
+        if last_ms == 0:
+            # the last samples_needed samples, working back through the segments
+            parts = []
+            remaining = samples_needed
+            for segment in reversed(range(len(segments))):
+                data_time, data = self._get_reader(segment).retrieve_buffer(0, remaining)
+                if len(data) > 0:
+                    parts.insert(0, (self._shift(segment, data_time), np.asarray(data)))
+                    remaining -= len(data)
+                if remaining <= 0:
+                    break
+            if not parts:
+                return [], []
+            return np.concatenate([p[0] for p in parts]).astype(np.uint64), np.concatenate([p[1] for p in parts])
+
+        if last_ms > 0:
+            end_ms, _ = self.get_last_acq()
+            if end_ms is None:
+                return [], []
+            start_ms = int(end_ms) - last_ms
+        else:
+            start_ms = None
+        overlapping = self._get_overlapping(self._to_epoch(start_ms))
+        if len(overlapping) == 1:
+            segment = overlapping[0]
+            data_time, data = self._get_reader(segment).retrieve_buffer(last_ms, samples_needed, decimation)
+            if data_time is None or len(data_time) == 0:
+                return data_time, data
+            return self._shift(segment, data_time).astype(np.uint64), data
+
+        # the window spans segments, so gather it and then decimate
+        data_time, data = self.get_all(start_ms)
+        if len(data) == 0:
+            return [], []
+        if decimation == 'linspace':
+            idx = np.linspace(0, len(data) - 1, min(samples_needed, len(data)), dtype=np.uint64)
+        else:
+            idx = decimate(data, samples_needed, decimation)
+        return data_time[idx], data[idx]
+
+    def get_data_from_last_read(self, samples: int):
+        # a segment is complete once the next one is in the manifest, so the samples left at
+        # the end of it are held until the rest can be read from the next segment
+        segments = self._load_manifest()
+        needed = samples - sum(len(part[1]) for part in self._pending_read)
+        while needed > 0 and self._read_segment < len(segments):
+            reader = self._get_reader(self._read_segment)
+            data_time, data = reader.get_data_from_last_read(needed)
+            if data_time is not None:
+                self._pending_read.append((self._shift(self._read_segment, data_time), np.asarray(data)))
+                needed = 0
+            elif self._read_segment + 1 < len(segments):
+                data = reader._open_mmap()
+                remaining = 0 if data is None else len(data) - reader._read_last_idx
+                if remaining > 0:
+                    data_time, data = reader.get_data_from_last_read(remaining)
+                    self._pending_read.append((self._shift(self._read_segment, data_time), np.asarray(data)))
+                    needed -= remaining
+                self._read_segment += 1
+            else:
+                break
+        if needed > 0:
+            return None, None
+        parts = self._pending_read
+        self._pending_read = []
+        return np.concatenate([p[0] for p in parts]).astype(np.uint64), np.concatenate([p[1] for p in parts])
+
+
+class SegmentedReaderPoints(SegmentedReader):
+    # Segments of a points file, the interface is the same as ReaderPoints. Points files keep
+    # the timestamps as written and every segment uses the same start of acquisition, so the
+    # times from each segment are returned unchanged. For the same reason the writer's ring
+    # buffer is given to the reader of the segment being written
+    def get_all(self, index: int = None, start_ms=None, end_ms=None):
+        all_time = []
+        all_data = []
+        for segment in self._get_overlapping(start_ms, end_ms):
+            data_time, data = self._get_reader(segment).get_all(index, start_ms, end_ms)
+            if len(data) > 0:
+                all_time.append(np.asarray(data_time))
+                all_data.append(np.asarray(data))
+        if not all_time:
+            return [], []
+        return np.concatenate(all_time), np.concatenate(all_data)
+
+    def get_last_acq(self, index: int = None):
+        for segment in reversed(range(len(self._load_manifest()))):
+            data_time, data = self._get_reader(segment).get_last_acq(index)
+            if data_time is not None:
+                return data_time, data
+        return None, None
+
+    def retrieve_buffer(self, last_ms, samples_needed, index: int = None, decimation: str = 'linspace'):
+        # each overlapping segment is decimated separately, a window which spans
+        # a rotation can therefore return up to twice samples_needed
+        start_epoch_ms = int(utils.get_epoch_ms()) - last_ms
+        if self._ring is not None and self._ring.get_since(start_epoch_ms) is not None:
+            return self._get_reader(len(self._load_manifest()) - 1).retrieve_buffer(last_ms, samples_needed,
+                                                                                    index, decimation)
+        parts = [self._get_reader(segment).retrieve_buffer(last_ms, samples_needed, index, decimation)
+                 for segment in self._get_overlapping(start_epoch_ms)]
+        parts = [part for part in parts if len(part[1]) > 0]
+        if not parts:
+            return np.zeros(0, dtype=np.float64), np.zeros(0)
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def get_new_data(self, index: int = None):
+        return self.get_data_from_last_read(self.get_unread_count(), index)
+
+    def get_data_from_last_read(self, chunks_needed: int, index: int = None):
+        segments = self._load_manifest()
+        while self._read_segment < len(segments):
+            data_time, data = self._get_reader(self._read_segment).get_data_from_last_read(chunks_needed, index)
+            if data_time is not None and len(data_time) > 0:
+                return data_time, data
+            if self._read_segment + 1 < len(segments):
+                self._read_segment += 1
+            else:
+                break
+        return None, None
 
 
 class WriterStream:
@@ -411,6 +1742,27 @@ class WriterStream:
         self._processed_buffer = None
         self._wrote_header = False
 
+        self._idx_fid = None
+        self._last_index_ms = None
+        self._prev_buffer_index = None
+        self._pending_bytes = 0
+        self._last_flush_ms = 0
+        self._last_fsync_ms = 0
+        self._synced = True
+        # shared by all readers of this strategy
+        self._mmap_cache = MemmapCache()
+        self._notifier = WriteNotifier()
+        self._ring = None
+
+        self._manifest_fqpn = None
+        self._segment_key = None
+        # ms from the start of acquisition to the first sample of the current segment
+        self._segment_offset_ms = 0
+
+        # set by AsyncWriter while it writes a batch, the files are flushed once at the end
+        self._batching = False
+        self.dropped_buffers = 0
+        self.dropped_samples = 0
 
     @classmethod
     def get_config_type(cls):
@@ -421,21 +1773,167 @@ class WriterStream:
         return self._base_path / self._filename.with_suffix(self._ext)
 
     def get_reader(self):
-        return Reader(self.name, self.fqpn, self.cfg, self.sensor)
+        if self.is_segmented:
+            return SegmentedReader(self.name, self._manifest_fqpn, self.cfg, self.sensor, self._get_live_reader,
+                                   self._notifier, self._ring)
+        return self._get_file_reader(self._ring)
+
+    def _get_file_reader(self, ring=None):
+        return Reader(self.name, self.fqpn, self.cfg, self.sensor, self._mmap_cache, self._notifier, ring)
+
+    def _get_live_reader(self, fqpn):
+        # readers of the segment being written share the writer's cache
+        return self._get_file_reader() if fqpn == self.fqpn else None
+
+    def _open_ring(self):
+        # sized to hold cfg.ring_buffer_s of samples, times are ms since the start of acquisition
+        if self.cfg.ring_buffer_s > 0:
+            capacity = int(np.ceil(self.cfg.ring_buffer_s * 1_000 / max(self.sensor.sampling_period_ms, 1)))
+            self._create_ring(capacity, get_shm_record_dtype(self.sensor.data_dtype))
+        elif self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def _create_ring(self, capacity: int, dtype: np.dtype):
+        if self._ring is not None:
+            self._ring.close()
+        if self.cfg.shared_memory:
+            self._ring = SharedRingBuffer(get_shared_memory_name(self.sensor.name, self.name), capacity, dtype,
+                                          self.sensor)
+        else:
+            self._ring = RingBuffer(capacity, dtype)
+
+    def _append_ring(self, data_buf, t=None):
+        period = self.sensor.sampling_period_ms
+        if t is not None:
+            end_ms = self._get_acq_time(t)
+        else:
+            last = self._ring.get_last(1)
+            end_ms = (0 if last is None else int(last['time'][0])) + len(data_buf) * period
+        records = np.empty(len(data_buf), dtype=self._ring.dtype)
+        # t stamps the last sample of the buffer
+        records['time'] = np.clip(end_ms - period * np.arange(len(data_buf) - 1, -1, -1), 0, None)
+        records['data'] = data_buf
+        self._ring.append(records)
+
+    @property
+    def is_segmented(self):
+        return self.cfg.segment_interval_s > 0 or self.cfg.segment_bytes > 0
+
+    @property
+    def is_buffered(self):
+        return self.cfg.flush_interval_ms > 0 or self.cfg.flush_bytes > 0
 
     def _open_write(self):
         self._lgr.info(f'opening for write: {self.fqpn}')
-        self._fid = open(self.fqpn, 'w+b')
+        # size the file buffer so pending buffers are written to disk in one call
+        buffering = max(self.cfg.flush_bytes, io.DEFAULT_BUFFER_SIZE) if self.is_buffered else -1
+        self._fid = open(self.fqpn, 'w+b', buffering=buffering)
+        self._last_index_ms = None
+        self._prev_buffer_index = None
+        if self._has_index():
+            self._idx_fid = open(self.fqpn.with_suffix('.idx'), 'w+b')
+        self._pending_bytes = 0
+        self._last_flush_ms = int(utils.get_epoch_ms())
+        self._last_fsync_ms = self._last_flush_ms
+        self._synced = True
+
+    def _has_index(self):
+        return self.cfg.index_interval_ms > 0
+
+    def _flush(self, nbytes: int, force: bool = False):
+        # force flushes now, and fsyncs if there is an fsync interval
+        self._pending_bytes += nbytes
+        if nbytes > 0:
+            self._synced = False
+        if self._batching:
+            return
+        now_ms = int(utils.get_epoch_ms())
+        flush = force or not self.is_buffered
+        if self.cfg.flush_interval_ms > 0 and now_ms - self._last_flush_ms >= self.cfg.flush_interval_ms:
+            flush = True
+        if 0 < self.cfg.flush_bytes <= self._pending_bytes:
+            flush = True
+        fsync = self.cfg.fsync_interval_ms > 0 and not self._synced and \
+            (force or now_ms - self._last_fsync_ms >= self.cfg.fsync_interval_ms)
+
+        if flush or fsync:
+            try:
+                # flush the data before the index so an index entry never points past the data
+                self._fid.flush()
+                if self._idx_fid:
+                    self._idx_fid.flush()
+                if fsync:
+                    os.fsync(self._fid.fileno())
+                    if self._idx_fid:
+                        os.fsync(self._idx_fid.fileno())
+                    self._last_fsync_ms = now_ms
+                    self._synced = True
+            except OSError as e:
+                self._lgr.error(f'{self.name}: {e}')
+            self._pending_bytes = 0
+            self._last_flush_ms = now_ms
+            self._notifier.notify()
+
+    def flush_pending(self, force: bool = False):
+        # called by the sensor while waiting for data, so the flush and fsync intervals are kept
+        # when no more data arrives. force flushes (and fsyncs) now, e.g. when the sensor stops
+        if self.cfg.async_write:
+            get_async_writer().submit_flush(self, force)
+            return
+        if self._fid is None or (self._pending_bytes == 0 and self._synced):
+            return
+        self._flush(0, force)
+
+    def _get_acq_time(self, t):
+        # t may be a single timestamp or the timestamps of each sample
+        # some hardware timestamps relative to the start of acquisition, others use the epoch
+        # so convert everything to ms since start of acquisition
+        t = int(np.asarray(t).reshape(-1)[-1])
+        acq_start_ms = int(self.sensor.get_acq_start_ms())
+        if 0 < acq_start_ms <= t:
+            t -= acq_start_ms
+        return t
+
+    def _get_index_time(self, t):
+        # the index and header of each segment are relative to its first sample
+        return self._get_acq_time(t) - self._segment_offset_ms
+
+    def _write_index(self, t, offset, force=False):
+        if self._idx_fid is None or t is None:
+            return
+        if force or self._last_index_ms is None or t - self._last_index_ms >= self.cfg.index_interval_ms:
+            try:
+                self._idx_fid.write(struct.pack('!QQ', t, offset))
+            except OSError as e:
+                self._lgr.error(f'{self.name}: {e}')
+            self._last_index_ms = t
 
     def _write_to_file(self, data_buf, t=None):
         # self._lgr.debug(f'_write_to_file is being called and data_buf = {data_buf}')
         if self._fid:
             try:
-                data_buf.tofile(self._fid)
+                # ndarray.tofile() flushes the file object, write the array directly so it stays buffered
+                self._fid.write(np.ascontiguousarray(data_buf))
             except OSError as e:
                 self._lgr.error(f'{self.name}: {e}')
-            self._fid.flush()
             self._last_idx += len(data_buf)
+            if t is not None and len(data_buf) > 0:
+                self._index_buffer(self._get_index_time(t), self._fid.tell() - data_buf.itemsize, len(data_buf))
+            self._flush(data_buf.nbytes)
+
+    def _index_buffer(self, t, offset, samples):
+        # if samples were dropped, index both sides of the gap so
+        # the reader never counts samples across it
+        gap = False
+        if self._prev_buffer_index is not None:
+            prev_t, prev_offset = self._prev_buffer_index
+            # consecutive buffers are samples * period apart, so a single dropped buffer doubles it
+            gap = t - prev_t > 1.5 * samples * self.sensor.sampling_period_ms
+            if gap and self._last_index_ms != prev_t:
+                self._write_index(prev_t, prev_offset, force=True)
+        self._write_index(t, offset, force=gap)
+        self._prev_buffer_index = (t, offset)
 
     def _get_stream_info(self):
         all_params = {}
@@ -453,12 +1951,62 @@ class WriterStream:
         # reads using memory-mapped files
         fid = open(self.fqpn.with_suffix('').with_suffix('.txt'), 'wt')
         fid.write(hdr_str)
-        timestamp = datetime.utcfromtimestamp(self.sensor.get_acq_start_ms() / 1_000)
+        timestamp = datetime.utcfromtimestamp((self.sensor.get_acq_start_ms() + self._segment_offset_ms) / 1_000)
         fid.write(f'Start of Acquisition: {timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")}')
 
         fid.close()
 
+    def _get_buffer_duration(self, data_buf):
+        # t stamps the last sample of the buffer
+        return (len(data_buf) - 1) * self.sensor.sampling_period_ms
+
+    def _get_segment_offset(self, start_ms):
+        # stream times are counted from the first sample of each segment
+        return start_ms
+
+    def _get_segment_key(self, epoch_ms):
+        local = datetime.fromtimestamp(epoch_ms / 1_000)
+        if self.cfg.segment_interval_s > 0:
+            secs = local.hour * 3_600 + local.minute * 60 + local.second
+            return local.date(), secs // self.cfg.segment_interval_s
+        return local.date(), 0
+
+    def _check_segment(self, data_buf, t=None):
+        # start a new segment if the buffer is in a new interval (or day) or the segment is full
+        acq_start_ms = int(self.sensor.get_acq_start_ms())
+        acq_ms = int(utils.get_epoch_ms()) - acq_start_ms if t is None else self._get_acq_time(t)
+        start_ms = max(acq_ms - self._get_buffer_duration(data_buf), 0)
+        key = self._get_segment_key(acq_start_ms + start_ms)
+        full = self._fid is not None and 0 < self.cfg.segment_bytes <= self._fid.tell()
+        if self._fid is None or full or key != self._segment_key:
+            self._start_segment(key, acq_start_ms, start_ms)
+
+    def _start_segment(self, key, acq_start_ms, start_ms):
+        if self._fid:
+            self._close_files()
+        start = datetime.fromtimestamp((acq_start_ms + start_ms) / 1_000)
+        fm = PerfusionConfig.ACTIVE_CONFIG
+        self._base_path = fm.basepath / fm.get_data_folder(start.strftime('%Y-%m-%d'))
+        self._base_path.mkdir(parents=True, exist_ok=True)
+        self._filename = pathlib.Path(f'{self.sensor.name}_{self.name}_'
+                                      f'{start.strftime("%Y-%m-%d_%H%M%S")}{start.microsecond // 1_000:03d}')
+        self._segment_key = key
+        self._segment_offset_ms = self._get_segment_offset(start_ms)
+        self._print_stream_info()
+        self._open_write()
+
+        # the manifest is only updated once the segment exists
+        if not self._manifest_fqpn.exists():
+            with open(self._manifest_fqpn, 'wt') as fid:
+                fid.write(f'Sensor Name: {self.sensor.name}\n')
+                fid.write(f'Output Type: {self.name}\n')
+                fid.write(f'Start of Acquisition (ms): {acq_start_ms}\n')
+        filename = pathlib.PurePath(os.path.relpath(self.fqpn, self._manifest_fqpn.parent)).as_posix()
+        with open(self._manifest_fqpn, 'at') as fid:
+            fid.write(f'Segment: {acq_start_ms + start_ms}, {self._segment_offset_ms}, {filename}\n')
+
     def open(self, sensor = None):
+        self._sync_writes()
         self._base_path = PerfusionConfig.get_date_folder()
         self._filename = pathlib.Path(f'{sensor.name}_{self.name}')
         self.sensor = sensor
@@ -466,15 +2014,47 @@ class WriterStream:
         if self._fid:
             self._fid.close()
             self._fid = None
+        if self._idx_fid:
+            self._idx_fid.close()
+            self._idx_fid = None
+        # the files are about to be recreated, so any existing maps are stale
+        self._mmap_cache.clear()
+
+        self._segment_offset_ms = 0
+        if self.is_segmented:
+            # the first segment is started by the first buffer, once the acquisition has started
+            self._manifest_fqpn = self._base_path / self._filename.with_suffix('.manifest')
+            self._manifest_fqpn.unlink(missing_ok=True)
+            self._segment_key = None
+            self._open_ring()
+            return
 
         self._print_stream_info()
         self._open_write()
+        self._open_ring()
 
     def close(self):
+        self._sync_writes()
+        self._close_files()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def _close_files(self):
+        if self.is_segmented and self._fid is None:
+            return
         try:
+            if self.cfg.fsync_interval_ms > 0:
+                self._fid.flush()
+                os.fsync(self._fid.fileno())
             self._fid.close()
+            self._fid = None
         except AttributeError as e:
             self._lgr.error(f'Attempt to close {self._filename} failed as fid=None')
+        if self._idx_fid:
+            self._idx_fid.close()
+            self._idx_fid = None
+        self._mmap_cache.clear()
 
     def _process(self, buffer, t=None):
         # the default WriterStream doesn't alter the data
@@ -482,11 +2062,48 @@ class WriterStream:
         # but in the general usage, the data will be altered
         self._processed_buffer = buffer
 
+    def _get_output_time(self, t):
+        # t for the processed buffer, strategies which change the number of samples
+        # override this so t still stamps the last sample
+        return t
+
+    def _sync_writes(self):
+        # buffers still queued for the background writer must be written before the files change
+        if self.cfg.async_write:
+            get_async_writer().sync()
+
+    def _write_async(self, data_buf, t=None):
+        # called from the AsyncWriter thread
+        if self.is_segmented:
+            self._check_segment(data_buf, t)
+        self._write_to_file(data_buf, t)
+
+    def _submit_write(self, data_buf, t=None):
+        # _process may reuse the buffer, so queue a copy
+        t = np.copy(t) if isinstance(t, np.ndarray) else t
+        if not get_async_writer().submit(self, np.array(data_buf, copy=True), t, self.cfg.async_drop):
+            if self.dropped_buffers == 0:
+                self._lgr.warning(f'{self.name}: write queue is full, dropping buffers')
+            self.dropped_buffers += 1
+            self.dropped_samples += len(data_buf)
+
     def process_buffer(self, buffer, t=None):
         # In derived classes, do not override this method, override _process
         if self._processed_buffer is None:
             self._processed_buffer = np.zeros(len(buffer), dtype=buffer.dtype)
         self._process(buffer, t)
+        t = self._get_output_time(t)
+        if self.cfg.async_write:
+            # live readers are served from the ring straight away, the file follows in the background
+            if self._ring is not None and len(self._processed_buffer) > 0:
+                self._append_ring(self._processed_buffer, t)
+            self._submit_write(self._processed_buffer, t)
+            return self._processed_buffer, t
+        if self.is_segmented:
+            self._check_segment(self._processed_buffer, t)
+        # update the ring first, so it is current when the write wakes any readers
+        if self._ring is not None and len(self._processed_buffer) > 0:
+            self._append_ring(self._processed_buffer, t)
         self._write_to_file(self._processed_buffer, t)
         return self._processed_buffer, t
 
@@ -512,9 +2129,156 @@ class WriterPoints(WriterStream):
         return ''.join(hdr_str)
 
     def get_reader(self):
-        return ReaderPoints(self.name, self.fqpn, self.cfg, self.sensor)
+        if self.is_segmented:
+            return SegmentedReaderPoints(self.name, self._manifest_fqpn, self.cfg, self.sensor,
+                                         self._get_live_reader, self._notifier, self._ring)
+        return self._get_file_reader(self._ring)
+
+    def _get_file_reader(self, ring=None):
+        return ReaderPoints(self.name, self.fqpn, self.cfg, self.sensor, self._mmap_cache, self._notifier, ring)
+
+    def _get_live_reader(self, fqpn):
+        # timestamps are the same in every segment, so the reader of the current segment uses the ring
+        return self._get_file_reader(self._ring) if fqpn == self.fqpn else None
+
+    def _open_ring(self):
+        if self.cfg.ring_buffer_s > 0:
+            self._create_ring(int(self.cfg.ring_buffer_s * 100),
+                              get_shm_record_dtype(self.sensor.data_dtype, self.cfg.samples_per_timestamp))
+        elif self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def _append_ring(self, data_buf, t=None):
+        if t is None:
+            return
+        records = np.empty(1, dtype=self._ring.dtype)
+        records['time'] = int(t)
+        records['data'] = data_buf
+        self._ring.append(records)
+
+    def _get_buffer_duration(self, data_buf):
+        # every buffer is a single chunk with one timestamp
+        return 0
+
+    def _get_segment_offset(self, start_ms):
+        # points files keep the timestamps as given, so every segment uses the start of acquisition
+        return 0
+
+    def _has_index(self):
+        # ReaderPoints bisects the timestamp of each chunk, so points files are not indexed
+        return False
+
+    def _open_write(self):
+        # an index left by an older version would no longer match the data
+        self.fqpn.with_suffix('.idx').unlink(missing_ok=True)
+        super()._open_write()
 
     def _write_to_file(self, data_buf, t=None):
         ts_bytes = struct.pack('!Q', t)
+        data_buf = np.ascontiguousarray(data_buf)
         self._fid.write(ts_bytes)
-        data_buf.tofile(self._fid)
+        self._fid.write(data_buf)
+        self._flush(len(ts_bytes) + data_buf.nbytes)
+
+
+class WriterCompressed(WriterStream):
+    # Stream writer which stores the samples in compressed chunks of cfg.chunk_samples,
+    # see encode_chunk. Samples are held in memory until a chunk is full, readers from
+    # get_reader() include those samples, readers of the file only see complete chunks
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lgr = utils.get_object_logger(__name__, self.name)
+        self.cfg = CompressedConfig()
+        self._table_fid = None
+        self._chunk_buf = None
+        self._chunk_len = 0
+        self._first_sample = 0
+        self._chunk_lock = Lock()
+
+    @classmethod
+    def get_config_type(cls):
+        return CompressedConfig
+
+    @property
+    def table_fqpn(self):
+        return self.fqpn.with_suffix('.ctbl')
+
+    def _get_file_reader(self, ring=None):
+        return ReaderCompressed(self.name, self.fqpn, self.cfg, self.sensor, self._mmap_cache,
+                                self._notifier, ring, source=self._get_chunks)
+
+    def _get_chunks(self, fqpn):
+        # the table and pending samples must be read together, otherwise a chunk written
+        # in between would be missed or seen twice
+        with self._chunk_lock:
+            table = self._mmap_cache.get(fqpn.with_suffix('.ctbl'), CHUNK_TABLE_DTYPE)
+            # the reader may be for a previous segment which is now complete
+            if fqpn != self.fqpn or self._chunk_buf is None:
+                return table, None
+            tail = self._chunk_buf[:self._chunk_len].copy()
+        return table, tail
+
+    def open(self, sensor=None):
+        if self.cfg.codec not in COMPRESSION_CODECS or (self.cfg.codec == 'lz4' and lz4 is None):
+            self._lgr.warning(f'{self.name}: codec {self.cfg.codec} is not available, using zlib')
+            self.cfg.codec = 'zlib'
+        if self._table_fid:
+            self._table_fid.close()
+            self._table_fid = None
+        super().open(sensor)
+
+    def _open_write(self):
+        super()._open_write()
+        self._table_fid = open(self.table_fqpn, 'w+b')
+        self._chunk_buf = None
+        self._chunk_len = 0
+        self._first_sample = 0
+        self._last_idx = 0
+
+    def _write_chunk(self):
+        # called with _chunk_lock held
+        payload = encode_chunk(self._chunk_buf[:self._chunk_len], self.cfg.codec, self.cfg.compression_level)
+        try:
+            offset = self._fid.tell()
+            self._fid.write(payload)
+            self._table_fid.write(struct.pack('!QQQQ', offset, len(payload), self._first_sample, self._chunk_len))
+            # chunks are large, so they are always made visible to readers immediately
+            self._fid.flush()
+            self._table_fid.flush()
+        except OSError as e:
+            self._lgr.error(f'{self.name}: {e}')
+        self._first_sample += self._chunk_len
+        self._chunk_len = 0
+
+    def _write_to_file(self, data_buf, t=None):
+        if self._fid is None:
+            return
+        data_buf = np.asarray(data_buf)
+        with self._chunk_lock:
+            if self._chunk_buf is None:
+                self._chunk_buf = np.empty(self.cfg.chunk_samples, dtype=data_buf.dtype)
+            pos = 0
+            while pos < len(data_buf):
+                samples = min(self.cfg.chunk_samples - self._chunk_len, len(data_buf) - pos)
+                self._chunk_buf[self._chunk_len:self._chunk_len + samples] = data_buf[pos:pos + samples]
+                self._chunk_len += samples
+                pos += samples
+                if self._chunk_len == self.cfg.chunk_samples:
+                    self._write_chunk()
+        self._last_idx += len(data_buf)
+        if t is not None and len(data_buf) > 0:
+            self._index_buffer(self._get_index_time(t), (self._last_idx - 1) * data_buf.itemsize, len(data_buf))
+        if len(data_buf) > 0:
+            # the chunks are already flushed, but may still need an fsync
+            self._synced = False
+        self._flush(0)
+
+    def _close_files(self):
+        with self._chunk_lock:
+            if self._fid and self._chunk_len > 0:
+                self._write_chunk()
+        super()._close_files()
+        if self._table_fid:
+            self._table_fid.close()
+            self._table_fid = None
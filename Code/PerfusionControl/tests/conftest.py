@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+""" Shared fixtures for the pyPerfusion tests
+
+Every test writes to a temporary copy of the test folder structure, so no
+study or test data in ~/Documents is touched
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.utils as utils
+from pyPerfusion.folder_management import FolderManagement
+
+
+class FakeSensor:
+    # the parts of a Sensor used by the strategies, acquisition starts on a whole second
+    def __init__(self, name: str = 'Test Sensor', sampling_period_ms: int = 1, data_dtype=np.float64):
+        self.name = name
+        self.sampling_period_ms = sampling_period_ms
+        self.data_dtype = np.dtype(data_dtype)
+        self.acq_start_ms = int(utils.get_epoch_ms()) // 1_000 * 1_000
+
+    def get_acq_start_ms(self):
+        return self.acq_start_ms
+
+
+@pytest.fixture(autouse=True)
+def test_config(tmp_path, monkeypatch):
+    fm = FolderManagement('LPTest', base_path=tmp_path)
+    monkeypatch.setattr(PerfusionConfig, 'ACTIVE_CONFIG', fm)
+    return fm
+
+
+@pytest.fixture
+def sensor():
+    return FakeSensor()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+""" Tests for writing strategies through the background AsyncWriter
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+from conftest import FakeSensor
+
+
+def write_stream(name, signal, buffer_len, **cfg):
+    sensor = FakeSensor(name, sampling_period_ms=10)
+    writer = ReadWrite.WriterStream('Raw')
+    writer.cfg.ring_buffer_s = 0
+    for key, value in cfg.items():
+        setattr(writer.cfg, key, value)
+    writer.open(sensor)
+    for start in range(0, len(signal), buffer_len):
+        buf = signal[start:start + buffer_len]
+        writer.process_buffer(buf, sensor.get_acq_start_ms() + (start + len(buf) - 1) * 10)
+    return writer
+
+
+@pytest.mark.parametrize('segment_bytes', [0, 4_000])
+def test_async_matches_sync(segment_bytes):
+    signal = np.random.default_rng(0).normal(size=5_000)
+    sync = write_stream('Sync Sensor', signal, 100, segment_bytes=segment_bytes)
+    writer = write_stream('Async Sensor', signal, 100, segment_bytes=segment_bytes, async_write=True)
+    # the buffers reach the file once the queue is written
+    ReadWrite.get_async_writer().sync()
+    async_time, async_data = writer.get_reader().get_all()
+    sync_time, sync_data = sync.get_reader().get_all()
+    np.testing.assert_array_equal(async_data, signal)
+    np.testing.assert_array_equal(async_data, sync_data)
+    np.testing.assert_array_equal(async_time, sync_time)
+    writer.close()
+    sync.close()
+    assert writer.dropped_buffers == 0
+
+
+def test_buffer_is_copied_when_queued():
+    # _process may reuse its buffer, the queued copy must not change
+    signal = np.arange(100, dtype=np.float64)
+    sensor = FakeSensor('Reused Sensor', sampling_period_ms=10)
+    writer = ReadWrite.WriterStream('Raw')
+    writer.cfg.ring_buffer_s = 0
+    writer.cfg.async_write = True
+    writer.open(sensor)
+    buf = np.empty(10)
+    for start in range(0, 100, 10):
+        buf[:] = signal[start:start + 10]
+        writer.process_buffer(buf, sensor.get_acq_start_ms() + (start + 9) * 10)
+    writer.close()
+    np.testing.assert_array_equal(writer.get_reader().get_all()[1], signal)
+
+
+class BlockingWriter:
+    # stands in for a strategy whose disk has stalled
+    def __init__(self):
+        self.name = 'Blocking'
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.written = []
+        self._batching = False
+        self._fid = None
+
+    def _write_async(self, data_buf, t=None):
+        self.started.set()
+        self.release.wait(10)
+        self.written.append(data_buf)
+
+
+def test_full_queue_drops_or_waits():
+    async_writer = ReadWrite.AsyncWriter(max_queue=1)
+    writer = BlockingWriter()
+    assert async_writer.submit(writer, np.zeros(1))
+    assert writer.started.wait(10)
+    # the writer thread is busy with the first buffer, so the queue fills after one more
+    assert async_writer.submit(writer, np.ones(2))
+    assert not async_writer.submit(writer, np.ones(3), drop=True)
+    metrics = async_writer.get_metrics()
+    assert metrics.buffers_dropped == 1
+    assert metrics.samples_dropped == 3
+    assert metrics.queue_depth == 1
+
+    writer.release.set()
+    async_writer.sync()
+    assert [len(buf) for buf in writer.written] == [1, 2]
+    metrics = async_writer.get_metrics()
+    assert metrics.buffers_written == 2
+    assert metrics.max_latency_ms >= metrics.mean_latency_ms > 0
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" Tests for WriterCompressed and ReaderCompressed
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+from conftest import FakeSensor
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, np.int16, np.uint32])
+def test_chunk_round_trip(dtype):
+    rng = np.random.default_rng(0)
+    data = (rng.normal(size=1_000) * 1_000).cumsum().astype(dtype)
+    for codec in ReadWrite.COMPRESSION_CODECS:
+        if codec == 'lz4' and ReadWrite.lz4 is None:
+            continue
+        payload = ReadWrite.encode_chunk(data, codec, 6)
+        np.testing.assert_array_equal(ReadWrite.decode_chunk(payload, np.dtype(dtype), codec), data)
+
+
+def write_compressed(sensor, signal, buffer_len, chunk_samples):
+    writer = ReadWrite.WriterCompressed('Compressed')
+    writer.cfg.chunk_samples = chunk_samples
+    writer.cfg.ring_buffer_s = 0
+    writer.open(sensor)
+    for start in range(0, len(signal), buffer_len):
+        buf = signal[start:start + buffer_len]
+        writer.process_buffer(buf, sensor.get_acq_start_ms() + (start + len(buf) - 1) * sensor.sampling_period_ms)
+    return writer
+
+
+def test_stream_round_trip():
+    sensor = FakeSensor('Compressed Sensor', sampling_period_ms=10)
+    signal = np.sin(np.arange(10_000) / 50) * 100
+    writer = write_compressed(sensor, signal, 1_000, 4_096)
+
+    # the live reader includes the samples which are not yet in a complete chunk
+    live = writer.get_reader()
+    data_time, data = live.get_all()
+    np.testing.assert_array_equal(data, signal)
+    np.testing.assert_array_equal(data_time, np.arange(10_000) * 10)
+    # readers of the file only see complete chunks until the writer is closed
+    assert len(ReadWrite.read_file(writer.fqpn).get_all()[1]) == 8_192
+    writer.close()
+
+    reader = ReadWrite.read_file(writer.fqpn)
+    assert isinstance(reader, ReadWrite.ReaderCompressed)
+    data_time, data = reader.get_all(start_ms=25_000, end_ms=50_000)
+    np.testing.assert_array_equal(data, signal[2_500:5_000])
+    np.testing.assert_array_equal(data_time, np.arange(2_500, 5_000) * 10)
+    assert reader.get_last_acq()[1] == signal[-1]
+    assert writer.fqpn.stat().st_size < signal.nbytes
+    reader.close()
+
+
+def test_buffers_spanning_chunks():
+    sensor = FakeSensor('Spanning Sensor', sampling_period_ms=1)
+    signal = np.random.default_rng(1).normal(size=1_000)
+    writer = write_compressed(sensor, signal, 333, 100)
+    writer.close()
+    reader = ReadWrite.read_file(writer.fqpn)
+    np.testing.assert_array_equal(reader.get_all()[1], signal)
+    assert len(reader._open_table()) == 10
+    reader.close()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+""" Tests for app_conversion
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.Catalog as Catalog
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+from apps import app_conversion
+from conftest import FakeSensor
+
+
+@pytest.fixture
+def day_folder(monkeypatch):
+    for name in ('Good Sensor', 'Odd Sensor'):
+        writer = ReadWrite.WriterStream('Raw')
+        writer.cfg.ring_buffer_s = 0
+        writer.open(FakeSensor(name))
+        writer.process_buffer(np.arange(10, dtype=np.float64))
+        writer.close()
+
+    describe_file = Catalog.describe_file
+
+    def describe_some(fqpn, base_path):
+        if fqpn.name.startswith('Odd Sensor'):
+            raise ValueError('unreadable header')
+        return describe_file(fqpn, base_path)
+
+    monkeypatch.setattr(Catalog, 'describe_file', describe_some)
+    return PerfusionConfig.get_date_folder()
+
+
+def test_file_missing_from_catalog_is_converted(day_folder, capsys):
+    app_conversion.convert_folder(day_folder, workers=1)
+    assert (day_folder / 'Good Sensor_Raw.csv').exists()
+    assert (day_folder / 'Odd Sensor_Raw.csv').exists()
+    assert '1 files are not described by the catalog' in capsys.readouterr().out
+
+
+def test_file_missing_from_catalog_is_listed_when_filtered(day_folder, capsys):
+    app_conversion.convert_folder(day_folder, workers=1, sensor='Good%')
+    assert (day_folder / 'Good Sensor_Raw.csv').exists()
+    assert not (day_folder / 'Odd Sensor_Raw.csv').exists()
+    assert 'Odd Sensor_Raw.dat' in capsys.readouterr().out
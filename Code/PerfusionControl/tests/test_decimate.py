@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+""" Tests for the Decimate strategy
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+from conftest import FakeSensor
+
+
+def decimate(signal, chunk_len, name):
+    sensor = FakeSensor(name, sampling_period_ms=100)
+    strategy = Strategy_Processing.Decimate('Decimate')
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    outputs = []
+    times = []
+    for start in range(0, len(signal), chunk_len):
+        chunk = signal[start:start + chunk_len]
+        end_ms = sensor.get_acq_start_ms() + (start + len(chunk) - 1) * sensor.sampling_period_ms
+        out, t = strategy.process_buffer(chunk, end_ms)
+        if len(out) > 0:
+            outputs.append(np.copy(out))
+            times.append(t)
+    strategy.close()
+    return np.concatenate(outputs), np.array(times, dtype=np.int64) - sensor.get_acq_start_ms()
+
+
+def test_chunk_size_does_not_change_output():
+    rng = np.random.default_rng(0)
+    signal = rng.normal(size=2_000)
+    block, block_times = decimate(signal, len(signal), 'Block Sensor')
+    small, small_times = decimate(signal, 5, 'Small Sensor')
+    np.testing.assert_array_equal(small, block)
+    # the last kept sample of each 5 sample buffer is on the decimated grid, from the start of acquisition
+    assert np.all(small_times >= 0)
+    assert np.all(small_times % 1_000 == 0)
+    assert block_times[-1] == small_times[-1]
+
+
+def test_strategy_after_decimate():
+    # the decimated buffers are short (often empty), the next strategy must still see every sample
+    rng = np.random.default_rng(2)
+    signal = rng.normal(size=1_000)
+    sensor = FakeSensor('Chained Sensor', sampling_period_ms=100)
+    decimated = Strategy_Processing.Decimate('Decimate')
+    decimated.cfg.ring_buffer_s = 0
+    decimated.open(sensor)
+    average = Strategy_Processing.MovingAverage('Average')
+    average.cfg.window_len = 3
+    average.cfg.ring_buffer_s = 0
+    average.open(decimated.sensor)
+
+    outputs = []
+    averages = []
+    for start in range(0, len(signal), 5):
+        end_ms = sensor.get_acq_start_ms() + (start + 4) * sensor.sampling_period_ms
+        out, t = decimated.process_buffer(signal[start:start + 5], end_ms)
+        outputs.append(np.copy(out))
+        avg, avg_t = average.process_buffer(out, t)
+        averages.append(np.copy(avg))
+        assert len(avg) == len(out)
+    decimated.close()
+    average.close()
+
+    outputs = np.concatenate(outputs)
+    averages = np.concatenate(averages)
+    assert len(outputs) > 90
+    expected = np.convolve(np.concatenate((np.zeros(2), outputs)), np.ones(3), mode='valid') / 3
+    np.testing.assert_allclose(averages, expected)
+    assert average.get_reader().retrieve_buffer(0, len(outputs) + 10)[1].size == len(outputs)
+
+
+def test_samples_after_last_kept_sample():
+    sensor = FakeSensor('Counted Sensor', sampling_period_ms=100)
+    strategy = Strategy_Processing.Decimate('Decimate')
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    # the first sample kept is one group delay (40 samples) from the start
+    out, t = strategy.process_buffer(np.zeros(45), sensor.get_acq_start_ms() + 4_400)
+    assert len(out) == 1
+    assert strategy._samples_after == 4
+    # no sample of the next buffer is kept, so the last kept sample is 3 samples further back
+    out, t = strategy.process_buffer(np.zeros(3), sensor.get_acq_start_ms() + 4_700)
+    assert len(out) == 0
+    assert strategy._samples_after == 7
+    strategy.close()
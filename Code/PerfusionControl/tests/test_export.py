@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+""" Tests for exporting data files to CSV and columnar npz
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+
+
+def read_csv(fqpn):
+    rows = [line.split(', ') for line in fqpn.read_text().splitlines()]
+    return [row[0] for row in rows], np.array([[float(v) for v in row[1].split(',')] for row in rows])
+
+
+def write_segmented_stream(sensor, samples: int = 2_000, buffer_len: int = 100):
+    writer = ReadWrite.WriterStream('Raw')
+    writer.cfg.segment_bytes = 4_000
+    writer.open(sensor)
+    data = np.arange(samples, dtype=np.float64)
+    for start in range(0, samples, buffer_len):
+        writer.process_buffer(data[start:start + buffer_len], sensor.get_acq_start_ms() + start + buffer_len - 1)
+    writer.close()
+    return writer._manifest_fqpn, data
+
+
+def test_segmented_stream_to_csv_and_columnar(sensor):
+    manifest, data = write_segmented_stream(sensor)
+    reader = ReadWrite.read_file(manifest)
+    assert len(reader._load_manifest()) > 1
+    expected_time = np.asarray(reader.get_all()[0], dtype=np.float64) + sensor.get_acq_start_ms()
+    reader.close()
+
+    ReadWrite.save_to_csv(manifest)
+    times, values = read_csv(manifest.with_suffix('.csv'))
+    np.testing.assert_array_equal(values[:, 0], data)
+    assert times == ReadWrite._format_csv_time(expected_time).tolist()
+
+    npz = ReadWrite.save_to_columnar(manifest)
+    ts, columns = ReadWrite.read_columnar(npz)
+    np.testing.assert_array_equal(columns[:, 0], data)
+    np.testing.assert_array_equal(ts, expected_time)
+
+    # a time range which spans a segment boundary
+    start_ms, end_ms = sensor.get_acq_start_ms() + 950, sensor.get_acq_start_ms() + 1_050
+    ts, columns = ReadWrite.read_columnar(ReadWrite.save_to_columnar(manifest, start_ms=start_ms, end_ms=end_ms))
+    np.testing.assert_array_equal(columns[:, 0], data[950:1_050])
+
+
+def test_segmented_points_to_csv(sensor):
+    writer = ReadWrite.WriterPoints('RawPoints')
+    writer.cfg = ReadWrite.WriterPointsConfig(samples_per_timestamp=2, bytes_per_timestamp=8, segment_bytes=200)
+    writer.open(sensor)
+    times = sensor.get_acq_start_ms() + np.arange(50) * 1_000
+    for idx, t in enumerate(times):
+        writer.process_buffer(np.array([idx, -idx], dtype=np.float64), np.uint64(t))
+    writer.close()
+
+    ReadWrite.save_to_csv(writer._manifest_fqpn)
+    csv_times, values = read_csv(writer._manifest_fqpn.with_suffix('.csv'))
+    np.testing.assert_array_equal(values, np.column_stack([np.arange(50), -np.arange(50)]))
+    assert csv_times == ReadWrite._format_csv_time(times).tolist()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Tests for the Filter strategy
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+from conftest import FakeSensor
+
+
+def open_filter(name, sampling_period_ms, **cfg):
+    strategy = Strategy_Processing.Filter('Filter')
+    for key, value in cfg.items():
+        setattr(strategy.cfg, key, value)
+    strategy.open(FakeSensor(name, sampling_period_ms=sampling_period_ms))
+    return strategy
+
+
+@pytest.mark.parametrize('cfg', [dict(cutoff_hz=10.0), dict(cutoff_hz=2.0, notch_hz=60.0),
+                                 dict(filter_type='bandpass', cutoff_hz=1.0, cutoff_high_hz=5.0)])
+def test_frequency_above_nyquist_passes_data_through(cfg):
+    # 10 Hz sampling, so every frequency must be below 5 Hz
+    strategy = open_filter('Slow Sensor', 100, **cfg)
+    data = np.random.default_rng(0).normal(size=50)
+    out, _ = strategy.process_buffer(data, 4_900)
+    np.testing.assert_array_equal(out, data)
+    strategy.close()
+
+
+def test_buffers_match_whole_signal():
+    signal_module = pytest.importorskip('scipy.signal')
+    strategy = open_filter('Fast Sensor', 10, cutoff_hz=5.0, notch_hz=30.0)
+    data = np.random.default_rng(0).normal(size=1_000) + 10
+    out = np.concatenate([np.copy(strategy.process_buffer(data[i:i + 7], (i + 6) * 10)[0])
+                          for i in range(0, len(data), 7)])
+    expected, _ = signal_module.sosfilt(strategy._sos, data, zi=signal_module.sosfilt_zi(strategy._sos) * data[0])
+    np.testing.assert_allclose(out, expected)
+    strategy.close()
+
+
+def test_single_tap_config(test_config):
+    pytest.importorskip('scipy.signal')
+    with open(PerfusionConfig.get_cfg_filename('strategies'), 'wt') as fid:
+        fid.write('[Gain]\nclass = Filter\ntaps = 0.5\n')
+    strategy = Strategy_Processing.Filter('Gain')
+    PerfusionConfig.read_into_dataclass('strategies', 'Gain', strategy.cfg)
+    assert strategy.cfg.taps == [0.5]
+    strategy.open(FakeSensor('Gain Sensor', sampling_period_ms=10))
+    data = np.random.default_rng(0).normal(size=50)
+    out, _ = strategy.process_buffer(data, 490)
+    np.testing.assert_array_equal(out, data * 0.5)
+    strategy.close()
+
+
+def test_scalar_tap():
+    pytest.importorskip('scipy.signal')
+    strategy = open_filter('Scalar Sensor', 10, taps=2.0)
+    assert strategy.cfg.taps == [2.0]
+    data = np.arange(10, dtype=np.float64)
+    out, _ = strategy.process_buffer(data, 90)
+    np.testing.assert_array_equal(out, data * 2)
+    strategy.close()
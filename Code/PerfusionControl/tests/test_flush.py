@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+""" Tests for the flush and fsync policy of WriterStream
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+
+
+def open_writer(sensor, **cfg):
+    writer = ReadWrite.WriterStream('Raw')
+    for key, value in cfg.items():
+        setattr(writer.cfg, key, value)
+    writer.open(sensor)
+    return writer
+
+
+def write(writer, sensor, samples: int = 100):
+    writer.process_buffer(np.arange(samples, dtype=np.float64), sensor.get_acq_start_ms() + samples - 1)
+    if writer.cfg.async_write:
+        ReadWrite.get_async_writer().sync()
+
+
+@pytest.mark.parametrize('async_write', [False, True])
+def test_interval_flush_without_new_data(sensor, async_write):
+    writer = open_writer(sensor, flush_interval_ms=50, async_write=async_write)
+    write(writer, sensor)
+    assert os.path.getsize(writer.fqpn) == 0
+
+    time.sleep(0.06)
+    writer.flush_pending()
+    if async_write:
+        ReadWrite.get_async_writer().sync()
+    assert os.path.getsize(writer.fqpn) == 800
+    writer.close()
+
+
+def test_forced_flush(sensor):
+    writer = open_writer(sensor, flush_interval_ms=60_000)
+    write(writer, sensor)
+    writer.flush_pending()
+    assert os.path.getsize(writer.fqpn) == 0
+    writer.flush_pending(force=True)
+    assert os.path.getsize(writer.fqpn) == 800
+    writer.close()
+
+
+def test_fsync_only_when_data_is_unsynced(sensor, monkeypatch):
+    synced = []
+    monkeypatch.setattr(ReadWrite.os, 'fsync', lambda fileno: synced.append(fileno))
+    writer = open_writer(sensor, fsync_interval_ms=20, index_interval_ms=0)
+    write(writer, sensor)
+    assert len(synced) == 0
+
+    time.sleep(0.03)
+    writer.flush_pending()
+    assert len(synced) == 1
+    time.sleep(0.03)
+    writer.flush_pending()
+    assert len(synced) == 1
+    writer.close()
+
+
+def test_flush_markers_are_not_counted_as_buffers(sensor):
+    writer = open_writer(sensor, flush_interval_ms=60_000)
+    async_writer = ReadWrite.AsyncWriter()
+    queued = time.perf_counter()
+    async_writer._write_batch([(writer, np.arange(100, dtype=np.float64), sensor.get_acq_start_ms() + 99, queued),
+                               (writer, None, True, queued)])
+    metrics = async_writer.get_metrics()
+    assert metrics.batches == 1
+    assert metrics.buffers_written == 1
+    assert metrics.mean_latency_ms == metrics.last_latency_ms
+    # the marker in the batch forced the flush
+    assert os.path.getsize(writer.fqpn) == 800
+    writer.close()
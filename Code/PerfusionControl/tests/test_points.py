@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+""" Tests for WriterPoints and ReaderPoints
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+
+
+def test_points_round_trip_without_index(sensor):
+    writer = ReadWrite.WriterPoints('Points')
+    writer.cfg.bytes_per_timestamp = 8
+    writer.cfg.samples_per_timestamp = 2
+    writer.cfg.ring_buffer_s = 0
+    writer.cfg.fsync_interval_ms = 1
+    # left by a previous version, which indexed points files
+    writer._base_path = ReadWrite.PerfusionConfig.get_date_folder()
+    stale = writer._base_path / f'{sensor.name}_Points.idx'
+    stale.write_bytes(b'\0' * ReadWrite.INDEX_DTYPE.itemsize)
+
+    writer.open(sensor)
+    start_ms = sensor.get_acq_start_ms()
+    for chunk in range(50):
+        writer.process_buffer(np.array([chunk, -chunk], dtype=np.float64), start_ms + chunk * 1_000)
+    writer.close()
+    assert not writer.fqpn.with_suffix('.idx').exists()
+
+    reader = writer.get_reader()
+    data_time, data = reader.get_all(start_ms=start_ms + 10_000, end_ms=start_ms + 20_000)
+    np.testing.assert_array_equal(data_time - start_ms, np.arange(10, 20) * 1_000)
+    np.testing.assert_array_equal(data[:, 0], np.arange(10, 20))
+    np.testing.assert_array_equal(data[:, 1], -np.arange(10, 20))
+    assert reader.get_last_acq(index=0) == (start_ms + 49_000, 49)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+""" Tests for the PulseAnalyzer strategy
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+from conftest import FakeSensor
+
+
+def make_pressure(period_ms):
+    # 60 then 90 bpm, a 10 s pause which restarts the detection, then 72 bpm at a higher pressure
+    rng = np.random.default_rng(0)
+    parts = []
+    for bpm, seconds, mean in ((60, 20, 80), (90, 20, 80), (0, 10, 50), (72, 20, 100)):
+        t = np.arange(int(seconds * 1_000 / period_ms)) * period_ms / 1_000
+        parts.append(mean + 20 * np.sin(2 * np.pi * bpm / 60 * t) + 0.5 * rng.normal(size=len(t)))
+    return np.concatenate(parts)
+
+
+def analyze(signal, chunk_len, period_ms):
+    sensor = FakeSensor(f'Pulse {chunk_len}', sampling_period_ms=period_ms)
+    analyzer = Strategy_Processing.PulseAnalyzer('Pulse')
+    analyzer.open(sensor)
+    reader = analyzer.get_reader()
+    for start in range(0, len(signal), chunk_len):
+        chunk = signal[start:start + chunk_len]
+        analyzer.process_buffer(chunk, sensor.get_acq_start_ms() + (start + len(chunk) - 1) * period_ms)
+    ts, beats = reader.get_all()
+    analyzer.close()
+    return np.asarray(ts, dtype=np.int64) - sensor.get_acq_start_ms(), np.array(beats)
+
+
+def test_beats_do_not_depend_on_buffer_size():
+    period_ms = 10
+    signal = make_pressure(period_ms)
+    block_ts, block_beats = analyze(signal, len(signal), period_ms)
+    rates = block_beats[:, Strategy_Processing.BEAT_STATS.index('rate_bpm')]
+    assert np.sum(np.abs(rates - 60) < 3) >= 15
+    assert np.sum(np.abs(rates - 90) < 3) >= 25
+    assert np.sum(np.abs(rates - 72) < 3) >= 15
+    for chunk_len in (5, 50, 500, 777):
+        ts, beats = analyze(signal, chunk_len, period_ms)
+        np.testing.assert_array_equal(ts, block_ts)
+        np.testing.assert_allclose(beats, block_beats, rtol=1e-12)
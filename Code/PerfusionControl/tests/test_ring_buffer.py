@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" Tests for serving live reads from the in-memory ring buffer
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+from conftest import FakeSensor
+
+
+def make_records(first: int, count: int):
+    records = np.zeros(count, dtype=ReadWrite.get_shm_record_dtype(np.float64))
+    records['time'] = np.arange(first, first + count) * 10
+    records['data'] = np.arange(first, first + count)
+    return records
+
+
+def test_ring_wraps_around():
+    ring = ReadWrite.RingBuffer(10, ReadWrite.get_shm_record_dtype(np.float64))
+    assert ring.get_last(1) is None
+    ring.append(make_records(0, 6))
+    np.testing.assert_array_equal(ring.get_all()['data'], np.arange(6))
+    np.testing.assert_array_equal(ring.get_last(20)['data'], np.arange(6))
+    for first in range(6, 25, 3):
+        ring.append(make_records(first, 3))
+
+    # 27 records written, the last 10 are kept in order
+    np.testing.assert_array_equal(ring.get_last(10)['data'], np.arange(17, 27))
+    np.testing.assert_array_equal(ring.get_last(4)['data'], np.arange(23, 27))
+    assert ring.get_last(11) is None
+    assert ring.get_all() is None
+    np.testing.assert_array_equal(ring.get_since(200)['data'], np.arange(20, 27))
+    # older records were overwritten, so the request must go to the file
+    assert ring.get_since(100) is None
+
+
+def test_append_larger_than_capacity():
+    ring = ReadWrite.RingBuffer(10, ReadWrite.get_shm_record_dtype(np.float64))
+    ring.append(make_records(0, 7))
+    ring.append(make_records(7, 25))
+    np.testing.assert_array_equal(ring.get_last(10)['data'], np.arange(22, 32))
+    np.testing.assert_array_equal(ring.get_last(10)['time'], np.arange(22, 32) * 10)
+
+
+def write_stream(sensor, buffers, **cfg):
+    writer = ReadWrite.WriterStream('Raw')
+    for key, value in cfg.items():
+        setattr(writer.cfg, key, value)
+    writer.open(sensor)
+    for buf_no in range(buffers):
+        buf = np.arange(buf_no * 10, buf_no * 10 + 10, dtype=np.float64)
+        writer.process_buffer(buf, sensor.get_acq_start_ms() + (buf_no * 10 + 9) * sensor.sampling_period_ms)
+    return writer
+
+
+@pytest.mark.parametrize('last_ms, samples_needed', [(0, 20), (200, 1_000), (500, 7), (-1, 40)])
+def test_ring_matches_file(last_ms, samples_needed):
+    sensor = FakeSensor('Ring Sensor', sampling_period_ms=10)
+    # a 1 s ring holds 100 samples, the most recent 500 ms of requests are served from it
+    writer = write_stream(sensor, 8 if last_ms >= 0 else 5, ring_buffer_s=1)
+    live = writer.get_reader()
+    from_file = writer._get_file_reader()
+    assert live._ring is not None and from_file._ring is None
+    ring_time, ring_data = live.retrieve_buffer(last_ms, samples_needed)
+    file_time, file_data = from_file.retrieve_buffer(last_ms, samples_needed)
+    np.testing.assert_array_equal(ring_data, file_data)
+    np.testing.assert_array_equal(ring_time, file_time)
+    assert live.get_last_acq() == (790 if last_ms >= 0 else 490, 79 if last_ms >= 0 else 49)
+    writer.close()
+
+
+def test_shared_memory_round_trip():
+    sensor = FakeSensor('Shared Sensor', sampling_period_ms=10)
+    writer = write_stream(sensor, 5, ring_buffer_s=1, shared_memory=True)
+    reader = ReadWrite.SharedMemoryReader(ReadWrite.get_shared_memory_name(sensor.name, 'Raw'))
+    try:
+        assert reader.capacity == 100
+        assert reader.sampling_period_ms == 10
+        assert reader.get_acq_start_ms() == sensor.get_acq_start_ms()
+        data_time, data, dropped = reader.get_new_data()
+        np.testing.assert_array_equal(data, np.arange(50))
+        np.testing.assert_array_equal(data_time, np.arange(50) * 10)
+        assert dropped == 0
+
+        # 150 more samples, the oldest 50 of which are overwritten before they are read
+        for buf_no in range(5, 20):
+            buf = np.arange(buf_no * 10, buf_no * 10 + 10, dtype=np.float64)
+            writer.process_buffer(buf, sensor.get_acq_start_ms() + (buf_no * 10 + 9) * 10)
+        data_time, data, dropped = reader.get_new_data()
+        np.testing.assert_array_equal(data, np.arange(100, 200))
+        assert dropped == 50
+        assert reader.get_last_acq() == (1_990, 199)
+        data_time, data = reader.retrieve_buffer(200, 1_000)
+        np.testing.assert_array_equal(data, np.arange(179, 200))
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+""" Tests for the Rollup strategy
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+
+import pyPerfusion.PerfusionConfig as PerfusionConfig
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+
+
+def test_single_level_config(test_config, sensor):
+    with open(PerfusionConfig.get_cfg_filename('strategies'), 'wt') as fid:
+        fid.write('[Rollup_1min]\nclass = Rollup\nlevels_s = 60\n')
+    strategy = Strategy_Processing.Rollup('Rollup_1min')
+    strategy.cfg = Strategy_Processing.RollupConfig()
+    PerfusionConfig.read_into_dataclass('strategies', 'Rollup_1min', strategy.cfg)
+    assert strategy.cfg.levels_s == [60.0]
+
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    # two minutes of samples, one per 100 ms
+    sample_ms = np.arange(0, 120_000, 100)
+    for start in range(0, len(sample_ms), 100):
+        t = sample_ms[start:start + 100]
+        strategy.process_buffer(t.astype(np.float64), t + sensor.get_acq_start_ms())
+    reader = strategy.get_reader()
+    strategy.close()
+
+    assert list(reader.level_readers.keys()) == [60_000]
+    data_time, data = reader.get_all(60)
+    # min, max, mean and count of each minute (of the epoch), the incomplete bucket is written on close
+    assert np.all(data_time % 60_000 == 0)
+    assert np.sum(data[:, 3]) == len(sample_ms)
+    assert np.all(data[:, 3] <= 600)
+
+
+def test_scalar_level(sensor):
+    strategy = Strategy_Processing.Rollup('Rollup')
+    strategy.cfg.levels_s = 10
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    assert strategy.cfg.levels_s == [10.0]
+    assert [level['ms'] for level in strategy._levels] == [10_000]
+    strategy.close()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" Tests for running the strategies of a Sensor as a graph
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+
+# Sensor imports the hardware drivers
+Sensor = pytest.importorskip('pyPerfusion.Sensor')
+
+
+class AddStrategy(ReadWrite.WriterStream):
+    # adds offset to its input and records the buffers it was given
+    def __init__(self, name: str, offset: float, calls: list):
+        super().__init__(name)
+        self.cfg.ring_buffer_s = 0
+        self._offset = offset
+        self._calls = calls
+        self._lock = threading.Lock()
+        self.inputs = []
+
+    def _process(self, buffer, t=None):
+        with self._lock:
+            self._calls.append(self.name)
+        self.inputs.append(np.copy(buffer))
+        self._processed_buffer = buffer + self._offset
+
+
+def make_sensor(sensor, entries, calls):
+    # entries are (name, offset, input name) in the order they are added
+    graph = Sensor.Sensor('Graph Sensor')
+    strategies = {}
+    for name, offset, input_name in entries:
+        strategy = AddStrategy(name, offset, calls)
+        strategy.open(sensor)
+        graph._add_to_graph(strategy, input_name)
+        strategies[name] = strategy
+    return graph, strategies
+
+
+@pytest.mark.parametrize('strategy_names', ['Raw, LowPass_2Hz(Raw), Pulse(LowPass_2Hz), RMS_11pt(), MovAvg',
+                                            'Raw,LowPass_2Hz(Raw),Pulse( LowPass_2Hz ),RMS_11pt( ),MovAvg,'])
+def test_parse_strategy_names(strategy_names):
+    assert Sensor.parse_strategy_names(strategy_names) == [('Raw', None), ('LowPass_2Hz', 'Raw'),
+                                                           ('Pulse', 'LowPass_2Hz'), ('RMS_11pt', Sensor.SENSOR_INPUT),
+                                                           ('MovAvg', None)]
+    assert Sensor.parse_strategy_names('') == []
+
+
+def test_inputs_run_first(sensor):
+    # each strategy runs once its input has run, strategies which are ready run in the order they were added
+    calls = []
+    graph, strategies = make_sensor(sensor, [('Plus10', 10, 'Raw'), ('Raw', 0, Sensor.SENSOR_INPUT),
+                                             ('Plus1', 1, None), ('Direct', 100, Sensor.SENSOR_INPUT)], calls)
+    assert graph.get_strategy_input('Plus1') == 'Raw'
+    graph._process_strategies(np.zeros(4), None)
+    assert calls == ['Raw', 'Direct', 'Plus10', 'Plus1']
+    np.testing.assert_array_equal(strategies['Plus10'].inputs[0], np.zeros(4))
+    np.testing.assert_array_equal(strategies['Plus1'].inputs[0], np.zeros(4))
+    np.testing.assert_array_equal(strategies['Direct'].inputs[0], np.zeros(4))
+
+    calls.clear()
+    graph._process_strategies(np.ones(4), None)
+    assert calls == ['Raw', 'Direct', 'Plus10', 'Plus1']
+
+
+def test_chained_outputs(sensor):
+    calls = []
+    graph, strategies = make_sensor(sensor, [('Raw', 0, None), ('Plus1', 1, None), ('Plus2', 2, None)], calls)
+    graph._process_strategies(np.zeros(3), None)
+    np.testing.assert_array_equal(strategies['Plus2'].inputs[0], np.ones(3))
+
+
+def test_unknown_input_and_cycle_are_not_run(sensor, caplog):
+    calls = []
+    graph, strategies = make_sensor(sensor, [('Raw', 0, Sensor.SENSOR_INPUT), ('Orphan', 1, 'Missing'),
+                                             ('CycleA', 1, 'CycleB'), ('CycleB', 1, 'CycleA'),
+                                             ('Plus1', 1, 'Raw')], calls)
+    with caplog.at_level(logging.ERROR):
+        graph._process_strategies(np.zeros(2), None)
+    assert calls == ['Raw', 'Plus1']
+    errors = caplog.text
+    assert 'Orphan' in errors and 'CycleA' in errors and 'CycleB' in errors
+
+
+def test_thread_pool_matches_sequential(sensor):
+    entries = [('Raw', 0, Sensor.SENSOR_INPUT), ('A1', 1, 'Raw'), ('A2', 2, 'A1'), ('B1', 10, 'Raw'),
+               ('B2', 20, 'B1'), ('C1', 100, Sensor.SENSOR_INPUT)]
+    signal = np.random.default_rng(0).normal(size=(50, 8))
+    results = {}
+    for workers in (0, 4):
+        graph, strategies = make_sensor(sensor, entries, [])
+        if workers:
+            graph._pool = ThreadPoolExecutor(max_workers=workers)
+        for buf in signal:
+            graph._process_strategies(buf, None)
+        if graph._pool is not None:
+            graph._pool.shutdown()
+        results[workers] = {name: np.array(strategy.inputs) for name, strategy in strategies.items()}
+        for strategy in strategies.values():
+            strategy.close()
+
+    for name, inputs in results[0].items():
+        np.testing.assert_array_equal(results[4][name], inputs)
+    # every strategy saw the buffers in order
+    np.testing.assert_array_equal(results[4]['A2'], signal + 1)
+    np.testing.assert_array_equal(results[4]['B2'], signal + 10)
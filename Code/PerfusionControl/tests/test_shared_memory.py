@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" Tests for exporting ring buffers through shared memory
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_ReadWrite as ReadWrite
+
+
+SAMPLES_PER_RECORD = 32
+CAPACITY = 64
+
+
+class SimpleSensor:
+    sampling_period_ms = 1
+
+    def get_acq_start_ms(self):
+        return 0
+
+
+def make_records(first: int, count: int):
+    # every sample of a record equals its time, so a record mixing two writes is detected
+    records = np.zeros(count, dtype=ReadWrite.get_shm_record_dtype(np.float64, SAMPLES_PER_RECORD))
+    records['time'] = np.arange(first, first + count)
+    records['data'] = records['time'][:, np.newaxis]
+    return records
+
+
+def write_records(name, appends, ready, done):
+    ring = ReadWrite.SharedRingBuffer(name, CAPACITY, ReadWrite.get_shm_record_dtype(np.float64, SAMPLES_PER_RECORD),
+                                      SimpleSensor())
+    ready.set()
+    written = 0
+    for count in np.resize([1, 7, 48, 63], appends):
+        ring.append(make_records(written, int(count)))
+        written += int(count)
+    done.wait(30)
+    ring.close()
+
+
+def test_concurrent_reader_never_returns_torn_records():
+    name = f'{ReadWrite.SHM_PREFIX}test_{os.getpid()}'
+    ctx = multiprocessing.get_context('spawn')
+    ready, done = ctx.Event(), ctx.Event()
+    writer = ctx.Process(target=write_records, args=(name, 20_000, ready, done))
+    writer.start()
+    try:
+        assert ready.wait(30)
+        reader = ReadWrite.SharedMemoryReader(name)
+        expected = 0
+        reads = 0
+        while writer.is_alive() and not done.is_set():
+            data_time, data, dropped = reader.get_new_data()
+            assert np.all(data == data_time[:, np.newaxis].astype(np.float64))
+            assert np.array_equal(data_time, np.arange(expected + dropped, expected + dropped + len(data_time)))
+            expected += dropped + len(data_time)
+            reads += 1
+            if expected >= 20_000 // 4 * (1 + 7 + 48 + 63):
+                break
+        reader.close()
+        assert reads > 1
+    finally:
+        done.set()
+        writer.join(30)
+    assert writer.exitcode == 0
+
+
+def test_reader_in_writer_process():
+    name = f'{ReadWrite.SHM_PREFIX}test_local_{os.getpid()}'
+    ring = ReadWrite.SharedRingBuffer(name, CAPACITY, ReadWrite.get_shm_record_dtype(np.float64, SAMPLES_PER_RECORD),
+                                      SimpleSensor())
+    ring.append(make_records(0, 10))
+    reader = ReadWrite.SharedMemoryReader(name)
+    data_time, data, dropped = reader.get_new_data()
+    assert np.array_equal(data_time, np.arange(10)) and dropped == 0
+    reader.close()
+    # only the writer removes the memory
+    shared_memory.SharedMemory(name=name).close()
+    ring.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+""" Tests for the SpectrumAnalyzer strategy
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+from conftest import FakeSensor
+
+
+@pytest.mark.parametrize('chunk_len', [77, 1_000, 5_000])
+def test_spectra_match_welch(chunk_len):
+    signal_module = pytest.importorskip('scipy.signal')
+    sensor = FakeSensor(f'Spectrum {chunk_len}', sampling_period_ms=2)
+    analyzer = Strategy_Processing.SpectrumAnalyzer('Spectrum')
+    analyzer.cfg.segment_len = 256
+    analyzer.cfg.segments_per_spectrum = 5
+    analyzer.open(sensor)
+    reader = analyzer.get_reader()
+
+    rng = np.random.default_rng(0)
+    t = np.arange(20_000) * sensor.sampling_period_ms / 1_000
+    signal = 3 + 2 * np.sin(2 * np.pi * 62.5 * t) + 0.3 * rng.normal(size=len(t))
+    for start in range(0, len(signal), chunk_len):
+        chunk = signal[start:start + chunk_len]
+        analyzer.process_buffer(chunk, sensor.get_acq_start_ms() + (start + len(chunk) - 1) * 2)
+
+    # every segment (hop 128) is used in exactly one spectrum of 5 segments (5 * 128 samples)
+    ts, psd = reader.get_all()
+    spectrum_len = 5 * 128
+    assert len(ts) == ((len(signal) - 256) // 128 + 1) // 5
+    for idx in range(len(ts)):
+        start = idx * spectrum_len
+        _, expected = signal_module.welch(signal[start:start + spectrum_len + 128], fs=500, nperseg=256,
+                                          noverlap=128)
+        np.testing.assert_allclose(psd[idx], expected, rtol=1e-9, atol=1e-12)
+        assert ts[idx] == sensor.get_acq_start_ms() + (start + spectrum_len + 127) * 2
+    assert reader.get_last_acq()[1] == pytest.approx(62.5)
+    analyzer.close()
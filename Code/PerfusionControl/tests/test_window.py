@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+""" Tests for the RMS and MovingAverage strategies
+
+@project: LiverPerfusion NIH
+@author: John Kakareka, NIH
+
+This work was created by an employee of the US Federal Gov
+and under the public domain.
+"""
+import numpy as np
+import pytest
+
+import pyPerfusion.Strategy_Processing as Strategy_Processing
+
+
+class LoopRMS(Strategy_Processing.RMS):
+    # the original implementation, updated a sample at a time
+    def _process(self, buffer, t=None):
+        if self._window_buffer is None:
+            self._window_buffer = np.zeros(self.cfg.window_len, dtype=self.data_dtype)
+        for sample in buffer:
+            sqr = sample * sample
+            front = self._window_buffer[0]
+            self._window_buffer = np.roll(self._window_buffer, -1)
+            self._window_buffer[-1] = sqr
+            self._sum += sqr - front
+            rms = np.sqrt(self._sum / self.cfg.window_len)
+            self._processed_buffer = np.roll(self._processed_buffer, -1)
+            self._processed_buffer[-1] = rms
+
+
+class LoopMovingAverage(Strategy_Processing.MovingAverage):
+    # the original implementation, updated a sample at a time
+    def _process(self, buffer, t=None):
+        if self._window_buffer is None:
+            self._window_buffer = np.zeros(self.cfg.window_len, dtype=self.data_dtype)
+        for sample in buffer:
+            front = self._window_buffer[0]
+            self._window_buffer = np.roll(self._window_buffer, -1)
+            self._window_buffer[-1] = sample
+            self._sum += sample - front
+            avg = np.sum(self._window_buffer) / self.cfg.window_len
+            self._processed_buffer = np.roll(self._processed_buffer, -1)
+            self._processed_buffer[-1] = avg
+
+
+def run(strategy_type, sensor, signal, window_len, buffer_len):
+    strategy = strategy_type(strategy_type.__name__)
+    strategy.cfg.window_len = window_len
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    outputs = []
+    for start in range(0, len(signal), buffer_len):
+        out, t = strategy.process_buffer(signal[start:start + buffer_len])
+        outputs.append(np.copy(out))
+    strategy.close()
+    return outputs
+
+
+@pytest.mark.parametrize('strategy_type, loop_type', [(Strategy_Processing.RMS, LoopRMS),
+                                                      (Strategy_Processing.MovingAverage, LoopMovingAverage)])
+@pytest.mark.parametrize('buffer_len', [3, 10, 37])
+def test_matches_sample_loop(sensor, strategy_type, loop_type, buffer_len):
+    # buffers shorter than, equal to and longer than the window
+    signal = np.random.default_rng(1).normal(size=3 * 10 * 37)
+    vectorized = run(strategy_type, sensor, signal, 10, buffer_len)
+    loop = run(loop_type, sensor, signal, 10, buffer_len)
+    assert len(vectorized) == len(loop)
+    for out, expected in zip(vectorized, loop):
+        np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize('strategy_type', [Strategy_Processing.RMS, Strategy_Processing.MovingAverage])
+def test_empty_buffer_is_not_repeated(sensor, strategy_type):
+    strategy = strategy_type(strategy_type.__name__)
+    strategy.cfg.window_len = 4
+    strategy.cfg.ring_buffer_s = 0
+    strategy.open(sensor)
+    strategy.process_buffer(np.ones(8))
+    out, t = strategy.process_buffer(np.empty(0))
+    assert len(out) == 0
+    strategy.close()
+    assert strategy.get_reader().retrieve_buffer(0, 100)[1].size == 8